@@ -0,0 +1,223 @@
+"""
+Generates a synthetic SoSci Survey export for N participants.
+
+The export has the same layout as our real study data
+(estimates/data/raw/survey): `data_survey_start.csv` with the introduction pages
+and the rotations RA01-RA05, `data_lists.csv` with the W1-W9/WS/WR items and
+TIME columns of the lists, and a codebook `values_survey_start.csv` that
+translates the rotation pages into the items of study_setup/data/items_lists.
+
+Every synthetic participant is based on a random participant of the real data
+(demographics, completion state, chosen list), but gets freshly drawn rotations
+and AoA estimates. Participants are written in chunks, so large exports do not
+have to fit into memory at once.
+
+Run in terminal with: $ python3 generate_survey.py --participants 1000 --output <directory>
+"""
+
+import argparse
+import csv
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# real study data and item lists used as templates
+template_directory = '../estimates/data/raw/survey'
+items_lists_directory = '../study_setup/data/items_lists'
+
+# rotation variable -> (list items, repeated items) whose pages it draws
+LIST_ROTATIONS = {
+    'RA02': ('list_A.csv', 'list_A_repeated.csv'),
+    'RA04': ('list_B.csv', 'list_B_repeated.csv'),
+    'RA05': ('list_C.csv', 'list_C_repeated.csv'),
+}
+# rotation of the familiarisation items
+FAM_ROTATION = 'RA03'
+N_CONTROL = 31
+# value labels of the introduction pages (as in the SoSci codebook)
+INTRO_VALUES = {
+    'IN16': {1: 'Prolific', 2: 'SONA', -1: '[NA] nicht beantwortet'},
+    'RA01': {1: 'A', 2: 'B', 3: 'C'},
+    'SD01': {1: 'weiblich', 2: 'männlich', 3: 'divers', -9: 'nicht beantwortet'},
+    'SD07': {1: 'Deutschland', 2: 'Österreich', 3: 'Schweiz', 4: 'anderes Land', -9: 'nicht beantwortet'},
+    'SD19': {1: 'Deutsch', 2: 'andere Sprache', -9: 'nicht beantwortet'},
+    'SD20': {1: 'ja', 2: 'nein', -9: 'nicht beantwortet'},
+    'SD21': {1: 'ja', 2: 'nein', -9: 'nicht beantwortet'},
+    'SD25': {1: 'ja', 2: 'nein', -9: 'nicht beantwortet'},
+    'SD22': {1: 'normal', 2: 'korrigiert', -9: 'nicht beantwortet'},
+    'SD24': {1: 'ja', 2: 'nein', -9: 'nicht beantwortet'},
+}
+# files of the export that are copied over as they are
+INFO_FILES = ['values_lists.csv', 'variables_lists.csv', 'variables_survey_start.csv', 'codebook_lists.xlsx']
+
+
+def rotation_columns(df, rotation):
+    """
+    Returns the page columns of a rotation variable.
+    Input:
+        df: survey dataframe
+        rotation: rotation variable, e.g. 'RA02'
+    Output:
+        columns: list of column names (RA02x01, ..., RA02x99, RA02100, ...; without RA02_CP)
+    """
+    return [x for x in df.columns if x.startswith(rotation) and x != rotation and not x.endswith('CP')]
+
+
+def estimate_columns(df, prefix):
+    """
+    Returns the estimate columns of all items starting with prefix.
+    Input:
+        df: survey dataframe
+        prefix: 'W' for list items, 'WF' for familiarisation items
+    Output:
+        columns: list of column names
+    """
+    return [x for x in df.columns if x.startswith(prefix) and x.endswith('_01')]
+
+
+def create_values(survey_start_df, items_lists_dir):
+    """
+    Creates the codebook of the introduction pages.
+    Input:
+        survey_start_df: template survey data of the introduction pages
+        items_lists_dir: directory with the item lists of the study
+    Output:
+        values_df: dataframe with columns VAR, RESPONSE, MEANING
+    """
+    rows = [(var, code, meaning) for var, values in INTRO_VALUES.items() for code, meaning in values.items()]
+    for rotation, (list_file, rep_file) in LIST_ROTATIONS.items():
+        list_items = np.loadtxt(os.path.join(items_lists_dir, list_file), dtype=int)
+        rep_items = np.loadtxt(os.path.join(items_lists_dir, rep_file), dtype=int)
+        # control items are coded as s1-s31, repeated items with a leading r
+        meanings = ['s'+str(x) for x in range(1, N_CONTROL+1)] + [str(x) for x in list_items] + ['r'+str(x) for x in rep_items]
+        for column in rotation_columns(survey_start_df, rotation):
+            rows += [(column, page, meaning) for page, meaning in enumerate(meanings, start=1)]
+    return pd.DataFrame(rows, columns=['VAR', 'RESPONSE', 'MEANING'])
+
+
+def draw_rotations(rng, chunk_df, rotation):
+    """
+    Draws a fresh order of pages for every participant who got to the rotation.
+    Input:
+        rng: numpy random Generator
+        chunk_df: survey data of the participants (changed in place)
+        rotation: rotation variable, e.g. 'RA02'
+    Output:
+        --
+    """
+    columns = rotation_columns(chunk_df, rotation)
+    drawn = chunk_df[columns[0]].notna().to_numpy()
+    pages = np.tile(np.arange(1, len(columns)+1), (drawn.sum(), 1))
+    chunk_df.loc[drawn, columns] = rng.permuted(pages, axis=1)
+
+
+def draw_estimates(rng, chunk_df, columns, estimate_pool):
+    """
+    Replaces all given answers with estimates drawn from the real answers.
+    Input:
+        rng: numpy random Generator
+        chunk_df: survey data of the participants (changed in place)
+        columns: estimate columns
+        estimate_pool: array of real estimates
+    Output:
+        --
+    """
+    estimates = chunk_df[columns].to_numpy(dtype=float)
+    answered = ~np.isnan(estimates)
+    estimates[answered] = rng.choice(estimate_pool, size=answered.sum())
+    chunk_df[columns] = estimates
+
+
+def generate_chunk(rng, survey_start_df, lists_df, first_case, n_chunk, n_participants, pools):
+    """
+    Generates survey and list data for one chunk of participants.
+    Input:
+        rng: numpy random Generator
+        survey_start_df: template survey data of the introduction pages
+        lists_df: template survey data of the lists
+        first_case: CASE of the first participant of the chunk
+        n_chunk: number of participants in the chunk
+        n_participants: number of participants of the whole export
+        pools: dict of real fam and list estimates
+    Output:
+        chunk_start_df: survey data of the introduction pages
+        chunk_lists_df: survey data of the lists
+    """
+    templates = rng.integers(0, len(survey_start_df), size=n_chunk)
+    chunk_start_df = survey_start_df.iloc[templates].reset_index(drop=True)
+    cases = np.arange(first_case, first_case+n_chunk)
+    chunk_start_df['CASE'] = cases
+    for rotation in list(LIST_ROTATIONS) + [FAM_ROTATION]:
+        draw_rotations(rng, chunk_start_df, rotation)
+    draw_estimates(rng, chunk_start_df, estimate_columns(chunk_start_df, 'WF'), pools['fam'])
+
+    # participants whose template started a list get a list of the same type
+    list_positions = pd.Index(lists_df['REF']).get_indexer(survey_start_df['CASE'].to_numpy()[templates])
+    started = list_positions >= 0
+    questionnaires = lists_df['QUESTNNR'].to_numpy()[list_positions[started]]
+    list_templates = np.empty(started.sum(), dtype=int)
+    for questionnaire in np.unique(questionnaires):
+        candidates = np.flatnonzero(lists_df['QUESTNNR'].to_numpy() == questionnaire)
+        is_questionnaire = questionnaires == questionnaire
+        list_templates[is_questionnaire] = rng.choice(candidates, size=is_questionnaire.sum())
+    chunk_lists_df = lists_df.iloc[list_templates].reset_index(drop=True)
+    chunk_lists_df['CASE'] = n_participants + cases[started]
+    chunk_lists_df['REF'] = cases[started]
+    draw_estimates(rng, chunk_lists_df, estimate_columns(chunk_lists_df, 'W'), pools['list'])
+    return chunk_start_df, chunk_lists_df
+
+
+def generate_survey(n_participants, output_dir, seed=0, chunk_size=5000, template_dir=template_directory, items_lists_dir=items_lists_directory):
+    """
+    Writes a synthetic SoSci Survey export.
+    Input:
+        n_participants: number of participants
+        output_dir: directory the export is written to (must not be the template directory)
+        seed: seed of the random number generator
+        chunk_size: number of participants generated at once
+        template_dir: directory of the real survey export
+        items_lists_dir: directory with the item lists of the study
+    Output:
+        n_lists: number of participants with list data
+    """
+    if os.path.realpath(output_dir) == os.path.realpath(template_dir):
+        raise ValueError('The synthetic export must not overwrite the real survey data.')
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    survey_start_df = pd.read_csv(os.path.join(template_dir, 'data_survey_start.csv'), encoding='latin')
+    lists_df = pd.read_csv(os.path.join(template_dir, 'data_lists.csv'), encoding='latin')
+    pools = {
+        'fam': survey_start_df[estimate_columns(survey_start_df, 'WF')].stack().to_numpy(),
+        'list': lists_df[estimate_columns(lists_df, 'W')].stack().to_numpy(),
+    }
+
+    n_lists = 0
+    for first_case in range(1, n_participants+1, chunk_size):
+        n_chunk = min(chunk_size, n_participants+1-first_case)
+        chunk_start_df, chunk_lists_df = generate_chunk(rng, survey_start_df, lists_df, first_case, n_chunk, n_participants, pools)
+        mode = 'w' if first_case == 1 else 'a'
+        chunk_start_df.to_csv(os.path.join(output_dir, 'data_survey_start.csv'), mode=mode, header=(mode == 'w'), index=False, encoding='latin')
+        chunk_lists_df.to_csv(os.path.join(output_dir, 'data_lists.csv'), mode=mode, header=(mode == 'w'), index=False, encoding='latin')
+        n_lists += len(chunk_lists_df)
+
+    values_df = create_values(survey_start_df, items_lists_dir)
+    values_df.to_csv(os.path.join(output_dir, 'values_survey_start.csv'), index=False, encoding='latin', quoting=csv.QUOTE_NONNUMERIC)
+    for info_file in INFO_FILES:
+        if os.path.exists(os.path.join(template_dir, info_file)):
+            shutil.copy(os.path.join(template_dir, info_file), output_dir)
+    return n_lists
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic SoSci Survey export.')
+    parser.add_argument('--participants', type=int, required=True, help='number of participants')
+    parser.add_argument('--output', required=True, help='directory the export is written to')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator (default: 0)')
+    args = parser.parse_args()
+
+    print(f'>> Generate survey data of {args.participants} participants...')
+    n_lists = generate_survey(args.participants, args.output, seed=args.seed)
+    print(f'{n_lists} participants started a list.')
+    print('Done.')
@@ -0,0 +1,194 @@
+"""
+End-to-end benchmark of the pipeline scripts on synthetic survey exports.
+
+For every number of participants, a synthetic export is generated (see
+`generate_survey.py`) inside a copy of the repository and data_wrangling
+(estimates/src/data_wrangling.py) is run on it. The stages that do not read
+the survey export, and so do not depend on the number of participants, are
+run only once:
+- fill_in: estimates/src/fill_in_info_for_duplicates.py
+- items_lists: study_setup/src/items_lists.py
+Every stage runs in a process of its own. Wall time, CPU time (including
+worker processes) and peak memory of every stage are printed and saved as json
+file, together with the measurements per step of the script (its --report, see
+`utils/instrumentation.py`). Stages whose input files are missing (e.g.
+external corpora that were not downloaded) are skipped.
+
+With --baseline, the results are compared with an earlier run; the script
+exits with an error if a stage got slower or needs more memory than the
+tolerance allows.
+
+Run in terminal with: $ python3 run_benchmarks.py [--sizes 100 1000 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_survey import generate_survey
+
+repository_directory = os.path.abspath('..')
+runner_path = os.path.abspath('stage_runner.py')
+
+# stage -> (script directory, script, input files relative to the repository,
+#           whether it reads the survey export, i.e. is run for every number of participants)
+STAGES = {
+    'data_wrangling': ('estimates/src', 'data_wrangling.py', [], True),
+    'fill_in': ('estimates/src', 'fill_in_info_for_duplicates.py', ['estimates/data/aoa_estimates_unique.csv'], False),
+    'items_lists': ('study_setup/src', 'items_lists.py', ['external_resources/norms/Birchenough_2017.csv',
+                                                          'external_resources/frequencies/SUBTLEX-DE_cleaned_with_Google00.txt'], False),
+}
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+# measurements compared with the baseline
+COMPARED = ['wall_time', 'peak_rss_mb']
+
+
+def create_sandbox(sandbox_dir):
+    """
+    Copies the parts of the repository the pipeline scripts need.
+    The external resources are only linked, as they are read but never written.
+    Input:
+        sandbox_dir: directory of the copy
+    Output:
+        --
+    """
+    ignore = shutil.ignore_patterns('.spreadsheet_cache', '__pycache__', 'raw')
+    for directory in ['estimates', 'study_setup', 'utils']:
+        shutil.copytree(os.path.join(repository_directory, directory), os.path.join(sandbox_dir, directory), ignore=ignore)
+    os.symlink(os.path.join(repository_directory, 'external_resources'), os.path.join(sandbox_dir, 'external_resources'))
+    os.makedirs(os.path.join(sandbox_dir, 'estimates/data/raw/derivatives'))
+
+
+def run_stage(sandbox_dir, stage, stage_args):
+    """
+    Runs one stage in a process of its own.
+    Input:
+        sandbox_dir: directory of the repository copy
+        stage: key of STAGES
+        stage_args: further command line arguments of the script
+    Output:
+        result: dict with status, wall_time, cpu_time, peak_rss_mb, peak_rss_children_mb
+                and steps (the measurements per step of the script's run report)
+    """
+    script_dir, script, inputs, _ = STAGES[stage]
+    missing = [x for x in inputs if not os.path.exists(os.path.join(sandbox_dir, x))]
+    if missing:
+        return {'status': 'skipped (missing '+', '.join(missing)+')'}
+    report_path = os.path.join(sandbox_dir, stage+'_report.json')
+    run_report_path = os.path.join(sandbox_dir, stage+'_run_report.json')
+    for path in [report_path, run_report_path]:
+        if os.path.exists(path):
+            os.remove(path)
+    process = subprocess.run([sys.executable, runner_path, report_path, script] + stage_args + ['--report', run_report_path],
+                             cwd=os.path.join(sandbox_dir, script_dir), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        # a killed or silently exiting stage leaves no message
+        lines = process.stderr.strip().splitlines()
+        return {'status': f'failed (return code {process.returncode})' + (': '+lines[-1] if lines else '')}
+    with open(report_path) as f:
+        result = json.load(f)
+    with open(run_report_path) as f:
+        result['steps'] = json.load(f)['stages']
+    result['status'] = 'ok'
+    return result
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Finds stages that got slower or need more memory than in an earlier run.
+    Input:
+        results: list of result dicts of this run
+        baseline: list of result dicts of the earlier run
+        tolerance: allowed ratio between this and the earlier run (e.g. 1.25)
+    Output:
+        regressions: list of messages
+    """
+    earlier = {(x['participants'], x['stage']): x for x in baseline if x['status'] == 'ok'}
+    regressions = []
+    for result in results:
+        key = (result['participants'], result['stage'])
+        if result['status'] != 'ok' or key not in earlier:
+            continue
+        for measure in COMPARED:
+            ratio = result[measure] / max(earlier[key][measure], 1e-9)
+            if ratio > tolerance:
+                participants = 'once' if result['participants'] is None else f'{result["participants"]} participants'
+                regressions.append(f'{result["stage"]} ({participants}): {measure} '
+                                   f'{earlier[key][measure]:.2f} -> {result[measure]:.2f} (x{ratio:.2f})')
+    return regressions
+
+
+def print_results(results):
+    """
+    Prints the results as table.
+    Input:
+        results: list of result dicts
+    Output:
+        --
+    """
+    print(f'{"participants":>12}  {"stage":<30} {"wall [s]":>9} {"cpu [s]":>9} {"peak RSS [MB]":>14}  status')
+    for result in results:
+        # stages that do not depend on the number of participants
+        participants = '-' if result['participants'] is None else result['participants']
+        if result['status'] == 'ok':
+            print(f'{participants:>12}  {result["stage"]:<30} {result["wall_time"]:>9.2f} {result["cpu_time"]:>9.2f} '
+                  f'{result["peak_rss_mb"]:>14.1f}  ok')
+            for step in result.get('steps', []):
+                print(f'{"":>12}    {step["stage"][:28]:<28} {step["wall_time"]:>9.2f} {step["cpu_time"]:>9.2f} {step["peak_rss_mb"]:>14.1f}')
+        else:
+            print(f'{participants:>12}  {result["stage"]:<30} {"":>9} {"":>9} {"":>14}  {result["status"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline scripts on synthetic survey exports.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of participants (default: 100 1000 10000 100000)')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help='stages to run (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes of data_wrangling.py (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the survey generator (default: 0)')
+    parser.add_argument('--output', default='results/benchmark_results.json', help='json file the results are saved to')
+    parser.add_argument('--baseline', help='json file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed slowdown/memory growth compared with the baseline (default: 1.25)')
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        # items_lists.py does not overwrite existing lists, so new lists go to a directory of their own
+        stage_args = {'data_wrangling': ['--workers', str(args.workers)],
+                      'items_lists': ['--output', os.path.join(sandbox_dir, 'items_lists_output')]}
+        print('>> Copy repository...')
+        create_sandbox(sandbox_dir)
+        print('Done.')
+        for stage in [x for x in args.stages if not STAGES[x][3]]:
+            print(f'... run {stage} (independent of the number of participants)')
+            result = run_stage(sandbox_dir, stage, stage_args.get(stage, []))
+            results.append(dict(participants=None, stage=stage, **result))
+        for n_participants in args.sizes:
+            print(f'>> Generate survey data of {n_participants} participants...')
+            start = time.perf_counter()
+            generate_survey(n_participants, os.path.join(sandbox_dir, 'estimates/data/raw/survey'), seed=args.seed)
+            print(f'Done ({time.perf_counter()-start:.1f} s).')
+            for stage in [x for x in args.stages if STAGES[x][3]]:
+                print(f'... run {stage}')
+                result = run_stage(sandbox_dir, stage, stage_args.get(stage, []))
+                results.append(dict(participants=n_participants, stage=stage, **result))
+
+    print()
+    print_results(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+    print(f'\nResults saved to {args.output}.')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION:', regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions compared with the baseline.')
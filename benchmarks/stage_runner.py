@@ -0,0 +1,59 @@
+"""
+Runs one pipeline script and records its resource usage (used by `run_benchmarks.py`).
+
+Run in terminal with: $ python3 stage_runner.py <report.json> <script.py> [script arguments]
+(from the directory of the script, as the scripts use relative paths)
+"""
+
+import json
+import os
+import resource
+import runpy
+import sys
+import time
+
+
+def get_cpu_time():
+    """
+    Returns the CPU time used by this process and its finished child processes
+    (e.g. the worker processes of data_wrangling.py --workers N).
+    Input:
+        --
+    Output:
+        cpu_time: user + system time in seconds
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb(who):
+    """
+    Returns the peak resident set size in MB.
+    Input:
+        who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    Output:
+        peak: peak RSS in MB
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / 1024**2
+    return peak / 1024
+
+
+if __name__ == '__main__':
+    report_path, script = sys.argv[1], sys.argv[2]
+    sys.argv = [script] + sys.argv[3:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+
+    wall_start, cpu_start = time.perf_counter(), get_cpu_time()
+    runpy.run_path(script, run_name='__main__')
+    report = {
+        'wall_time': time.perf_counter() - wall_start,
+        'cpu_time': get_cpu_time() - cpu_start,
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        # largest worker process (e.g. data_wrangling.py --workers N)
+        'peak_rss_children_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f)
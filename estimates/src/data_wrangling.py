@@ -1,15 +1,37 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+import argparse
+from functools import partial
+import reshaping
+import metadata_decoding
+import incremental
+import item_schema
+sys.path.append('../../utils')
+from spreadsheet_cache import read_spreadsheet
+import instrumentation
+
+# COMMAND LINE OPTIONS
+parser = argparse.ArgumentParser(description='Brings the downloaded survey data into an item-based database format.')
+parser.add_argument('--incremental', action='store_true', 
+                    help='only reshape participants that are new or changed since the last run')
+parser.add_argument('--workers', type=int, default=1, 
+                    help='number of worker processes for reshaping (default: 1)')
+instrumentation.add_arguments(parser)
+args = parser.parse_args()
+run = instrumentation.start_run('data_wrangling', args)
 
 # LOAD IN DATA
 print('>> Load data...')
+instrumentation.start_stage(run, 'load data')
 # ratings etc from survey
 survey_start_df = pd.read_csv('../data/raw/survey/data_survey_start.csv', encoding='latin')
 lists_df = pd.read_csv('../data/raw/survey/data_lists.csv', encoding='latin')
 # MultiPic + familiarisation item information
-example_multipic_df = pd.read_excel('../../study_setup/data/example_sentences.ods', sheet_name='MultiPic')
-example_fam_df = pd.read_excel('../../study_setup/data/example_sentences.ods', sheet_name='Familiarisation')
+# (parsed once, later served from the spreadsheet cache)
+example_multipic_df = read_spreadsheet('../../study_setup/data/example_sentences.ods', engine='odf', sheet_name='MultiPic')
+example_fam_df = read_spreadsheet('../../study_setup/data/example_sentences.ods', engine='odf', sheet_name='Familiarisation')
 survey_values_df = pd.read_csv('../data/raw/survey/values_survey_start.csv', encoding='latin')
 # list information
 list_a = np.loadtxt('../../study_setup/data/items_lists/list_A.csv', dtype=int)
@@ -19,6 +41,12 @@ list_b_repeated = np.loadtxt('../../study_setup/data/items_lists/list_B_repeated
 list_c = np.loadtxt('../../study_setup/data/items_lists/list_C.csv', dtype=int)
 list_c_repeated = np.loadtxt('../../study_setup/data/items_lists/list_C_repeated.csv', dtype=int)
 list_control = np.loadtxt('../../study_setup/data/items_lists/control_items.csv', dtype=int)
+# indexes for constant time lookups (used by the reshaping engine):
+# CASE -> row position, REF -> row position, (VAR, RESPONSE) -> MEANING
+indexes = reshaping.create_indexes(survey_start_df, lists_df, survey_values_df)
+ref_index = indexes['ref']
+values_index = indexes['values']
+instrumentation.end_stage(run, rows_out=len(survey_start_df)+len(lists_df))
 print('Done.')
 
 # HELPER FUNCTIONS FOR INFORMATION RETRIEVAL
@@ -37,113 +65,6 @@ def create_lookup_df(item_list, column_list):
     lookup_df['variable_name'] = column_list
     return lookup_df
 
-def get_order_dict(id, rotation_info):
-    """
-    Finds out the order items were presented to a participant.
-    Note: count starts at 1.
-    Input: 
-        id: participant ID
-        rotation_info: a, b, or c rotation
-    Output: 
-        dictionaries of the form {page_number: order of appearance}
-        fam_order: order of appearance of familiarisation items
-        list_order: order of appearance of list items
-    """
-    # first familiarisation items
-    fam_order = dict()
-    for count, rotation_column in enumerate(fam_rotation, start=1):
-        item_number = int(survey_start_df.loc[survey_start_df['CASE'] == id, rotation_column])
-        item_idx = survey_start_df.loc[survey_start_df['CASE'] == id, rotation_column] 
-        fam_order[item_number] = count
-    # then list specific rotation (a/b/c)
-    list_order = dict()
-    for count, rotation_column in enumerate(rotation_info, start=11):
-        page_number = int(survey_start_df.loc[survey_start_df['CASE'] == id, rotation_column])
-        item_idx = survey_values_df.loc[(survey_values_df['VAR'] == rotation_column) & (survey_values_df['RESPONSE'] == page_number)].index[0] 
-        item_number = survey_values_df.loc[item_idx, 'MEANING'].strip()
-        if item_number.startswith('s'):
-            shared_idx = int(item_number.replace('s',''))-1
-            item_number = str(list_control[shared_idx])
-        list_order[item_number] = count
-    return fam_order, list_order
-
-def get_rating(df, idx, item_column):
-    """
-    Function that returns the AoA rating of a specific item.
-    Input:
-        df: dataframe the rating is stored in
-        idx: global df index of the participant
-        item_column: an item's survey variable 
-    Output:
-        rating: an item's AoA rating (as int)
-    """
-    rating = df.loc[idx, item_column]
-    if not pd.isna(rating):
-        rating = int(rating)
-    return rating
-
-def get_fam_word(item_column):
-    """
-    Retrieves the presented familiarisation word item and its example sentence.
-    Input:
-        fam_item_number: number of the familiarisation item page
-    Output:
-        fam_page_number: page number item appeared on, for easier lookup of order of presentation
-        fam_word: familiarisation word corresponding to the item in question
-        fam_sentence: example sentence presented with familiarisation item
-        fam_time_column: variable name of the time column for that familiarisation item
-    """
-    item_idx = example_fam_df.loc[example_fam_df['variable_name'] == item_column].index[0]
-    fam_page_number = item_idx+1
-    fam_word = example_fam_df.loc[item_idx, 'NAME']
-    fam_sentence = example_fam_df.loc[item_idx, 'EXAMPLE']
-    fam_time_column = example_fam_df.loc[item_idx, 'time_name']
-    return fam_page_number, fam_word, fam_sentence, fam_time_column
-
-def get_list_word(lookup_df, item_column):
-    """
-    Retrieves the presented word item, its example sentence and the corresponding 
-    MultiPic item number based on the survey variable.
-    Input:
-        lookup_df: the reference lookup dataframe to use
-        item_column: an item's survey variable
-    Output:
-        item_number: item number corresponding to the item in question
-        item_word: item word corresponding to the item in question
-        item_sentence: example sentence presented with the item
-        item_time_column: variable name of the time column for that item
-    """
-    item_idx = lookup_df.loc[lookup_df['variable_name'] == item_column].index[0]
-    item_number = lookup_df.loc[item_idx, 'ITEM']
-    item_word = lookup_df.loc[item_idx, 'NAME1']
-    item_sentence = lookup_df.loc[item_idx, 'EXAMPLE']
-    item_time_column = lookup_df.loc[item_idx, 'time_name']
-    return item_number, item_word, item_sentence, item_time_column
-
-def create_normal_item_dict(lookup_df, item_column, list_order, list_idx):
-    """
-    Collects all item relevant information in a dictionary.
-    Input: 
-        lookup_df: the reference lookup dataframe to use
-        item_column: an item's survey variable
-        list_order: dictionary of containing order of appearance of list items
-        list_idx: participant datapoint index in lists_df
-    Output:
-        item_dict: dictionary containing all item-specific information
-    """
-    item_dict = dict()
-    item_number, item_word, item_sentence, item_time_column = get_list_word(lookup_df, item_column)
-    item_estimate = get_rating(lists_df, list_idx, item_column)        
-    # collect item information in dict
-    item_dict['item'] = item_word
-    item_dict['item_number'] = item_number
-    item_dict['estimate'] = item_estimate
-    item_dict['example_sentence'] = item_sentence
-    item_dict['repetition'] = 0
-    item_dict['order'] = list_order[str(item_number)]
-    item_dict['time'] = lists_df.loc[list_idx, item_time_column]
-    return item_dict
-
 # DEFINE COLUMNS FOR ITEM-BASED DATASET
 columns = [
     'ID', # participant ID
@@ -176,162 +97,13 @@ columns = [
 
 # INFORMATION PREPARATIONS
 print('>> Prepare information for easier lookup...')
-# create dict for information that stay the same
-# dict structure: {ID 1: {information}, ID 2: {information}, ...}
-# 'platform': where was participant recruited? SONA or Prolific
-# 'list': which list did they fill out?
-# 'gender': participant's gender
-# 'age': participant's age
-# 'country': participant's country of residence
-# 'education': participant's highest level of formal education
-# 'L1': participant's first language
-# 'monoling': monolingual upbringing until age 6?
-# 'lang_dis': language disorder?
-# 'read_dis': reading disorder?
-# 'sight': eyesight: normal or corrected?
-# 'children': does participant have children?
-# 'child_age': what age do the children have?
-# 'time_sum': total time taken (without outliers)
-# 'finished': survey complete (1) or incomplete (0)
-# 'violation': is one of our criterions violated?
-meta_info = dict()
-
-for i in survey_start_df.index:
-    finished = 1
-    violation = 0
-    # anonymised ID
-    id = survey_start_df.loc[i, 'CASE']
-    # platform
-    if survey_start_df.loc[i, 'IN16'] == 1:
-        platform = 'Prolific'
-    elif survey_start_df.loc[i, 'IN16'] == 2:
-        platform = 'SONA'
-    elif survey_start_df.loc[i, 'IN16'] == -1:
-        platform = 'other'
-    # list
-    if survey_start_df.loc[i, 'RA01'] == 1:
-        list_id = 'A'
-    elif survey_start_df.loc[i, 'RA01'] == 2:
-        list_id = 'B'
-    elif survey_start_df.loc[i, 'RA01'] == 3:
-        list_id = 'C'
-    else:
-        list_id = np.nan
-        finished = 0
-        violation = 1
-    # gender
-    if survey_start_df.loc[i, 'SD01'] == 1:
-        gender = 'female'
-    elif survey_start_df.loc[i, 'SD01'] == 2:
-        gender = 'male'
-    elif survey_start_df.loc[i, 'SD01'] == 3:
-        gender = 'diverse'
-    else: 
-        gender = np.nan
-        violation = 1
-    # age 
-    age = survey_start_df.loc[i, 'SD02_01']
-    # country
-    if survey_start_df.loc[i, 'SD07'] == 1:
-        country = 'Germany'
-    elif survey_start_df.loc[i, 'SD07'] == 2:
-        country = 'Austria'
-        violation = 1
-    elif survey_start_df.loc[i, 'SD07'] == 3:
-        country = 'Switzerland'
-        violation = 1
-    elif survey_start_df.loc[i, 'SD07'] == 4:
-        country = 'other'
-        violation = 1
-    else: 
-        country = np.nan
-        violation = 1
-    # education
-    # for clarification of values see codebook or values csv
-    education = survey_start_df.loc[i, 'SD10']
-    # L1
-    if survey_start_df.loc[i, 'SD19'] == 1:
-        l1 = 1
-    elif survey_start_df.loc[i, 'SD19'] == 2:
-        l1 = 0
-        violation = 1
-    else: 
-        l1 = np.nan
-        violation = 1
-    # monoling
-    if survey_start_df.loc[i, 'SD20'] == 1:
-        monoling = 0
-        violation = 1
-    elif survey_start_df.loc[i, 'SD20'] == 2:
-        monoling = 1
-    else: 
-        monoling = np.nan
-        violation = 1
-    # lang_dis
-    if survey_start_df.loc[i, 'SD21'] == 1:
-        lang_dis = 1
-        violation = 1
-    elif survey_start_df.loc[i, 'SD21'] == 2:
-        lang_dis = 0
-    else: 
-        lang_dis = np.nan
-        violation = 1
-    # read_dis
-    if survey_start_df.loc[i, 'SD25'] == 1:
-        read_dis = 1
-        violation = 1
-    elif survey_start_df.loc[i, 'SD25'] == 2:
-        read_dis = 0
-    else: 
-        read_dis = np.nan
-        violation = 1
-    # sight
-    if survey_start_df.loc[i, 'SD22'] == 1:
-        sight = 'normal'
-    elif survey_start_df.loc[i, 'SD22'] == 2:
-        sight = 'corrected'
-    else: 
-        sight = np.nan
-    # children
-    if survey_start_df.loc[i, 'SD24'] == 1:
-        children = 1
-    elif survey_start_df.loc[i, 'SD24'] == 2:
-        children = 0
-    else: 
-        children = np.nan
-    # child_age
-    child_age = []
-    if children:
-        # find out how many kids; append age of each kid to list
-        for kid in range(1,int(survey_start_df.loc[i,'SD23'])+1):
-            child_age.append(survey_start_df.loc[i, 'SD23x0'+str(kid)])
-    # time_sum
-    if id in set(lists_df['REF']):
-        time_sum = int(survey_start_df.loc[i,'TIME_SUM']) + int(lists_df[lists_df['REF'] == id]['TIME_SUM'])
-    else:
-        time_sum = int(survey_start_df.loc[i,'TIME_SUM'])
-        finished = 0
-        violation = 1
-
-    # create dict entry
-    meta_info[id] = {
-        'platform': platform,
-        'list': list_id,
-        'gender': gender,
-        'age': age,
-        'country': country,
-        'education': education,
-        'L1': l1,
-        'monoling': monoling,
-        'lang_dis': lang_dis,
-        'read_dis': read_dis,
-        'sight': sight,
-        'children': children,
-        'child_age': child_age,
-        'time_sum': time_sum,
-        'finished': finished,
-        'violation': violation,
-    }
+instrumentation.start_stage(run, 'prepare lookups', rows_in=len(survey_start_df))
+# decode information that stays the same for all items
+# (platform, list, gender, age, country, education, L1, monoling, lang_dis, read_dis, 
+# sight, children, child_age, time_sum, finished, violation), see metadata_rules.csv
+rules_df = metadata_decoding.load_rules('metadata_rules.csv')
+metadata_decoding.check_rules(rules_df, values_index)
+meta_df = metadata_decoding.decode_metadata(survey_start_df, lists_df, rules_df, ref_index)
 
 # filter relevant column names
 survey_columns = list(survey_start_df.columns)
@@ -384,115 +156,49 @@ for df in [b_lookup_df, c_lookup_df]:
 # also add variable column name information to familiarisation items df 
 example_fam_df['variable_name'] = fam_columns
 example_fam_df['time_name'] = fam_time_columns
-
+instrumentation.end_stage(run, rows_out=len(meta_df))
 print('Done.')
 ###################################################################################################
 
 # CREATE ITEM-BASED DATASET
 print('>> Create item-based dataset...')
-data_df = pd.DataFrame(columns=columns)
-
-# iterate through participants, add all information to big df
-for id in meta_info.keys(): 
-    print('... ID', id)
-    participant_df = pd.DataFrame(columns=columns)
-
-    # get list ID (A/B/C)
-    list_id = meta_info[id]['list']
-    if list_id == 'A':
-        rotation = a_rotation
-        lookup_df = a_lookup_df
-        rep_lookup_df = a_rep_lookup_df
-        item_columns = a_columns
-        item_rep_columns = a_rep_columns
-    elif list_id == 'B':
-        rotation = b_rotation
-        lookup_df = b_lookup_df
-        rep_lookup_df = b_rep_lookup_df
-        item_columns = b_columns
-        item_rep_columns = b_rep_columns
-    elif list_id == 'C':
-        rotation = c_rotation
-        lookup_df = c_lookup_df
-        rep_lookup_df = c_rep_lookup_df
-        item_columns = c_columns
-        item_rep_columns = c_rep_columns
-    else:
-        # if the participant did not get to being assigned a list, 
-        # skip participant
-        continue
-    
-    # get idx
-    survey_idx = survey_start_df.loc[survey_start_df['CASE'] == id].index[0]
-    list_idx = lists_df.loc[lists_df['REF'] == id].index[0]
-    # get order
-    fam_order, list_order = get_order_dict(id, rotation)
-
-    # fam items
-    for fam_item in fam_columns:
-        item_dict = dict()
-        fam_page_number, fam_word, fam_sentence, fam_time_column = get_fam_word(fam_item)
-        fam_estimate = get_rating(survey_start_df, survey_idx, fam_item)
-        # collect item information in dict
-        item_dict['item'] = fam_word
-        item_dict['estimate'] = fam_estimate
-        item_dict['example_sentence'] = fam_sentence
-        item_dict['repetition'] = 0
-        item_dict['order'] = fam_order[fam_page_number]
-        item_dict['time'] = survey_start_df.loc[survey_idx, fam_time_column]
-        # append row to intermediate dataframe
-        participant_df = pd.concat([participant_df, pd.DataFrame(item_dict, index=[0])], ignore_index=True) 
-
-    # list + shared/control items
-    for item in item_columns:
-        item_dict = create_normal_item_dict(lookup_df, item, list_order, list_idx)
-        # append row to intermediate dataframe
-        participant_df = pd.concat([participant_df, pd.DataFrame(item_dict, index=[0])], ignore_index=True) 
-    for item in control_columns:
-        item_dict = create_normal_item_dict(control_lookup_df, item, list_order, list_idx)
-        participant_df = pd.concat([participant_df, pd.DataFrame(item_dict, index=[0])], ignore_index=True) 
-        
-    # repeated items 
-    for item in item_rep_columns:
-        item_dict = dict()
-        item_number, item_word, item_sentence, item_time_column = get_list_word(rep_lookup_df, item)
-        item_estimate = get_rating(lists_df, list_idx, item)        
-        # collect item information in dict
-        item_dict['item'] = item_word
-        item_dict['item_number'] = item_number
-        item_dict['estimate'] = item_estimate
-        item_dict['example_sentence'] = item_sentence
-        item_dict['repetition'] = 1
-        item_dict['order'] = list_order['r'+str(item_number)]
-        item_dict['time'] = lists_df.loc[list_idx, item_time_column]
-        # append row to intermediate dataframe
-        participant_df = pd.concat([participant_df, pd.DataFrame(item_dict, index=[0])], ignore_index=True)
-
-    # insert participant informatino that is same for all items
-    participant_df['ID'] = id
-    participant_df['platform'] = meta_info[id]['platform']
-    participant_df['list'] = list_id
-    participant_df['gender'] = meta_info[id]['gender']
-    participant_df['age'] = meta_info[id]['age']
-    participant_df['country'] = meta_info[id]['country']
-    participant_df['education'] = meta_info[id]['education']
-    participant_df['L1'] = meta_info[id]['L1']
-    participant_df['monoling'] = meta_info[id]['monoling']
-    participant_df['lang_dis'] = meta_info[id]['lang_dis']
-    participant_df['read_dis'] = meta_info[id]['read_dis']
-    participant_df['sight'] = meta_info[id]['sight']
-    participant_df['children'] = meta_info[id]['children']
-    participant_df['child_age'] = str(meta_info[id]['child_age'])
-    participant_df['time_sum'] = meta_info[id]['time_sum']
-    participant_df['finished'] = meta_info[id]['finished']
-    participant_df['violation'] = meta_info[id]['violation']
-
-    # append participant_df to overall data dataframe
-    data_df = pd.concat([data_df, participant_df], ignore_index=True)
+instrumentation.start_stage(run, 'create item-based dataset', rows_in=len(survey_start_df))
+# lookup information per list (A/B/C)
+list_designs = {
+    'A': {'rotation': a_rotation, 'lookup_df': a_lookup_df, 'control_lookup_df': control_lookup_df, 'rep_lookup_df': a_rep_lookup_df},
+    'B': {'rotation': b_rotation, 'lookup_df': b_lookup_df, 'control_lookup_df': control_lookup_df, 'rep_lookup_df': b_rep_lookup_df},
+    'C': {'rotation': c_rotation, 'lookup_df': c_lookup_df, 'control_lookup_df': control_lookup_df, 'rep_lookup_df': c_rep_lookup_df},
+}
+
+reshape = partial(reshaping.reshape_to_item_based, lists_df=lists_df, meta_df=meta_df, list_designs=list_designs, 
+                  indexes=indexes, example_fam_df=example_fam_df, fam_rotation=fam_rotation, 
+                  list_control=list_control, columns=columns, workers=args.workers)
+
+# keep track of processed participants
+save_directory = '../data/raw/derivatives'
+data_path = save_directory+'/item_based_data.csv'
+manifest_path = save_directory+'/item_based_data_manifest.csv'
+hashes_df = incremental.hash_participants(survey_start_df, lists_df, ref_index)
+design_frames = [example_fam_df, rules_df, survey_values_df] + [df for design in list_designs.values() for df in design.values() if isinstance(df, pd.DataFrame)]
+design_hash = incremental.hash_design(design_frames, columns)
+
+if args.incremental:
+    # only reshape new or changed participants
+    data_df, manifest_df = incremental.update_item_based_data(data_path, manifest_path, survey_start_df, 
+                                                              hashes_df, design_hash, reshape)
+else:
+    # melt all participants at once, list by list
+    data_df = reshape(survey_start_df)
+    manifest_df = hashes_df.assign(design_hash=design_hash)
+instrumentation.end_stage(run, rows_out=len(data_df))
+print('Done.')
 
 # SAVE ITEM-BASED DATASET
 print('... save item-based dataset...')
-save_directory = '../data/raw/derivatives'
+instrumentation.start_stage(run, 'save item-based dataset', rows_in=len(data_df))
 os.makedirs(save_directory, exist_ok=True)
-data_df.to_csv(save_directory+'/item_based_data.csv', index=False)
-print('All done!')
\ No newline at end of file
+item_schema.write_item_based_data(data_df, data_path)
+manifest_df.to_csv(manifest_path, index=False)
+instrumentation.end_stage(run, rows_out=len(data_df))
+instrumentation.save_report(run)
+print('All done!')
@@ -0,0 +1,286 @@
+"""
+Participant exclusion and data cleaning (Python version of the cleaning in
+AoA_estimates_for_MultiPic.Rmd and the correlation functions of helper_functions.R).
+
+Three correlations are calculated per participant:
+- Kuperman (2012) procedure: ratings of the shared/control items vs. the
+  Birchenough et al. (2017) norms of these items,
+- Birchenough (2017) procedure: ratings of the shared/control items vs. the
+  group mean of these items,
+- internal reliability: first vs. second rating of the repeated items.
+Participants with a correlation below the threshold (0.3 in the final cleaning,
+0.4 in the original procedures) in any of them are excluded.
+
+All participants are handled at once: the pairs of ratings are matched per
+item, and the correlations are computed from per-participant sums of centered
+values (np.bincount), so there is no loop over participants.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from group_estimates import get_estimates_overview
+
+# participant who disqualified (manual check)
+DISQUALIFIED_IDS = [457]
+# estimates above this age are typos or otherwise implausible
+MAX_ESTIMATE = 20
+# thresholds of the correlations
+WEAK_THRESHOLD = 0.4
+EXCLUSION_THRESHOLD = 0.3
+# single ratings outside mean +- SD_RANGE * sd of the item are outliers
+SD_RANGE = 2.5
+
+
+def load_item_sets(items_lists_dir='../../study_setup/data/items_lists'):
+    """
+    Loads the item numbers of the shared/control and the repeated items.
+    Input:
+        items_lists_dir: directory with the item lists of the study
+    Output:
+        shared_items: array of item numbers of the shared/control items
+        repeated_items: array of item numbers of the repeated items (all lists)
+    """
+    shared_items = np.loadtxt(os.path.join(items_lists_dir, 'control_items.csv'), dtype=int)
+    repeated_items = np.concatenate([np.loadtxt(os.path.join(items_lists_dir, f'list_{x}_repeated.csv'), dtype=int) for x in 'ABC'])
+    return shared_items, repeated_items
+
+
+def correlate_by_group(codes, x, y, n_groups):
+    """
+    Calculates the Pearson correlation of x and y for every group at once.
+    Input:
+        codes: group code (0 ... n_groups-1) of every pair
+        x, y: arrays of paired values
+        n_groups: number of groups
+    Output:
+        corr: array of correlations per group (NaN for fewer than 2 pairs or no variance, as R's cor)
+    """
+    n = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.bincount(codes, weights=x, minlength=n_groups) / n
+        mean_y = np.bincount(codes, weights=y, minlength=n_groups) / n
+        dx = x - mean_x[codes]
+        dy = y - mean_y[codes]
+        sxy = np.bincount(codes, weights=dx*dy, minlength=n_groups)
+        sxx = np.bincount(codes, weights=dx*dx, minlength=n_groups)
+        syy = np.bincount(codes, weights=dy*dy, minlength=n_groups)
+        corr = sxy / np.sqrt(sxx*syy)
+    corr[(n < 2) | (sxx == 0) | (syy == 0)] = np.nan
+    return corr
+
+
+def create_corr_df(ids, codes, x, y, threshold):
+    """
+    Collects the correlations of all participants.
+    Input:
+        ids: participant IDs (in order of appearance)
+        codes: position in ids of every pair
+        x, y: arrays of paired values
+        threshold: correlations below this value are weak
+    Output:
+        corr_df: dataframe with columns ID, corr
+        weak_corr_ids: IDs of participants with weak correlations
+    """
+    corr_df = pd.DataFrame({'ID': ids, 'corr': correlate_by_group(codes, x, y, len(ids))})
+    weak_corr_ids = corr_df.loc[corr_df['corr'] < threshold, 'ID'].to_numpy()
+    return corr_df, weak_corr_ids
+
+
+def get_rating_arrays(data_df):
+    """
+    Extracts the columns needed for the correlations as numpy arrays (once for
+    all three procedures).
+    Input:
+        data_df: item-based dataframe
+    Output:
+        ratings: dict with
+            ids: array of unique participant IDs (in order of appearance)
+            id_codes: position in ids for every row
+            item_numbers, repetitions, estimates, norms: float arrays (missing values are NaN;
+                                                         norms only with 'B: AoA mean' column)
+    """
+    id_codes, ids = pd.factorize(data_df['ID'])
+    ratings = {
+        'ids': np.asarray(ids),
+        'id_codes': id_codes,
+        'item_numbers': data_df['item_number'].to_numpy(dtype=float, na_value=np.nan),
+        'repetitions': data_df['repetition'].to_numpy(dtype=float, na_value=np.nan),
+        'estimates': data_df['estimate'].to_numpy(dtype=float, na_value=np.nan),
+    }
+    if 'B: AoA mean' in data_df.columns:
+        ratings['norms'] = data_df['B: AoA mean'].to_numpy(dtype=float, na_value=np.nan)
+    return ratings
+
+
+def in_item_set(item_numbers, items):
+    """
+    Checks which ratings belong to a set of items (lookup table instead of
+    np.isin, as item numbers are small whole numbers).
+    Input:
+        item_numbers: float array of item numbers (NaN for familiarisation items)
+        items: item numbers of the set
+    Output:
+        in_set: boolean array
+    """
+    items = np.asarray(items, dtype=int)
+    is_item = np.zeros(max(int(np.nanmax(item_numbers, initial=0)), items.max(initial=0))+2, dtype=bool)
+    is_item[items] = True
+    # NaN is looked up in the last (empty) position
+    return is_item[np.where(np.isnan(item_numbers), -1, item_numbers).astype(int)]
+
+
+def kuperman_correlations(data_df, shared_items, threshold=WEAK_THRESHOLD, ratings=None):
+    """
+    Correlates every participant's ratings of the shared items with the
+    Birchenough et al. (2017) norms of these items.
+    Input:
+        data_df: item-based dataframe with 'B: AoA mean' column (see merge_database_infos.Rmd)
+        shared_items: item numbers of the shared/control items
+        threshold: correlations below this value are weak
+        ratings: arrays of data_df (see `get_rating_arrays`), extracted if not given
+    Output:
+        corr_df: dataframe with columns ID, corr
+        weak_corr_ids: IDs of participants with weak correlations
+    """
+    if ratings is None:
+        ratings = get_rating_arrays(data_df)
+    ids, id_codes, item_numbers, estimates = ratings['ids'], ratings['id_codes'], ratings['item_numbers'], ratings['estimates']
+    norms = ratings['norms']
+    shared = in_item_set(item_numbers, shared_items) & ~np.isnan(norms)
+    return create_corr_df(ids, id_codes[shared], estimates[shared], norms[shared], threshold)
+
+
+def birchenough_correlations(data_df, shared_items, threshold=WEAK_THRESHOLD, ratings=None):
+    """
+    Correlates every participant's ratings of the shared items with the group
+    mean ratings of these items.
+    Input:
+        data_df: item-based dataframe
+        shared_items: item numbers of the shared/control items
+        threshold: correlations below this value are weak
+        ratings: arrays of data_df (see `get_rating_arrays`), extracted if not given
+    Output:
+        corr_df: dataframe with columns ID, corr
+        weak_corr_ids: IDs of participants with weak correlations
+    """
+    if ratings is None:
+        ratings = get_rating_arrays(data_df)
+    ids, id_codes, item_numbers, estimates = ratings['ids'], ratings['id_codes'], ratings['item_numbers'], ratings['estimates']
+    shared = in_item_set(item_numbers, shared_items) & ~np.isnan(estimates)
+    # group means of the shared items, looked up by item number
+    item_codes = item_numbers[shared].astype(int)
+    x = estimates[shared]
+    with np.errstate(invalid='ignore'):
+        group_means = np.bincount(item_codes, weights=x) / np.bincount(item_codes)
+    return create_corr_df(ids, id_codes[shared], x, group_means[item_codes], threshold)
+
+
+def within_participant_correlations(data_df, repeated_items, threshold=WEAK_THRESHOLD, ratings=None):
+    """
+    Correlates every participant's first and second ratings of the repeated
+    items (items with only one of both ratings are left out).
+    Input:
+        data_df: item-based dataframe
+        repeated_items: item numbers of the repeated items
+        threshold: correlations below this value are weak
+        ratings: arrays of data_df (see `get_rating_arrays`), extracted if not given
+    Output:
+        corr_df: dataframe with columns ID, corr
+        weak_corr_ids: IDs of participants with weak correlations
+    """
+    if ratings is None:
+        ratings = get_rating_arrays(data_df)
+    ids, id_codes, item_numbers, estimates = ratings['ids'], ratings['id_codes'], ratings['item_numbers'], ratings['estimates']
+    repetitions = ratings['repetitions']
+    repeated = in_item_set(item_numbers, repeated_items) & ~np.isnan(estimates)
+    # one key per participant and item; pairs are the keys with both ratings
+    first = np.flatnonzero(repeated & (repetitions == 0))
+    second = np.flatnonzero(repeated & (repetitions == 1))
+    n_items = int(np.max(repeated_items, initial=0)) + 1
+    first_keys = id_codes[first].astype(np.int64)*n_items + item_numbers[first].astype(np.int64)
+    second_keys = id_codes[second].astype(np.int64)*n_items + item_numbers[second].astype(np.int64)
+    _, first_pairs, second_pairs = np.intersect1d(first_keys, second_keys, return_indices=True)
+    first, second = first[first_pairs], second[second_pairs]
+    return create_corr_df(ids, id_codes[first], estimates[first], estimates[second], threshold)
+
+
+def find_excluded_participants(data_df, shared_items, repeated_items, threshold=EXCLUSION_THRESHOLD):
+    """
+    Finds all participants with a correlation below the threshold in any of the three procedures.
+    Input:
+        data_df: item-based dataframe (manually cleaned, see `remove_implausible_ratings`)
+        shared_items: item numbers of the shared/control items
+        repeated_items: item numbers of the repeated items
+        threshold: exclusion threshold of the correlations
+    Output:
+        excluded_ids: sorted array of participant IDs to exclude
+        corr_dfs: dict with the correlations of every procedure ('kuperman', 'birchenough', 'within')
+    """
+    ratings = get_rating_arrays(data_df)
+    corr_dfs = {
+        'kuperman': kuperman_correlations(data_df, shared_items, threshold, ratings)[0],
+        'birchenough': birchenough_correlations(data_df, shared_items, threshold, ratings)[0],
+        'within': within_participant_correlations(data_df, repeated_items, threshold, ratings)[0],
+    }
+    excluded_ids = np.unique(np.concatenate([x.loc[x['corr'] < threshold, 'ID'].to_numpy() for x in corr_dfs.values()]))
+    return excluded_ids, corr_dfs
+
+
+def remove_implausible_ratings(data_df, disqualified_ids=DISQUALIFIED_IDS, max_estimate=MAX_ESTIMATE):
+    """
+    Manual exclusion: removes disqualified participants, familiarisation items,
+    missing and implausibly high estimates.
+    Input:
+        data_df: item-based dataframe
+        disqualified_ids: IDs of participants to remove
+        max_estimate: highest plausible estimate
+    Output:
+        data_df: cleaned item-based dataframe
+    """
+    keep = ~data_df['ID'].isin(disqualified_ids) & data_df['item_number'].notna() & (data_df['estimate'] <= max_estimate)
+    return data_df[keep.fillna(False).to_numpy(dtype=bool)]
+
+
+def remove_outlier_ratings(data_df, sd_range=SD_RANGE):
+    """
+    Removes single ratings outside mean +- sd_range * sd of the item (ratings of
+    items with only one rating are removed as well, as their sd is undefined).
+    Input:
+        data_df: item-based dataframe
+        sd_range: allowed distance from the item mean in standard deviations
+    Output:
+        data_df: item-based dataframe without outlier ratings
+    """
+    data_df = data_df[data_df['item_number'].notna()]
+    prelim_estimates = get_estimates_overview(data_df, all=False).set_index('item_number')
+    item_numbers = data_df['item_number'].astype('Int64')
+    mean = prelim_estimates['estimate_mean'].reindex(item_numbers).to_numpy()
+    sd = prelim_estimates['estimate_sd'].reindex(item_numbers).to_numpy()
+    estimates = data_df['estimate'].to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        in_sd_range = (estimates >= mean-sd_range*sd) & (estimates <= mean+sd_range*sd)
+    return data_df[in_sd_range]
+
+
+def clean_item_data(data_df, shared_items, repeated_items, threshold=EXCLUSION_THRESHOLD, sd_range=SD_RANGE):
+    """
+    Full cleaning pipeline: manual exclusion, exclusion of unreliable
+    participants and removal of outlier ratings.
+    Input:
+        data_df: item-based dataframe with 'B: AoA mean' column
+        shared_items: item numbers of the shared/control items
+        repeated_items: item numbers of the repeated items
+        threshold: exclusion threshold of the correlations
+        sd_range: allowed distance of single ratings from the item mean in standard deviations
+    Output:
+        data_df: cleaned item-based dataframe
+        excluded_ids: IDs of the excluded participants
+    """
+    data_df = remove_implausible_ratings(data_df)
+    excluded_ids, _ = find_excluded_participants(data_df, shared_items, repeated_items, threshold)
+    data_df = data_df[~data_df['ID'].isin(excluded_ids)]
+    data_df = remove_outlier_ratings(data_df, sd_range)
+    return data_df, excluded_ids
@@ -0,0 +1,63 @@
+"""
+This script exports the norms tables as memory-mapped binary snapshots (see
+`utils/norms_snapshot.py`), so consumers can open them without parsing text:
+- aoa_estimates_complete.csv (output of `fill_in_info_for_duplicates.py`)
+- MultiPic_with_frequencies.csv
+- the external norms of Birchenough et al. (2017) and Schröder et al. (2012),
+  read as in `read_birchenough` and `read_schröder` of helper_functions.R
+  (via the cache of `utils/corpus_registry.py`)
+Tables whose source file is missing are skipped.
+The snapshots are saved to ../data/snapshots.
+
+Run in terminal with: $ python3 export_snapshots.py [--output-dir <directory>]
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+sys.path.append('../../utils')
+import corpus_registry
+import norms_snapshot
+
+# snapshot name -> (source file, function reading it)
+SOURCES = {
+    'aoa_estimates_complete': ('../data/aoa_estimates_complete.csv', pd.read_csv),
+    'MultiPic_with_frequencies': ('../../external_resources/MultiPic_with_frequencies.csv', pd.read_csv),
+    'Birchenough_2017': ('../../external_resources/norms/Birchenough_2017.csv', lambda x: corpus_registry.load('birchenough')),
+    'Schröder_2012': ('../../external_resources/norms/Schröder_2012.xls', lambda x: corpus_registry.load('schroeder')),
+}
+
+
+def export_snapshots(output_dir, sources=SOURCES):
+    """
+    Exports all tables whose source file exists.
+    Input:
+        output_dir: directory the snapshots are saved to
+        sources: dict {snapshot name: (source file, reading function)}
+    Output:
+        exported: dict {snapshot name: path of the snapshot}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    exported = dict()
+    for name, (source_path, read) in sources.items():
+        if not os.path.exists(source_path):
+            print(f'... skip {name} (missing {source_path})')
+            continue
+        snapshot_path = os.path.join(output_dir, name+'.snap')
+        df = read(source_path)
+        norms_snapshot.write_snapshot(df, snapshot_path)
+        print(f'... {name}: {len(df)} rows -> {snapshot_path}')
+        exported[name] = snapshot_path
+    return exported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports the norms tables as memory-mapped snapshots.')
+    parser.add_argument('--output-dir', default='../data/snapshots', help='directory the snapshots are saved to (default: ../data/snapshots)')
+    args = parser.parse_args()
+
+    print('>> Export snapshots...')
+    exported = export_snapshots(args.output_dir)
+    print(f'Done ({len(exported)} snapshots).')
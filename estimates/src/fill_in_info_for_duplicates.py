@@ -4,9 +4,20 @@ fills in the correct information for the duplicate MultiPic items.
 It saves a file `aoa_estimates_complete.csv` to the data directory.
 
 Run in terminal with: $ python3 fill_in_info_for_duplicates.py
+(optional: --report <path> for a run report with time and memory per stage)
 """
 
+import sys
+import argparse
 import pandas as pd
+sys.path.append('../../utils')
+from spreadsheet_cache import read_spreadsheet
+import instrumentation
+
+parser = argparse.ArgumentParser(description='Fills in the information of the duplicate MultiPic items.')
+instrumentation.add_arguments(parser)
+args = parser.parse_args()
+run = instrumentation.start_run('fill_in_info_for_duplicates', args)
 
 # define paths
 aoa_path = '../data/aoa_estimates_unique.csv'
@@ -14,35 +25,43 @@ sentences_path = '../../study_setup/data/example_sentences.ods'
 mp_freq_path = '../../external_resources/MultiPic_with_frequencies.csv'
 
 # load databases
+instrumentation.start_stage(run, 'load data')
 aoa_df = pd.read_csv(aoa_path)
-sentences_df = pd.read_excel(sentences_path, engine='odf', sheet_name='MultiPic') 
+sentences_df = read_spreadsheet(sentences_path, engine='odf', sheet_name='MultiPic')
 rename_dict = {'ITEM': 'item_number', 'NAME1': 'item'}
 sentences_df = sentences_df.rename(columns=rename_dict)
 mp_freq_df = pd.read_csv(mp_freq_path)
+instrumentation.end_stage(run, rows_out=len(aoa_df)+len(sentences_df)+len(mp_freq_df))
 
 # create final df with all items
+instrumentation.start_stage(run, 'fill in duplicates', rows_in=len(aoa_df))
 merged_df = pd.merge(sentences_df, aoa_df, on=['item', 'item_number'], how='left')
 
 # find duplicate rows
 # truly duplicate items share the same item name and example sentence
-duplicate_rows = merged_df[merged_df.duplicated(subset=['item', 'EXAMPLE'],keep=False)]
-duplicate_values = set(duplicate_rows['item'].values)
-
-# iterate through duplicate values
-for i in duplicate_values:
-    # get corresponding dataframe entries
-    entries = duplicate_rows[duplicate_rows['item']==i]
-    # find out which entry is still missing info + which contains the info
-    na_idx = entries[entries['estimate_mean'].isna()].index[0]
-    info_idx = entries[entries['estimate_mean'].notna()].index[0]
-    # copy info 
-    merged_df.loc[na_idx,'estimate_mean':'S: AoALikert SD'] = merged_df.loc[info_idx,'estimate_mean':'S: AoALikert SD']
-    # correct MultiPic info
-    merged_df.loc[na_idx,'H_INDEX'] = mp_freq_df.loc[na_idx,'H_INDEX']
-    merged_df.loc[na_idx,'VISUAL_COMPLEXITY'] = mp_freq_df.loc[na_idx,'VISUAL_COMPLEXITY']
+keys = ['item', 'EXAMPLE']
+estimate_columns = list(merged_df.loc[:, 'estimate_mean':'S: AoALikert SD'].columns)
+duplicated = merged_df.duplicated(subset=keys, keep=False)
+# first entry of every duplicate group that contains the info
+info_df = merged_df[duplicated & merged_df['estimate_mean'].notna()].drop_duplicates(subset=keys)[keys + estimate_columns]
+# entries that are still missing info, matched with the info of their group
+missing_df = merged_df.loc[duplicated & merged_df['estimate_mean'].isna(), keys + ['item_number']]
+fill_df = missing_df.reset_index().merge(info_df, on=keys, how='inner').set_index('index')
+
+# copy info
+merged_df.loc[fill_df.index, estimate_columns] = fill_df[estimate_columns]
+# correct MultiPic info (joined on the MultiPic item number, not the row position)
+mp_info_df = fill_df[['item_number']].reset_index().merge(mp_freq_df[['ITEM', 'H_INDEX', 'VISUAL_COMPLEXITY']], left_on='item_number',
+                                                          right_on='ITEM', how='left', validate='many_to_one').set_index('index')
+merged_df.loc[mp_info_df.index, ['H_INDEX', 'VISUAL_COMPLEXITY']] = mp_info_df[['H_INDEX', 'VISUAL_COMPLEXITY']]
+
+instrumentation.end_stage(run, rows_out=len(merged_df))
 
 # drop column with example sentence
 merged_df.drop(columns='EXAMPLE', inplace=True)
 
 # save estimates
-merged_df.to_csv('../data/aoa_estimates_complete.csv', index=False)
\ No newline at end of file
+instrumentation.start_stage(run, 'save estimates', rows_in=len(merged_df))
+merged_df.to_csv('../data/aoa_estimates_complete.csv', index=False)
+instrumentation.end_stage(run, rows_out=len(merged_df))
+instrumentation.save_report(run)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Group age-of-acquisition estimates per MultiPic item (Python version of
+`get_estimates_overview` in helper_functions.R).
+
+All items are summarised in one grouped pass over the item-based data: mean,
+standard deviation (n-1, as R's sd), min and max of the continuous estimates
+and of their Likert equivalents. The Likert binning is vectorised.
+
+Run in terminal with: $ python3 group_estimates.py --output <path>
+(default input: ../data/raw/derivatives/item_based_data_add_info.csv; the data
+is cleaned as in AoA_estimates_for_MultiPic.Rmd first, see `exclusion.py`)
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from item_schema import read_item_based_data
+
+# upper bounds of the Likert bins after Schröder et al.:
+# 1 = 0–2 years, 2 = 3–4 years, 3 = 5–6 years, 4 = 7–8 years, 5 = 9–10 years, 6 = 11–12 years, 7 = 13+ years
+LIKERT_BOUNDS = [2, 4, 6, 8, 10, 12]
+# columns of the overview (as in aoa_estimates_unique.csv)
+ESTIMATE_COLUMNS = ['estimate_mean', 'estimate_sd', 'min', 'max', 'estimateLikert_mean', 'estimateLikert_sd', 'minLikert', 'maxLikert']
+# item information that is taken over from the item-based data
+INFO_COLUMNS = [
+    'item', 'example_sentence', 'H_INDEX', 'VISUAL_COMPLEXITY', 'lgSUBTLEX',
+    'B: AoA mean', 'B: AoA SD', 'B: min', 'B: max', 'B: AoALikert mean', 'B: AoALikert SD', 'B: minLikert', 'B: maxLikert',
+    'S: AoALikert mean', 'S: AoALikert SD',
+]
+
+
+def rating_to_likert(estimates):
+    """
+    Turns AoA estimates into Likert ratings (see LIKERT_BOUNDS).
+    Input:
+        estimates: array-like of raw AoA estimates
+    Output:
+        likert_estimates: Int8 array of Likert bins 1-7 (missing estimates stay missing)
+    """
+    estimates = pd.Series(estimates).astype(float).to_numpy()
+    missing = np.isnan(estimates)
+    bins = np.searchsorted(LIKERT_BOUNDS, np.where(missing, 0, estimates), side='left') + 1
+    likert_estimates = pd.array(bins, dtype='Int8')
+    likert_estimates[missing] = pd.NA
+    return likert_estimates
+
+
+def add_likert(data_df):
+    """
+    Adds a column translating the continuous AoA estimate into a Likert rating
+    (as `load_raw_data` in helper_functions.R).
+    Input:
+        data_df: item-based dataframe
+    Output:
+        data_df: item-based dataframe with estimateLikert column after estimate
+    """
+    data_df = data_df.drop(columns='estimateLikert', errors='ignore')
+    data_df.insert(data_df.columns.get_loc('estimate')+1, 'estimateLikert', rating_to_likert(data_df['estimate']))
+    return data_df
+
+
+def get_estimates_overview(data_df, all=True):
+    """
+    Creates an overview of the group estimates of every MultiPic item.
+    Input:
+        data_df: item-based dataframe (or a subset thereof); familiarisation
+                 items (without item number) and missing estimates are ignored
+        all: if False, only estimate_mean and estimate_sd are calculated
+    Output:
+        aoa_estimates: dataframe with one row per item number (sorted) and ESTIMATE_COLUMNS
+    """
+    data_df = data_df[data_df['item_number'].notna()]
+    estimates = pd.DataFrame({
+        'item_number': data_df['item_number'].to_numpy(),
+        'estimate': data_df['estimate'].astype(float).to_numpy(),
+    })
+    if all:
+        estimates['estimateLikert'] = rating_to_likert(estimates['estimate']).to_numpy(dtype=float, na_value=np.nan)
+    # one grouped pass over all items; NaN is skipped as R's !is.na(estimate) filter
+    groups = estimates.groupby('item_number', sort=True)
+    if not all:
+        aoa_estimates = groups['estimate'].agg(['mean', 'std'])
+        aoa_estimates.columns = ['estimate_mean', 'estimate_sd']
+        return aoa_estimates.reset_index()
+    aoa_estimates = groups[['estimate', 'estimateLikert']].agg(['mean', 'std', 'min', 'max'])
+    aoa_estimates.columns = ['estimate_mean', 'estimate_sd', 'min', 'max', 'estimateLikert_mean', 'estimateLikert_sd', 'minLikert', 'maxLikert']
+    # ratings are whole numbers, so are their extremes
+    for column in ['minLikert', 'maxLikert'] + (['min', 'max'] if pd.api.types.is_integer_dtype(data_df['estimate']) else []):
+        aoa_estimates[column] = aoa_estimates[column].astype('Int64')
+    aoa_estimates = aoa_estimates[ESTIMATE_COLUMNS].reset_index()
+    aoa_estimates['item_number'] = aoa_estimates['item_number'].astype('Int64')
+    return aoa_estimates
+
+
+def add_item_information(aoa_estimates, data_df, info_columns=INFO_COLUMNS):
+    """
+    Adds item information (name, example sentence, norms, ...) of the first
+    row of every item to the group estimates.
+    Input:
+        aoa_estimates: group estimates (see `get_estimates_overview`)
+        data_df: item-based dataframe
+        info_columns: columns to take over (if present in data_df)
+    Output:
+        aoa_estimates: group estimates with item after item_number and the
+                       other item information after the estimates
+    """
+    info_columns = [x for x in info_columns if x in data_df.columns]
+    item_info = data_df[data_df['item_number'].notna()].drop_duplicates(subset='item_number', keep='first')
+    item_info = item_info.set_index(item_info['item_number'].astype('Int64'))[info_columns]
+    aoa_estimates = aoa_estimates.merge(item_info, left_on='item_number', right_index=True, how='left')
+    first_columns = ['item_number'] + [x for x in ['item'] if x in info_columns]
+    return aoa_estimates[first_columns + [x for x in aoa_estimates.columns if x not in first_columns]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calculates the group AoA estimates of every MultiPic item.')
+    parser.add_argument('--input', default='../data/raw/derivatives/item_based_data_add_info.csv',
+                        help='item-based data (default: ../data/raw/derivatives/item_based_data_add_info.csv)')
+    parser.add_argument('--output', required=True, help='path of the csv file with the group estimates')
+    parser.add_argument('--no-cleaning', action='store_true', help='calculate the estimates from all ratings')
+    args = parser.parse_args()
+    # imported here, as exclusion.py itself builds on this module
+    import exclusion
+
+    print('>> Load item-based data...')
+    data_df = read_item_based_data(args.input)
+    print('Done.')
+    if not args.no_cleaning:
+        print('>> Clean data...')
+        shared_items, repeated_items = exclusion.load_item_sets()
+        data_df, excluded_ids = exclusion.clean_item_data(data_df, shared_items, repeated_items)
+        print(f'{len(excluded_ids)} participants excluded.')
+    print('>> Calculate group estimates...')
+    aoa_estimates = add_item_information(get_estimates_overview(data_df), data_df)
+    aoa_estimates.to_csv(args.output, index=False)
+    print(f'Saved estimates of {len(aoa_estimates)} items to {args.output}.')
@@ -0,0 +1,138 @@
+"""
+Incremental ingestion of new survey exports for `data_wrangling.py`.
+
+A manifest next to `item_based_data.csv` keeps track of all participants that
+have already been processed: their CASE (survey start), the CASE of their list
+data (list_CASE) and a content hash of both survey rows. A design hash covers
+everything that is the same for all participants (lookup tables, decoding rules,
+...); if it changes, all participants are processed anew.
+
+On the next run, only new or changed participants are reshaped; their rows
+replace the old ones in `item_based_data.csv`, all other rows are kept as they
+are. The result is the same as reshaping all participants from scratch.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from item_schema import apply_schema, read_item_based_data
+from reshaping import lookup_positions
+
+MANIFEST_COLUMNS = ['CASE', 'list_CASE', 'row_hash', 'design_hash']
+
+
+def hash_design(frames, columns):
+    """
+    Creates a hash of everything that is the same for all participants.
+    Input:
+        frames: list of dataframes (lookup tables, decoding rules, ...)
+        columns: columns of the item-based dataset
+    Output:
+        design_hash: hex string
+    """
+    design_hash = hashlib.sha256()
+    for frame in frames:
+        design_hash.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        design_hash.update(','.join(map(str, frame.columns)).encode())
+    design_hash.update(','.join(columns).encode())
+    return design_hash.hexdigest()
+
+
+def hash_participants(survey_start_df, lists_df, ref_index):
+    """
+    Creates a content hash of the survey rows of every participant.
+    Input:
+        survey_start_df: survey data of the introduction pages
+        lists_df: survey data of the lists
+        ref_index: dictionary of the form {REF: row position in lists_df}
+    Output:
+        hashes_df: dataframe with columns CASE, list_CASE, row_hash
+    """
+    list_positions = lookup_positions(ref_index, survey_start_df['CASE'])
+    started = list_positions >= 0
+    survey_hash = pd.util.hash_pandas_object(survey_start_df, index=False).to_numpy()
+    list_hash = pd.util.hash_pandas_object(lists_df, index=False).to_numpy()
+    list_hash = np.where(started, list_hash[list_positions], 0)
+    row_hash = pd.util.hash_pandas_object(pd.DataFrame({'survey': survey_hash, 'list': list_hash}), index=False)
+    list_case = pd.array(lists_df['CASE'].to_numpy()[list_positions], dtype='Int64')
+    list_case[~started] = pd.NA
+    hashes_df = pd.DataFrame({
+        'CASE': survey_start_df['CASE'].to_numpy(),
+        'list_CASE': list_case,
+        'row_hash': row_hash.to_numpy().astype(str),
+    })
+    return hashes_df
+
+
+def load_manifest(manifest_path):
+    """
+    Reads the manifest of already processed participants.
+    Input:
+        manifest_path: path to the manifest csv
+    Output:
+        manifest_df: dataframe with MANIFEST_COLUMNS (empty if there is no manifest yet)
+    """
+    if not os.path.exists(manifest_path):
+        return pd.DataFrame(columns=MANIFEST_COLUMNS)
+    return pd.read_csv(manifest_path, dtype={'row_hash': str, 'design_hash': str})
+
+
+def find_outdated(manifest_df, hashes_df, design_hash):
+    """
+    Finds the participants that are new or whose survey data changed.
+    Input:
+        manifest_df: manifest of already processed participants
+        hashes_df: current content hashes (see `hash_participants`)
+        design_hash: current design hash (see `hash_design`)
+    Output:
+        outdated: boolean array, True for every participant in hashes_df that
+                  needs to be (re)processed
+    """
+    if len(manifest_df) == 0 or (manifest_df['design_hash'] != design_hash).any():
+        return np.ones(len(hashes_df), dtype=bool)
+    known_hashes = dict(zip(manifest_df['CASE'], manifest_df['row_hash']))
+    outdated = np.array([known_hashes.get(case) != row_hash for case, row_hash in zip(hashes_df['CASE'], hashes_df['row_hash'])], dtype=bool)
+    return outdated
+
+
+def update_item_based_data(data_path, manifest_path, survey_start_df, hashes_df, design_hash, reshape):
+    """
+    Reshapes only new or changed participants and merges them with the
+    already existing item-based dataset.
+    Input:
+        data_path: path to the existing item_based_data.csv
+        manifest_path: path to the manifest csv
+        survey_start_df: survey data of the introduction pages
+        hashes_df: current content hashes (see `hash_participants`)
+        design_hash: current design hash (see `hash_design`)
+        reshape: function that reshapes the participants of a survey_start_df subset
+    Output:
+        data_df: complete item-based dataset (typed, see `item_schema.py`, in survey order)
+        manifest_df: updated manifest
+    """
+    manifest_df = load_manifest(manifest_path)
+    if not os.path.exists(data_path):
+        manifest_df = manifest_df.iloc[0:0]
+    outdated = find_outdated(manifest_df, hashes_df, design_hash)
+    print(f'... {outdated.sum()} new or changed participants, {(~outdated).sum()} unchanged')
+
+    new_df = apply_schema(reshape(survey_start_df[outdated]))
+    if outdated.all():
+        data_df = new_df
+    else:
+        # keep rows of unchanged participants that are still part of the export
+        old_df = read_item_based_data(data_path)
+        keep_ids = hashes_df.loc[~outdated, 'CASE']
+        old_df = old_df[old_df['ID'].isin(keep_ids)]
+        data_df = pd.concat([old_df, new_df], ignore_index=True)
+        # restore survey order
+        survey_positions = {case: position for position, case in enumerate(survey_start_df['CASE'])}
+        data_df['participant_position'] = data_df['ID'].map(survey_positions)
+        data_df = data_df.sort_values(by='participant_position', kind='mergesort')
+        data_df = apply_schema(data_df.drop(columns='participant_position').reset_index(drop=True))
+
+    manifest_df = hashes_df.assign(design_hash=design_hash)[MANIFEST_COLUMNS]
+    return data_df, manifest_df
@@ -0,0 +1,130 @@
+"""
+Typed schema of the item-based dataset (`item_based_data.csv`).
+
+Strings that repeat for many rows (items, example sentences, participant
+information) are stored as categoricals, numbers as small nullable integer
+types, and the ages of a participant's children as a list column (one list
+object per participant, shared by all of the participant's rows).
+
+On disk, the dataset stays a plain csv file (child ages written as
+'[age 1, age 2, ...]'), so it can still be read by R. Python readers should use
+`read_item_based_data`, the writer in `data_wrangling.py` uses
+`write_item_based_data`.
+"""
+
+import numpy as np
+import pandas as pd
+
+# dtype of every column of the item-based dataset
+SCHEMA = {
+    'ID': 'Int32',
+    'item': 'category',
+    'item_number': 'Int16',
+    'estimate': 'Int16',
+    'example_sentence': 'category',
+    'repetition': 'Int8',
+    'order': 'Int16',
+    'platform': 'category',
+    'list': 'category',
+    'gender': 'category',
+    'age': 'Int16',
+    'country': 'category',
+    'education': 'Int8',
+    'L1': 'Int8',
+    'monoling': 'Int8',
+    'lang_dis': 'Int8',
+    'read_dis': 'Int8',
+    'sight': 'category',
+    'children': 'Int8',
+    'child_age': 'list',
+    'time': 'float64',
+    'time_sum': 'Int32',
+    'finished': 'Int8',
+    'violation': 'Int8',
+}
+LIST_COLUMNS = [column for column, dtype in SCHEMA.items() if dtype == 'list']
+
+
+def parse_age_list(value):
+    """
+    Parses one list of ages as written in the csv file.
+    Input:
+        value: string of the form '[age 1, age 2, ...]'
+    Output:
+        ages: list of floats
+    """
+    value = value.strip('[]')
+    if value == '':
+        return []
+    return [float(age) for age in value.split(',')]
+
+
+def to_list_column(column):
+    """
+    Turns a column of list strings into a list column; every distinct string is
+    parsed only once, so equal lists share the same object.
+    Input:
+        column: series of strings of the form '[...]' or of lists
+    Output:
+        list_column: series of lists (object dtype)
+    """
+    if column.map(lambda x: isinstance(x, list)).all():
+        return column
+    codes, uniques = pd.factorize(column.astype(str))
+    parsed = np.empty(len(uniques)+1, dtype=object)
+    parsed[:-1] = [parse_age_list(value) for value in uniques]
+    parsed[-1] = []
+    return pd.Series(parsed[codes], index=column.index, name=column.name)
+
+
+def apply_schema(data_df):
+    """
+    Converts the columns of an item-based dataframe to the types of SCHEMA.
+    Input:
+        data_df: item-based dataframe (columns not part of SCHEMA are left as they are)
+    Output:
+        typed_df: item-based dataframe with compact types
+    """
+    typed_df = data_df.copy()
+    for column, dtype in SCHEMA.items():
+        if column not in typed_df.columns:
+            continue
+        if dtype == 'list':
+            typed_df[column] = to_list_column(typed_df[column])
+        elif dtype == 'category':
+            # categoricals with different categories are combined as plain strings
+            typed_df[column] = typed_df[column].astype(object).astype('category')
+        else:
+            typed_df[column] = typed_df[column].astype(dtype)
+    return typed_df
+
+
+def read_item_based_data(path):
+    """
+    Reads an item-based dataset with the types of SCHEMA.
+    Input:
+        path: path to item_based_data.csv (or a file with the same columns)
+    Output:
+        data_df: item-based dataframe with compact types
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in SCHEMA.items() if column in header and dtype != 'list'}
+    data_df = pd.read_csv(path, dtype=dtypes)
+    for column in LIST_COLUMNS:
+        if column in data_df.columns:
+            data_df[column] = to_list_column(data_df[column].fillna('[]'))
+    return data_df
+
+
+def write_item_based_data(data_df, path):
+    """
+    Saves an item-based dataset as csv file after converting it to SCHEMA.
+    Input:
+        data_df: item-based dataframe
+        path: path of the csv file
+    Output:
+        typed_df: item-based dataframe with compact types
+    """
+    typed_df = apply_schema(data_df)
+    typed_df.to_csv(path, index=False)
+    return typed_df
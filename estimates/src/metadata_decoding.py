@@ -0,0 +1,154 @@
+"""
+Codebook-driven decoding of the participant information used by `data_wrangling.py`.
+
+The answer codes of the introduction pages (IN16, RA01, SD01, ...) are translated
+with a small rules table (`metadata_rules.csv`) that states for every code:
+- the decoded value,
+- whether the code violates one of our criteria (violation: no 0/yes 1),
+- whether the participant can still have finished the survey (finished: no 0/yes 1).
+A RESPONSE of `else` covers all codes that are not listed (including missing answers).
+Codes that are not listed and have no `else` rule are decoded as missing, as are
+codes whose rule has an empty value (e.g. -9, not answered).
+
+The value labels in `values_survey_start.csv` serve as codebook: every code listed
+there should be covered by a rule, so changes in the questionnaire are noticed.
+
+All participants are decoded at once with mapped/vectorised operations.
+"""
+
+import numpy as np
+import pandas as pd
+
+# columns that are taken over from the survey without decoding
+RAW_COLUMNS = {
+    'age': 'SD02_01', # participant's age
+    'education': 'SD10', # for clarification of values see codebook or values csv
+}
+# columns in the order of the participant information
+META_COLUMNS = [
+    'platform', 'list', 'gender', 'age', 'country', 'education', 'L1', 'monoling',
+    'lang_dis', 'read_dis', 'sight', 'children', 'child_age', 'time_sum', 'finished', 'violation',
+]
+
+
+def load_rules(rules_path):
+    """
+    Reads the decoding rules.
+    Input:
+        rules_path: path to the rules csv (see `metadata_rules.csv`)
+    Output:
+        rules_df: dataframe with columns VAR, column, RESPONSE, value, violation, finished
+    """
+    rules_df = pd.read_csv(rules_path, dtype=str, keep_default_na=False)
+    rules_df = rules_df.astype({'violation': int, 'finished': int})
+    return rules_df
+
+
+def check_rules(rules_df, values_index):
+    """
+    Prints a warning for every code of the codebook that is not covered by a rule.
+    Input:
+        rules_df: decoding rules (see `load_rules`)
+        values_index: dictionary of the form {VAR: {RESPONSE: MEANING}}
+    Output:
+        uncovered: list of (VAR, RESPONSE, MEANING) tuples without a rule
+    """
+    uncovered = []
+    for var, var_rules in rules_df.groupby('VAR', sort=False):
+        responses = set(var_rules['RESPONSE'])
+        if 'else' in responses:
+            continue
+        for response, meaning in values_index.get(var, dict()).items():
+            if str(response) not in responses:
+                uncovered.append((var, response, meaning))
+    for var, response, meaning in uncovered:
+        print(f'WARNING: code {response} ("{meaning}") of {var} has no decoding rule and is treated as missing.')
+    return uncovered
+
+
+def decode_variable(codes, var_rules):
+    """
+    Decodes all answers to one survey variable.
+    Input:
+        codes: column of survey answer codes
+        var_rules: decoding rules of this variable
+    Output:
+        values: decoded values (Int64 if all decoded values are integers)
+        violation: violation flag per participant (0/1)
+        finished: finished flag per participant (0/1)
+    """
+    coded = var_rules[var_rules['RESPONSE'] != 'else']
+    fallback = var_rules[var_rules['RESPONSE'] == 'else']
+    # without an else rule, unknown codes are missing but no violation
+    fallback_value, fallback_violation, fallback_finished = np.nan, 0, 1
+    if len(fallback):
+        fallback_value = fallback['value'].iat[0] if fallback['value'].iat[0] != '' else np.nan
+        fallback_violation = fallback['violation'].iat[0]
+        fallback_finished = fallback['finished'].iat[0]
+
+    # position of the matching rule for every participant (-1: no rule)
+    rule_idx = pd.Index(coded['RESPONSE'].astype(float)).get_indexer(codes.astype(float))
+    known = rule_idx >= 0
+    # an empty value decodes a code as missing (e.g. -9, not answered)
+    coded_values = coded['value'].replace('', np.nan)
+    values = np.append(coded_values.to_numpy(dtype=object), fallback_value)
+    decoded = pd.Series(values[rule_idx], dtype=object)
+    if all(value.lstrip('-').isdigit() for value in coded_values.dropna()):
+        decoded = decoded.astype(float).astype('Int64')
+    violation = np.where(known, coded['violation'].to_numpy()[rule_idx], fallback_violation)
+    finished = np.where(known, coded['finished'].to_numpy()[rule_idx], fallback_finished)
+    return decoded, violation, finished
+
+
+def decode_child_age(survey_start_df, children):
+    """
+    Collects the ages of all children per participant.
+    Input:
+        survey_start_df: survey data of the introduction pages
+        children: decoded children column (1 if the participant has children)
+    Output:
+        child_age: column of lists of the form [age 1, age 2, ...]
+    """
+    age_columns = sorted([x for x in survey_start_df.columns if x.startswith('SD23x')])
+    n_kids = survey_start_df['SD23'].fillna(0).to_numpy(dtype=int)
+    n_kids = np.where(children.fillna(0).to_numpy(dtype=int) == 1, n_kids, 0)
+    ages = survey_start_df[age_columns].to_numpy(dtype=float)
+    child_age = np.empty(len(survey_start_df), dtype=object)
+    child_age[:] = [list(participant_ages[:kids]) for participant_ages, kids in zip(ages.tolist(), n_kids)]
+    return pd.Series(child_age, index=survey_start_df.index, dtype=object)
+
+
+def decode_metadata(survey_start_df, lists_df, rules_df, ref_index):
+    """
+    Decodes the participant information that stays the same for all items.
+    Input:
+        survey_start_df: survey data of the introduction pages
+        lists_df: survey data of the lists
+        rules_df: decoding rules (see `load_rules`)
+        ref_index: dictionary of the form {REF: row position in lists_df}
+    Output:
+        meta_df: dataframe indexed by participant ID with the columns of META_COLUMNS
+    """
+    meta_df = pd.DataFrame(index=survey_start_df.index)
+    violation = np.zeros(len(survey_start_df), dtype=int)
+    finished = np.ones(len(survey_start_df), dtype=int)
+    for var, var_rules in rules_df.groupby('VAR', sort=False):
+        column = var_rules['column'].iat[0]
+        decoded, var_violation, var_finished = decode_variable(survey_start_df[var], var_rules)
+        meta_df[column] = decoded.to_numpy()
+        violation = np.maximum(violation, var_violation)
+        finished = np.minimum(finished, var_finished)
+    for column, var in RAW_COLUMNS.items():
+        meta_df[column] = survey_start_df[var]
+    meta_df['child_age'] = decode_child_age(survey_start_df, meta_df['children'])
+
+    # time_sum: survey start + list; participants without list did not finish
+    list_positions = np.array([ref_index.get(id, -1) for id in survey_start_df['CASE']], dtype=int)
+    started = list_positions >= 0
+    list_time = np.where(started, lists_df['TIME_SUM'].to_numpy()[list_positions], 0)
+    meta_df['time_sum'] = survey_start_df['TIME_SUM'].to_numpy(dtype=int) + list_time.astype(int)
+    meta_df['finished'] = np.where(started, finished, 0)
+    meta_df['violation'] = np.where(started, violation, 1)
+
+    meta_df.index = survey_start_df['CASE'].to_numpy()
+    return meta_df[META_COLUMNS]
@@ -0,0 +1,296 @@
+"""
+Bootstrap confidence intervals of the group estimates and split-half
+reliability of the item lists.
+
+The ratings are arranged as participant x item arrays (sum and number of the
+ratings of every participant for every item, so the repeated items count
+twice as in `group_estimates.py`). A replicate is then only a weighting of the
+participants, and many replicates are calculated at once as matrix products:
+- bootstrap: participants are drawn with replacement (weights = how often a
+  participant was drawn); per item, the standard error and the percentile
+  confidence interval of the mean estimate over all replicates are reported,
+- split-half: the participants of a list are split into two random halves
+  (weights 0/1); the item means of both halves are correlated and corrected
+  with the Spearman-Brown formula.
+
+Replicates are calculated in chunks with seeds drawn from the given
+numpy.random.Generator, so the results only depend on the seed, not on the
+number of worker processes.
+
+Run in terminal with: $ python3 reliability.py --output <path> [--estimates ../data/aoa_estimates_unique.csv]
+(default input: ../data/raw/derivatives/item_based_data_add_info.csv; the data
+is cleaned as in AoA_estimates_for_MultiPic.Rmd first, see `exclusion.py`)
+"""
+
+import argparse
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from group_estimates import rating_to_likert
+from item_schema import read_item_based_data
+
+# replicates calculated at once (and per task of the process pool)
+CHUNK_REPLICATES = 100
+# columns with the bootstrap results of every item
+BOOTSTRAP_COLUMNS = ['n_participants', 'estimate_se', 'estimate_ci_lower', 'estimate_ci_upper',
+                     'estimateLikert_se', 'estimateLikert_ci_lower', 'estimateLikert_ci_upper']
+
+
+def create_rating_arrays(data_df):
+    """
+    Arranges the ratings as participant x item arrays.
+    Input:
+        data_df: item-based dataframe (familiarisation items and missing estimates are ignored)
+    Output:
+        ratings: dict with
+            ids: participant IDs (rows, in order of appearance)
+            lists: list of every participant
+            item_numbers: item numbers (columns, sorted)
+            sums, likert_sums: float32 arrays of the sums of the (Likert) estimates
+            counts: float32 array of the numbers of ratings
+    """
+    data_df = data_df[(data_df['item_number'].notna() & data_df['estimate'].notna()).to_numpy(dtype=bool)]
+    id_codes, ids = pd.factorize(data_df['ID'])
+    item_codes, item_numbers = pd.factorize(data_df['item_number'].astype(int), sort=True)
+    estimates = data_df['estimate'].to_numpy(dtype=float)
+    shape = (len(ids), len(item_numbers))
+    # integer sums stay exact in float32 (up to 2**24)
+    ratings = {
+        'ids': np.asarray(ids),
+        'lists': data_df.drop_duplicates(subset='ID')['list'].astype(str).to_numpy(),
+        'item_numbers': np.asarray(item_numbers),
+        'sums': np.zeros(shape, dtype=np.float32),
+        'likert_sums': np.zeros(shape, dtype=np.float32),
+        'counts': np.zeros(shape, dtype=np.float32),
+    }
+    np.add.at(ratings['sums'], (id_codes, item_codes), estimates)
+    np.add.at(ratings['likert_sums'], (id_codes, item_codes), rating_to_likert(estimates).to_numpy(dtype=float))
+    np.add.at(ratings['counts'], (id_codes, item_codes), 1)
+    return ratings
+
+
+def draw_seeds(rng, n_replicates):
+    """
+    Divides the replicates into chunks with a seed of their own.
+    Input:
+        rng: numpy.random.Generator
+        n_replicates: number of replicates
+    Output:
+        chunks: list of tuples (seed, number of replicates)
+    """
+    sizes = [min(CHUNK_REPLICATES, n_replicates-x) for x in range(0, n_replicates, CHUNK_REPLICATES)]
+    seeds = rng.integers(2**63, size=len(sizes))
+    return list(zip(seeds.tolist(), sizes))
+
+
+def weighted_means(weights, sums, counts):
+    """
+    Calculates the item means of many weightings of the participants at once.
+    Input:
+        weights: replicates x participants array
+        sums, counts: participant x item arrays (see `create_rating_arrays`)
+    Output:
+        means: replicates x items array (NaN for items without ratings)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weights @ sums) / (weights @ counts)
+
+
+# PARALLEL EXECUTION
+# rating arrays that every worker process holds once (see `init_worker`)
+worker_state = dict()
+
+
+def init_worker(state):
+    """
+    Stores the rating arrays in the worker process.
+    Input:
+        state: dict of rating arrays (see `create_rating_arrays`)
+    Output:
+        --
+    """
+    worker_state.update(state)
+
+
+def bootstrap_chunk(task):
+    """
+    Calculates one chunk of bootstrap replicates.
+    Input:
+        task: tuple (seed, number of replicates)
+    Output:
+        means, likert_means: replicates x items arrays of the item means
+    """
+    seed, n_replicates = task
+    rng = np.random.default_rng(seed)
+    n_participants = len(worker_state['ids'])
+    # how often every participant is drawn in every replicate
+    draws = rng.integers(0, n_participants, size=(n_replicates, n_participants))
+    draws += np.arange(n_replicates)[:, None] * n_participants
+    weights = np.bincount(draws.ravel(), minlength=n_replicates*n_participants).reshape(n_replicates, n_participants).astype(np.float32)
+    means = weighted_means(weights, worker_state['sums'], worker_state['counts'])
+    likert_means = weighted_means(weights, worker_state['likert_sums'], worker_state['counts'])
+    return means, likert_means
+
+
+def split_half_chunk(task):
+    """
+    Calculates one chunk of split-half replicates for a group of participants.
+    Input:
+        task: tuple (seed, number of replicates, row positions of the participants)
+    Output:
+        correlations: array of the correlations of the item means of both halves
+    """
+    seed, n_replicates, rows = task
+    rng = np.random.default_rng(seed)
+    sums = worker_state['sums'][rows]
+    counts = worker_state['counts'][rows]
+    # only items rated by at least two participants can be rated in both halves
+    rated = (counts > 0).sum(axis=0) >= 2
+    sums, counts = sums[:, rated], counts[:, rated]
+    ranks = rng.permuted(np.tile(np.arange(len(rows)), (n_replicates, 1)), axis=1)
+    first_half = (ranks < len(rows)//2).astype(np.float32)
+    means_a = weighted_means(first_half, sums, counts)
+    means_b = weighted_means(1-first_half, sums, counts)
+    return correlate_rows(means_a, means_b)
+
+
+def correlate_rows(a, b):
+    """
+    Calculates the Pearson correlation of every row of a with the same row of
+    b, leaving out positions where one of both is missing.
+    Input:
+        a, b: arrays of the same shape
+    Output:
+        correlations: array with one correlation per row
+    """
+    valid = ~np.isnan(a) & ~np.isnan(b)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(valid, a, 0)
+        b = np.where(valid, b, 0)
+        da = np.where(valid, a - (a.sum(axis=1)/n)[:, None], 0)
+        db = np.where(valid, b - (b.sum(axis=1)/n)[:, None], 0)
+        return (da*db).sum(axis=1) / np.sqrt((da*da).sum(axis=1) * (db*db).sum(axis=1))
+
+
+def run_tasks(function, tasks, ratings, workers):
+    """
+    Runs the tasks on a process pool (or in this process with workers=1 or where
+    worker processes cannot be forked).
+    Input:
+        function: `bootstrap_chunk` or `split_half_chunk`
+        tasks: list of tasks
+        ratings: rating arrays (see `create_rating_arrays`)
+        workers: number of worker processes
+    Output:
+        results: list of the results, in the order of the tasks
+    """
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        init_worker(ratings)
+        return [function(task) for task in tasks]
+    # forked workers inherit the rating arrays once instead of receiving them with every task
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes=workers, initializer=init_worker, initargs=(ratings,)) as pool:
+        return pool.map(function, tasks)
+
+
+def bootstrap_estimates(ratings, rng, n_replicates=2000, level=0.95, workers=1):
+    """
+    Calculates bootstrap standard errors and percentile confidence intervals of
+    the group estimates (participants are resampled).
+    Input:
+        ratings: rating arrays (see `create_rating_arrays`)
+        rng: numpy.random.Generator
+        n_replicates: number of bootstrap replicates
+        level: confidence level of the intervals
+        workers: number of worker processes
+    Output:
+        bootstrap_df: dataframe with item_number and BOOTSTRAP_COLUMNS
+    """
+    results = run_tasks(bootstrap_chunk, draw_seeds(rng, n_replicates), ratings, workers)
+    percentiles = [50*(1-level), 50*(1+level)]
+    bootstrap_df = pd.DataFrame({
+        'item_number': pd.array(ratings['item_numbers'], dtype='Int64'),
+        'n_participants': (ratings['counts'] > 0).sum(axis=0),
+    })
+    for column, position in [('estimate', 0), ('estimateLikert', 1)]:
+        means = np.concatenate([x[position] for x in results])
+        bootstrap_df[column+'_se'] = np.nanstd(means, axis=0, ddof=1)
+        bootstrap_df[column+'_ci_lower'], bootstrap_df[column+'_ci_upper'] = np.nanpercentile(means, percentiles, axis=0)
+    return bootstrap_df
+
+
+def split_half_reliability(ratings, rng, n_replicates=2000, level=0.95, workers=1):
+    """
+    Calculates the split-half reliability of the group estimates of every list
+    (participants of the list, all items they rated) and of all participants.
+    Input:
+        ratings: rating arrays (see `create_rating_arrays`)
+        rng: numpy.random.Generator
+        n_replicates: number of random splits
+        level: confidence level of the intervals
+        workers: number of worker processes
+    Output:
+        reliability_df: dataframe with columns list, n_participants, split_half_r (mean
+                        correlation of both halves), reliability (mean Spearman-Brown
+                        corrected correlation), reliability_ci_lower, reliability_ci_upper
+    """
+    groups = {x: np.flatnonzero(ratings['lists'] == x) for x in sorted(set(ratings['lists']))}
+    groups['all'] = np.arange(len(ratings['ids']))
+    tasks, task_groups = [], []
+    for group, rows in groups.items():
+        for seed, size in draw_seeds(rng, n_replicates):
+            tasks.append((seed, size, rows))
+            task_groups.append(group)
+    results = run_tasks(split_half_chunk, tasks, ratings, workers)
+    percentiles = [50*(1-level), 50*(1+level)]
+    rows = []
+    for group in groups:
+        correlations = np.concatenate([x for x, y in zip(results, task_groups) if y == group])
+        corrected = 2*correlations / (1+correlations)
+        lower, upper = np.nanpercentile(corrected, percentiles) if np.any(~np.isnan(corrected)) else (np.nan, np.nan)
+        rows.append([group, len(groups[group]), np.nanmean(correlations), np.nanmean(corrected), lower, upper])
+    return pd.DataFrame(rows, columns=['list', 'n_participants', 'split_half_r', 'reliability', 'reliability_ci_lower', 'reliability_ci_upper'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calculates bootstrap confidence intervals and split-half reliability of the group AoA estimates.')
+    parser.add_argument('--input', default='../data/raw/derivatives/item_based_data_add_info.csv',
+                        help='item-based data (default: ../data/raw/derivatives/item_based_data_add_info.csv)')
+    parser.add_argument('--output', required=True, help='path of the csv file with the bootstrap results per item')
+    parser.add_argument('--estimates', help='group estimates (e.g. ../data/aoa_estimates_unique.csv) the bootstrap results are joined onto')
+    parser.add_argument('--lists-output', help='path of the csv file with the split-half reliability per list')
+    parser.add_argument('--replicates', type=int, default=2000, help='number of bootstrap replicates and random splits (default: 2000)')
+    parser.add_argument('--level', type=float, default=0.95, help='confidence level (default: 0.95)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator (default: 0)')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--no-cleaning', action='store_true', help='use all ratings')
+    args = parser.parse_args()
+    # imported here, as exclusion.py builds on group_estimates.py
+    import exclusion
+
+    print('>> Load item-based data...')
+    data_df = read_item_based_data(args.input)
+    if not args.no_cleaning:
+        shared_items, repeated_items = exclusion.load_item_sets()
+        data_df, _ = exclusion.clean_item_data(data_df, shared_items, repeated_items)
+    ratings = create_rating_arrays(data_df)
+    print(f'{len(ratings["ids"])} participants, {len(ratings["item_numbers"])} items.')
+    rng = np.random.default_rng(args.seed)
+
+    print(f'>> Bootstrap group estimates ({args.replicates} replicates)...')
+    bootstrap_df = bootstrap_estimates(ratings, rng, args.replicates, args.level, args.workers)
+    if args.estimates:
+        aoa_estimates = pd.read_csv(args.estimates)
+        bootstrap_df = aoa_estimates.merge(bootstrap_df, on='item_number', how='left')
+    bootstrap_df.to_csv(args.output, index=False)
+    print(f'Saved bootstrap results of {len(bootstrap_df)} items to {args.output}.')
+
+    print(f'>> Split-half reliability ({args.replicates} splits)...')
+    reliability_df = split_half_reliability(ratings, rng, args.replicates, args.level, args.workers)
+    print(reliability_df.to_string(index=False))
+    if args.lists_output:
+        reliability_df.to_csv(args.lists_output, index=False)
+        print(f'Saved split-half reliability to {args.lists_output}.')
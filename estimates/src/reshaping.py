@@ -0,0 +1,357 @@
+"""
+Vectorised reshaping engine used by `data_wrangling.py`.
+
+Turns the wide SoSci Survey exports (one row per participant, one column per
+item) into the item-based (long) format of `item_based_data.csv`.
+Instead of building every row on its own, all participants of a list are
+melted at once. Item order, list rows and rotation values are found via
+indexes that are built once at load time (see `create_indexes`), so the work
+grows linearly with the number of participants.
+
+With workers > 1, the participants are sharded by list and then into chunks of
+CASE IDs, which are reshaped on a process pool (see `reshape_in_parallel`).
+"""
+
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+# order in which the item types appear for each participant
+FAM_SEGMENT = 0
+LIST_SEGMENT = 1
+CONTROL_SEGMENT = 2
+REPEATED_SEGMENT = 3
+
+
+# INDEXES FOR CONSTANT TIME LOOKUPS
+def create_position_index(keys):
+    """
+    Maps each key to the row position of its first occurrence.
+    Input:
+        keys: column of keys, e.g. survey_start_df['CASE'] or lists_df['REF']
+    Output:
+        position_index: dictionary of the form {key: row position}
+    """
+    position_index = dict()
+    for position, key in enumerate(keys):
+        position_index.setdefault(key, position)
+    return position_index
+
+
+def create_values_index(survey_values_df):
+    """
+    Creates a lookup of the value labels of the survey variables.
+    Input:
+        survey_values_df: values dataframe with columns VAR, RESPONSE, MEANING
+    Output:
+        values_index: dictionary of the form {VAR: {RESPONSE: MEANING}}
+    """
+    values_index = dict()
+    for var, response, meaning in zip(survey_values_df['VAR'], survey_values_df['RESPONSE'], survey_values_df['MEANING']):
+        values_index.setdefault(var, dict()).setdefault(int(response), meaning)
+    return values_index
+
+
+def create_indexes(survey_start_df, lists_df, survey_values_df):
+    """
+    Builds all indexes the reshaping engine needs.
+    Input:
+        survey_start_df: survey data of the introduction pages
+        lists_df: survey data of the lists
+        survey_values_df: values of survey_start (VAR, RESPONSE, MEANING)
+    Output:
+        indexes: dict with the CASE -> row position ('case'),
+                 REF -> row position ('ref') and (VAR, RESPONSE) -> MEANING
+                 ('values') indexes
+    """
+    indexes = {
+        'case': create_position_index(survey_start_df['CASE']),
+        'ref': create_position_index(lists_df['REF']),
+        'values': create_values_index(survey_values_df),
+    }
+    return indexes
+
+
+def lookup_positions(position_index, keys):
+    """
+    Looks up the row positions of several keys at once.
+    Input:
+        position_index: index created by `create_position_index`
+        keys: iterable of keys
+    Output:
+        positions: array of row positions (-1 for unknown keys)
+    """
+    return np.array([position_index.get(key, -1) for key in keys], dtype=int)
+
+
+def create_slot_table(values_index, rotation_columns, key_to_slot, list_control):
+    """
+    Translates every (rotation variable, page number) combination into the
+    slot of the item shown on that page.
+    Input:
+        values_index: index created by `create_values_index`
+        rotation_columns: list specific rotation variables (a/b/c)
+        key_to_slot: dictionary of the form {item key: slot}, item keys being the
+                     item number (as str) or 'r' + item number for repeated items
+        list_control: item numbers of the shared/control items
+    Output:
+        slot_table: array of shape (rotation columns, page numbers + 1);
+                    -1 marks unknown pages, the last column is reserved for missing pages
+    """
+    # without codebook entries, the pages of a rotation variable could not be translated into items
+    missing_variables = [x for x in rotation_columns if x not in values_index]
+    if missing_variables:
+        raise ValueError(f'{len(missing_variables)} rotation variables are missing from the codebook (values_survey_start.csv): '
+                         + ', '.join(missing_variables[:5]) + (', ...' if len(missing_variables) > 5 else ''))
+    max_page = max([max(values_index[var]) for var in rotation_columns])
+    slot_table = np.full((len(rotation_columns), max_page+2), -1, dtype=int)
+    for column_idx, rotation_column in enumerate(rotation_columns):
+        for page_number, meaning in values_index[rotation_column].items():
+            if page_number < 0:
+                continue
+            item_key = meaning.strip()
+            # shared/control items are coded as s1-s31 in the rotation
+            if item_key.startswith('s'):
+                shared_idx = int(item_key.replace('s', ''))-1
+                item_key = str(list_control[shared_idx])
+            slot_table[column_idx, page_number] = key_to_slot.get(item_key, -1)
+    return slot_table
+
+
+def get_order_matrix(page_matrix, slot_lookup, n_slots, start):
+    """
+    Finds out the order of appearance of every slot for every participant.
+    Input:
+        page_matrix: page numbers drawn per participant (rows) and rotation column
+        slot_lookup: function that turns (column positions, page numbers) into slots
+        n_slots: number of slots (items)
+        start: order of appearance of the first rotation column
+    Output:
+        order_matrix: array of shape (participants, slots) with the order of
+                      appearance (NaN if the item was never shown)
+    """
+    n_participants, n_columns = page_matrix.shape
+    missing = np.isnan(page_matrix)
+    pages = np.where(missing, -1, page_matrix).astype(int)
+    column_positions = np.broadcast_to(np.arange(n_columns), pages.shape)
+    slots = slot_lookup(column_positions, pages)
+    valid = (slots >= 0) & ~missing
+    rows = np.broadcast_to(np.arange(n_participants)[:, None], pages.shape)
+    order_matrix = np.full((n_participants, n_slots), np.nan)
+    # as in a dict, later pages overwrite earlier ones
+    order_matrix[rows[valid], slots[valid]] = (column_positions + start)[valid]
+    return order_matrix
+
+
+# MELTING
+def melt_items(source_df, ids, lookup_df, orders, repetition, segment, word_column='NAME1'):
+    """
+    Melts the item columns of all participants into one long dataframe.
+    Input:
+        source_df: participant dataframe (one row per participant) containing
+                   the item and time columns named in lookup_df
+        ids: participant IDs in the row order of source_df
+        lookup_df: lookup dataframe with columns variable_name, time_name,
+                   EXAMPLE, the word column and (optionally) ITEM
+        orders: order of appearance of the items, shape (participants, items)
+        repetition: 0 for original, 1 for repeated items
+        segment: position of the item type within a participant's rows
+        word_column: column of lookup_df holding the item word
+    Output:
+        long_df: dataframe with one row per participant and item
+    """
+    n_participants = len(source_df)
+    n_items = len(lookup_df)
+    # estimates are stored as integers; missing answers stay missing
+    estimates = source_df[list(lookup_df['variable_name'])].to_numpy(dtype=float).ravel()
+    times = source_df[list(lookup_df['time_name'])].to_numpy(dtype=float).ravel()
+    if 'ITEM' in lookup_df.columns:
+        item_numbers = np.tile(lookup_df['ITEM'].to_numpy(), n_participants)
+    else:
+        item_numbers = np.full(n_participants*n_items, np.nan)
+    long_df = pd.DataFrame({
+        'ID': np.repeat(np.asarray(ids), n_items),
+        'item': np.tile(lookup_df[word_column].to_numpy(), n_participants),
+        'item_number': pd.array(item_numbers, dtype='Int64'),
+        'estimate': pd.array(np.trunc(estimates), dtype='Int64'),
+        'example_sentence': np.tile(lookup_df['EXAMPLE'].to_numpy(), n_participants),
+        'repetition': repetition,
+        'order': np.asarray(orders, dtype=float).ravel(),
+        'time': times,
+        'segment': segment,
+        'position': np.tile(np.arange(n_items), n_participants),
+    })
+    return long_df
+
+
+def reshape_list(list_id, design, survey_start_df, lists_df, indexes, example_fam_df, fam_rotation, list_control):
+    """
+    Reshapes all participants of one list (A/B/C) into the item-based format.
+    Input:
+        list_id: A, B or C
+        design: dict with the list's rotation columns, lookup_df,
+                control_lookup_df and rep_lookup_df
+        survey_start_df: survey data of the introduction pages (with a list column)
+        lists_df: survey data of the lists
+        indexes: indexes created by `create_indexes`
+        example_fam_df: familiarisation items with variable and time names
+        fam_rotation: rotation variables of the familiarisation items
+        list_control: item numbers of the shared/control items
+    Output:
+        list_long_df: long dataframe of all participants of the list
+    """
+    # participants who filled out this list, in survey order
+    survey_positions = np.flatnonzero((survey_start_df['list'] == list_id).to_numpy())
+    ids = survey_start_df['CASE'].to_numpy()[survey_positions]
+    list_positions = lookup_positions(indexes['ref'], ids)
+    started = list_positions >= 0
+    survey_df = survey_start_df.iloc[survey_positions[started]]
+    list_df = lists_df.iloc[list_positions[started]]
+    ids = ids[started]
+
+    # fam items: the rotation draws the page number of each fam item
+    fam_pages = survey_df[fam_rotation].to_numpy(dtype=float)
+    n_fam = len(example_fam_df)
+    fam_slot_lookup = lambda columns, pages: np.where((pages >= 1) & (pages <= n_fam), pages-1, -1)
+    fam_orders = get_order_matrix(fam_pages, fam_slot_lookup, n_fam, start=1)
+    fam_df = melt_items(survey_df, ids, example_fam_df, fam_orders, repetition=0, segment=FAM_SEGMENT, word_column='NAME')
+
+    # list + shared/control items + repeated items share one rotation
+    lookups = [
+        (design['lookup_df'], '', 0, LIST_SEGMENT),
+        (design['control_lookup_df'], '', 0, CONTROL_SEGMENT),
+        (design['rep_lookup_df'], 'r', 1, REPEATED_SEGMENT),
+    ]
+    key_to_slot = dict()
+    for lookup_df, prefix, _, _ in lookups:
+        for item_number in lookup_df['ITEM']:
+            key_to_slot.setdefault(prefix+str(item_number), len(key_to_slot))
+    slot_table = create_slot_table(indexes['values'], design['rotation'], key_to_slot, list_control)
+    missing_page = slot_table.shape[1]-1
+    slot_lookup = lambda columns, pages: slot_table[columns, np.where((pages >= 0) & (pages < missing_page), pages, missing_page)]
+    list_pages = survey_df[design['rotation']].to_numpy(dtype=float)
+    list_orders = get_order_matrix(list_pages, slot_lookup, len(key_to_slot), start=11)
+
+    long_dfs = [fam_df]
+    for lookup_df, prefix, repetition, segment in lookups:
+        slots = [key_to_slot[prefix+str(item_number)] for item_number in lookup_df['ITEM']]
+        long_dfs.append(melt_items(list_df, ids, lookup_df, list_orders[:, slots], repetition=repetition, segment=segment))
+    list_long_df = pd.concat(long_dfs, ignore_index=True)
+    return list_long_df
+
+
+# PARALLEL EXECUTION
+# lookup information that every worker process holds once (see `init_worker`)
+worker_state = dict()
+
+
+def init_worker(state):
+    """
+    Stores the lookup information in the worker process.
+    Input:
+        state: dict with lists_df, list_designs, indexes, example_fam_df,
+               fam_rotation and list_control
+    Output:
+        --
+    """
+    worker_state.update(state)
+
+
+def reshape_chunk(task):
+    """
+    Reshapes one chunk of participants of one list.
+    Input:
+        task: tuple (list_id, survey_chunk_df)
+    Output:
+        chunk_long_df: long dataframe of the chunk's participants
+    """
+    list_id, survey_chunk_df = task
+    return reshape_list(list_id, worker_state['list_designs'][list_id], survey_chunk_df, worker_state['lists_df'],
+                        worker_state['indexes'], worker_state['example_fam_df'], worker_state['fam_rotation'],
+                        worker_state['list_control'])
+
+
+def reshape_in_parallel(survey_start_df, lists_df, list_designs, indexes, example_fam_df, fam_rotation, list_control, workers, chunk_size=None):
+    """
+    Reshapes the participants on a process pool, sharded by list and then
+    into chunks of CASE IDs.
+    Falls back to one process where worker processes cannot be forked.
+    Input:
+        survey_start_df: survey data of the introduction pages (with list column)
+        lists_df, list_designs, indexes, example_fam_df, fam_rotation, list_control:
+            see `reshape_to_item_based`
+        workers: number of worker processes
+        chunk_size: participants per chunk (default: every list is spread evenly across the workers)
+    Output:
+        list_dfs: long dataframes of all chunks, in the order of the lists and participants
+    """
+    tasks = []
+    for list_id in list_designs:
+        list_survey_df = survey_start_df[survey_start_df['list'] == list_id]
+        size = chunk_size or max(1, -(-len(list_survey_df) // workers))
+        # lists without participants still yield one (empty) chunk
+        for start in range(0, max(len(list_survey_df), 1), size):
+            tasks.append((list_id, list_survey_df.iloc[start:start+size]))
+
+    state = {
+        'lists_df': lists_df,
+        'list_designs': list_designs,
+        'indexes': indexes,
+        'example_fam_df': example_fam_df,
+        'fam_rotation': fam_rotation,
+        'list_control': list_control,
+    }
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print('Worker processes cannot be forked on this platform, continuing with one process.')
+        init_worker(state)
+        return [reshape_chunk(task) for task in tasks]
+    # forked workers inherit the lookup information once instead of receiving it with every chunk
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes=workers, initializer=init_worker, initargs=(state,)) as pool:
+        # map returns the chunks in the order of the tasks
+        list_dfs = pool.map(reshape_chunk, tasks)
+    return list_dfs
+
+
+def reshape_to_item_based(survey_start_df, lists_df, meta_df, list_designs, indexes, example_fam_df, fam_rotation, list_control, columns, workers=1):
+    """
+    Creates the item-based dataset for all participants at once.
+    Participants who did not get to being assigned a list are skipped.
+    Input:
+        survey_start_df: survey data of the introduction pages
+        lists_df: survey data of the lists
+        meta_df: participant information that stays the same for all items,
+                 indexed by participant ID (see `columns`)
+        list_designs: dict {list_id: design}, see `reshape_list`
+        indexes: indexes created by `create_indexes`
+        example_fam_df: familiarisation items with variable and time names
+        fam_rotation: rotation variables of the familiarisation items
+        list_control: item numbers of the shared/control items
+        columns: columns of the item-based dataset (in order)
+        workers: number of worker processes (1: no process pool)
+    Output:
+        data_df: item-based dataframe, ordered by participant (survey order),
+                 item type and item column
+    """
+    survey_start_df = survey_start_df.assign(list=survey_start_df['CASE'].map(meta_df['list']))
+
+    if workers > 1:
+        list_dfs = reshape_in_parallel(survey_start_df, lists_df, list_designs, indexes, example_fam_df, fam_rotation, list_control, workers)
+    else:
+        list_dfs = []
+        for list_id, design in list_designs.items():
+            list_dfs.append(reshape_list(list_id, design, survey_start_df, lists_df, indexes, example_fam_df, fam_rotation, list_control))
+    data_df = pd.concat(list_dfs, ignore_index=True)
+
+    # restore original row order: participant -> item type -> item column
+    data_df['participant_position'] = lookup_positions(indexes['case'], data_df['ID'])
+    data_df = data_df.sort_values(by=['participant_position', 'segment', 'position'], kind='mergesort')
+    data_df = data_df.drop(columns=['participant_position', 'segment', 'position'])
+
+    # insert participant information that is same for all items
+    meta_columns = [x for x in columns if x in meta_df.columns]
+    data_df = data_df.merge(meta_df[meta_columns], left_on='ID', right_index=True, how='left')
+    data_df['order'] = data_df['order'].astype('Int64')
+    data_df = data_df[columns].reset_index(drop=True)
+    return data_df
@@ -0,0 +1,309 @@
+"""
+Running group estimates that are updated rating by rating instead of being
+recalculated from the whole item-based dataset.
+
+For every item number, the state keeps the number of ratings, the running mean
+and sum of squared deviations (M2, after Welford) of the estimates and of their
+Likert equivalents, and a histogram of the (whole-numbered) estimates from which
+min and max are read. States of different batches can be merged (Chan et al.'s
+pairwise update), and ratings can be removed again, e.g. when a participant is
+excluded (see `exclusion.py`), without going through all ratings once more.
+
+The state is a dict of numpy arrays indexed by item number and is saved as
+.npz file. `get_estimates_overview` returns the same columns as the function
+of the same name in `group_estimates.py`, so live overviews during the data
+collection and the final `aoa_estimates_unique.csv` can be built from it.
+
+Run in terminal with: $ python3 running_estimates.py --state <path> [--add <item-based data>] [--remove-ids ID ...] [--output <path>]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from group_estimates import ESTIMATE_COLUMNS, LIKERT_BOUNDS, add_item_information, rating_to_likert
+from item_schema import read_item_based_data
+
+STATE_VERSION = 1
+# arrays of the state with one entry per item number
+ITEM_ARRAYS = ['count', 'mean', 'm2', 'likert_mean', 'likert_m2']
+
+
+def create_state(n_items=0, max_estimate=0):
+    """
+    Creates an empty state.
+    Input:
+        n_items: highest item number + 1 to reserve space for
+        max_estimate: highest estimate to reserve space for in the histograms
+    Output:
+        state: dict with count, mean, m2, likert_mean, likert_m2 (one entry per
+               item number), histogram (item number x estimate) and the number
+               of ratings per participant (participants)
+    """
+    state = {x: np.zeros(n_items, dtype=(np.int64 if x == 'count' else float)) for x in ITEM_ARRAYS}
+    state['histogram'] = np.zeros((n_items, max_estimate+1), dtype=np.int64)
+    state['participants'] = dict()
+    return state
+
+
+def reserve(state, n_items, max_estimate):
+    """
+    Grows the arrays of a state so that they hold the given item numbers and estimates.
+    Input:
+        state: running estimates (changed in place)
+        n_items: highest item number + 1
+        max_estimate: highest estimate
+    Output:
+        --
+    """
+    old_items, old_width = state['histogram'].shape
+    if n_items > old_items:
+        for array in ITEM_ARRAYS:
+            state[array] = np.concatenate([state[array], np.zeros(n_items-old_items, dtype=state[array].dtype)])
+    if n_items > old_items or max_estimate+1 > old_width:
+        histogram = np.zeros((max(n_items, old_items), max(max_estimate+1, old_width)), dtype=np.int64)
+        histogram[:old_items, :old_width] = state['histogram']
+        state['histogram'] = histogram
+
+
+def summarise_batch(ids, item_numbers, estimates):
+    """
+    Summarises a batch of ratings per item number in one pass.
+    Input:
+        ids: participant IDs of the ratings
+        item_numbers: item numbers of the ratings
+        estimates: estimates of the ratings (whole numbers >= 0)
+    Output:
+        batch: state of the batch (see `create_state`)
+    """
+    item_numbers = np.asarray(item_numbers, dtype=np.int64)
+    estimates = np.asarray(estimates, dtype=float)
+    if np.any(estimates % 1 != 0) or np.any(estimates < 0):
+        raise ValueError('Running estimates need whole-numbered, non-negative estimates.')
+    n_items = int(item_numbers.max(initial=-1)) + 1
+    batch = create_state(n_items, int(estimates.max(initial=0)))
+    count = np.bincount(item_numbers, minlength=n_items)
+    batch['count'] = count
+    for prefix, values in [('', estimates), ('likert_', rating_to_likert(estimates).to_numpy(dtype=float))]:
+        with np.errstate(invalid='ignore'):
+            mean = np.bincount(item_numbers, weights=values, minlength=n_items) / count
+        mean[count == 0] = 0
+        batch[prefix+'mean'] = mean
+        batch[prefix+'m2'] = np.bincount(item_numbers, weights=(values-mean[item_numbers])**2, minlength=n_items)
+    np.add.at(batch['histogram'], (item_numbers, estimates.astype(np.int64)), 1)
+    participant_ids, participant_counts = np.unique(np.asarray(ids), return_counts=True)
+    batch['participants'] = dict(zip(participant_ids.tolist(), participant_counts.tolist()))
+    return batch
+
+
+def combine(state, batch, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) the summary of a batch to/from a state.
+    Input:
+        state: running estimates (changed in place)
+        batch: state of the batch (see `summarise_batch`)
+        sign: 1 or -1
+    Output:
+        --
+    """
+    n_items, width = batch['histogram'].shape
+    reserve(state, n_items, width-1)
+    count_a = state['count'][:n_items]
+    count_b = batch['count']
+    count = count_a + sign*count_b
+    if np.any(count < 0) or np.any(state['histogram'][:n_items, :width] + sign*batch['histogram'] < 0):
+        raise ValueError('Cannot remove ratings that were never added.')
+    participants = {x: state['participants'].get(x, 0) + sign*n for x, n in batch['participants'].items()}
+    if any(x < 0 for x in participants.values()):
+        raise ValueError('Cannot remove ratings of participants that were never added.')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for prefix in ['', 'likert_']:
+            mean_a = state[prefix+'mean'][:n_items]
+            mean_b = batch[prefix+'mean']
+            if sign > 0:
+                delta = mean_b - mean_a
+                mean = mean_a + delta*count_b/count
+                m2 = state[prefix+'m2'][:n_items] + batch[prefix+'m2'] + delta**2*count_a*count_b/count
+            else:
+                # inverse of the pairwise update: mean and M2 of what remains
+                mean = (count_a*mean_a - count_b*mean_b) / count
+                delta = mean_b - mean
+                m2 = state[prefix+'m2'][:n_items] - batch[prefix+'m2'] - delta**2*count*count_b/count_a
+            empty = count == 0
+            mean[empty] = 0
+            m2[empty] = 0
+            # rounding errors must not make the sum of squares negative
+            m2 = np.maximum(m2, 0)
+            unchanged = count_b == 0
+            state[prefix+'mean'][:n_items] = np.where(unchanged, mean_a, mean)
+            state[prefix+'m2'][:n_items] = np.where(unchanged, state[prefix+'m2'][:n_items], m2)
+    state['count'][:n_items] = count
+    state['histogram'][:n_items, :width] += sign*batch['histogram']
+    for participant_id, n_ratings in participants.items():
+        if n_ratings == 0:
+            state['participants'].pop(participant_id, None)
+        else:
+            state['participants'][participant_id] = n_ratings
+
+
+def get_ratings(data_df):
+    """
+    Selects the ratings that count towards the group estimates.
+    Input:
+        data_df: item-based dataframe (or a stream chunk with columns ID, item_number, estimate)
+    Output:
+        ids, item_numbers, estimates: arrays of the ratings with item number and estimate
+    """
+    item_numbers = data_df['item_number'].to_numpy(dtype=float, na_value=np.nan)
+    estimates = data_df['estimate'].to_numpy(dtype=float, na_value=np.nan)
+    rated = ~np.isnan(item_numbers) & ~np.isnan(estimates)
+    return data_df['ID'].to_numpy()[rated], item_numbers[rated], estimates[rated]
+
+
+def add_ratings(state, data_df):
+    """
+    Adds ratings to the running estimates (ratings without item number or estimate are ignored).
+    Input:
+        state: running estimates (changed in place)
+        data_df: dataframe with columns ID, item_number, estimate
+    Output:
+        --
+    """
+    combine(state, summarise_batch(*get_ratings(data_df)), 1)
+
+
+def remove_ratings(state, data_df):
+    """
+    Removes ratings that were added before from the running estimates.
+    Input:
+        state: running estimates (changed in place)
+        data_df: dataframe with columns ID, item_number, estimate
+    Output:
+        --
+    """
+    combine(state, summarise_batch(*get_ratings(data_df)), -1)
+
+
+def remove_participants(state, data_df, ids):
+    """
+    Retracts all ratings of some participants (e.g. after their exclusion).
+    Input:
+        state: running estimates (changed in place)
+        data_df: item-based dataframe with (at least) all ratings of the participants
+        ids: IDs of the participants
+    Output:
+        --
+    """
+    remove_ratings(state, data_df[data_df['ID'].isin(ids).to_numpy(dtype=bool)])
+
+
+def merge_states(state, other):
+    """
+    Merges the running estimates of two disjoint sets of ratings.
+    Input:
+        state: running estimates (changed in place)
+        other: running estimates
+    Output:
+        --
+    """
+    combine(state, other, 1)
+
+
+def get_estimates_overview(state):
+    """
+    Creates the overview of the group estimates from the running estimates.
+    Input:
+        state: running estimates
+    Output:
+        aoa_estimates: dataframe with one row per rated item number (sorted) and
+                       ESTIMATE_COLUMNS (see `group_estimates.get_estimates_overview`)
+    """
+    item_numbers = np.flatnonzero(state['count'])
+    count = state['count'][item_numbers]
+    histogram = state['histogram'][item_numbers] > 0
+    # first and last non-empty bin of the histogram
+    min_estimate = histogram.argmax(axis=1)
+    max_estimate = histogram.shape[1] - 1 - histogram[:, ::-1].argmax(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        aoa_estimates = pd.DataFrame({
+            'item_number': pd.array(item_numbers, dtype='Int64'),
+            'estimate_mean': state['mean'][item_numbers],
+            'estimate_sd': np.where(count > 1, np.sqrt(state['m2'][item_numbers]/(count-1)), np.nan),
+            'min': pd.array(min_estimate, dtype='Int64'),
+            'max': pd.array(max_estimate, dtype='Int64'),
+            'estimateLikert_mean': state['likert_mean'][item_numbers],
+            'estimateLikert_sd': np.where(count > 1, np.sqrt(state['likert_m2'][item_numbers]/(count-1)), np.nan),
+            # the Likert bins are monotonic, so are their extremes
+            'minLikert': pd.array(rating_to_likert(min_estimate), dtype='Int64'),
+            'maxLikert': pd.array(rating_to_likert(max_estimate), dtype='Int64'),
+        })
+    return aoa_estimates[['item_number'] + ESTIMATE_COLUMNS]
+
+
+def save_state(state, path):
+    """
+    Saves the running estimates as .npz file.
+    Input:
+        state: running estimates
+        path: path of the file
+    Output:
+        --
+    """
+    participants = state['participants']
+    with open(path, 'wb') as f:
+        np.savez(f, version=STATE_VERSION, likert_bounds=LIKERT_BOUNDS, histogram=state['histogram'],
+                 participant_ids=np.array(list(participants)), participant_counts=np.array(list(participants.values()), dtype=np.int64),
+                 **{x: state[x] for x in ITEM_ARRAYS})
+
+
+def load_state(path):
+    """
+    Loads running estimates saved with `save_state`.
+    Input:
+        path: path of the .npz file
+    Output:
+        state: running estimates
+    """
+    with np.load(path) as saved:
+        if int(saved['version']) != STATE_VERSION or list(saved['likert_bounds']) != LIKERT_BOUNDS:
+            raise ValueError(f'{path} was saved by an incompatible version, please build it anew.')
+        state = {x: saved[x] for x in ITEM_ARRAYS + ['histogram']}
+        state['participants'] = dict(zip(saved['participant_ids'].tolist(), saved['participant_counts'].tolist()))
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Updates the running group AoA estimates.')
+    parser.add_argument('--state', required=True, help='.npz file with the running estimates (created if missing)')
+    parser.add_argument('--add', metavar='PATH', help='item-based data whose ratings are added')
+    parser.add_argument('--remove-ids', type=int, nargs='+', default=[], help='participants whose ratings are removed (requires --add or --data)')
+    parser.add_argument('--data', default='../data/raw/derivatives/item_based_data.csv',
+                        help='item-based data with the ratings of the removed participants (default: ../data/raw/derivatives/item_based_data.csv)')
+    parser.add_argument('--output', help='path of the csv file with the group estimates')
+    args = parser.parse_args()
+
+    print('>> Load running estimates...')
+    state = load_state(args.state) if os.path.exists(args.state) else create_state()
+    print(f'{int(state["count"].sum())} ratings of {len(state["participants"])} participants.')
+    data_df = None
+    if args.add:
+        print('>> Add ratings...')
+        data_df = read_item_based_data(args.add)
+        add_ratings(state, data_df)
+        print('Done.')
+    if args.remove_ids:
+        print('>> Remove participants...')
+        if data_df is None or not data_df['ID'].isin(args.remove_ids).any():
+            data_df = read_item_based_data(args.data)
+        remove_participants(state, data_df, args.remove_ids)
+        print('Done.')
+    save_state(state, args.state)
+    print(f'Saved {int(state["count"].sum())} ratings of {len(state["participants"])} participants to {args.state}.')
+    if args.output:
+        aoa_estimates = get_estimates_overview(state)
+        if data_df is not None:
+            aoa_estimates = add_item_information(aoa_estimates, data_df)
+        aoa_estimates.to_csv(args.output, index=False)
+        print(f'Saved estimates of {len(aoa_estimates)} items to {args.output}.')
@@ -0,0 +1,210 @@
+"""
+Sensitivity of the group estimates to the cleaning thresholds of
+AoA_estimates_for_MultiPic.Rmd: the correlation cutoff of the participant
+exclusion (0.3) and the range of single ratings around the item mean (2.5 SD).
+
+Everything that does not depend on the thresholds is calculated once:
+- the Kuperman, Birchenough and within-participant correlations of every
+  participant (see `exclusion.py`); a participant is excluded at a cutoff if
+  the lowest of the three is below it,
+- a histogram of the (whole-numbered) estimates per item.
+The cutoffs are then gone through in ascending order, so only the ratings of
+newly excluded participants are taken out of the histogram. For every SD range,
+the outlier rule and the group estimates are evaluated on the histogram
+(items x estimates) instead of the single ratings.
+
+For every grid point, the number of excluded participants and removed ratings
+and the correlations of the estimates with the norms of Birchenough et al.
+(2017) and Schröder et al. (2012) are reported (as in the external reliability
+section of the Rmd); optionally also the estimates of every item.
+
+Run in terminal with: $ python3 threshold_sweep.py --output <path> [--cutoffs 0.1 0.2 0.3] [--sd-ranges 2 2.5 3]
+(default input: ../data/raw/derivatives/item_based_data_add_info.csv)
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import exclusion
+from group_estimates import rating_to_likert
+from item_schema import read_item_based_data
+
+# default grid (10 x 10 points, including the thresholds of the Rmd)
+DEFAULT_CUTOFFS = [0.0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45]
+DEFAULT_SD_RANGES = [1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 3.0, 3.25, 3.5, 3.75]
+# norms of every item the estimates are compared with
+NORM_COLUMNS = ['B: AoA mean', 'S: AoALikert mean']
+
+
+def create_sweep_cache(data_df, shared_items, repeated_items):
+    """
+    Calculates everything that does not depend on the thresholds.
+    Input:
+        data_df: item-based dataframe with norm columns (see merge_database_infos.Rmd)
+        shared_items: item numbers of the shared/control items
+        repeated_items: item numbers of the repeated items
+    Output:
+        cache: dict with
+            min_corr: lowest correlation of every participant (NaN if none could be calculated)
+            id_codes, item_codes, values: participant, item and estimate of every rating
+            item_numbers: item numbers (sorted)
+            norms: dict of the norms of every item (see NORM_COLUMNS)
+            histogram: items x estimates array of the ratings of all participants
+    """
+    data_df = exclusion.remove_implausible_ratings(data_df)
+    ratings = exclusion.get_rating_arrays(data_df)
+    _, corr_dfs = exclusion.find_excluded_participants(data_df, shared_items, repeated_items)
+    # correlations are in the order of ratings['ids']; NaN never leads to exclusion (as in R)
+    min_corr = np.fmin.reduce([x['corr'].to_numpy() for x in corr_dfs.values()])
+    item_codes, item_numbers = pd.factorize(ratings['item_numbers'].astype(int), sort=True)
+    values = ratings['estimates'].astype(int)
+    histogram = np.zeros((len(item_numbers), values.max()+1), dtype=np.int64)
+    np.add.at(histogram, (item_codes, values), 1)
+    first_rows = pd.Series(np.arange(len(data_df))).groupby(item_codes).first().to_numpy()
+    norms = {x: data_df[x].to_numpy(dtype=float, na_value=np.nan)[first_rows] for x in NORM_COLUMNS if x in data_df.columns}
+    return {
+        'ids': ratings['ids'],
+        'min_corr': min_corr,
+        'id_codes': ratings['id_codes'],
+        'item_codes': item_codes,
+        'values': values,
+        'item_numbers': np.asarray(item_numbers),
+        'norms': norms,
+        'histogram': histogram,
+    }
+
+
+def histogram_moments(histogram, values):
+    """
+    Calculates number, mean and standard deviation (n-1) of the ratings of every item.
+    Input:
+        histogram: items x estimates array of rating counts
+        values: estimate of every histogram column
+    Output:
+        n, mean, sd: arrays with one entry per item (mean NaN without ratings, sd NaN with fewer than 2)
+    """
+    n = histogram.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = histogram @ values / n
+        sd = np.sqrt((histogram * (values[None, :]-mean[:, None])**2).sum(axis=1) / (n-1))
+    sd[n < 2] = np.nan
+    return n, mean, sd
+
+
+def correlate(x, y):
+    """
+    Pearson correlation of the items where both values are present.
+    Input:
+        x, y: arrays with one entry per item
+    Output:
+        corr: correlation (NaN for fewer than 2 items)
+        n: number of items
+    """
+    both = ~np.isnan(x) & ~np.isnan(y)
+    if both.sum() < 2:
+        return np.nan, int(both.sum())
+    return np.corrcoef(x[both], y[both])[0, 1], int(both.sum())
+
+
+def evaluate_sd_range(histogram, sd_range):
+    """
+    Applies the outlier rule to the item histograms and calculates the group estimates.
+    Input:
+        histogram: items x estimates array of the ratings of the remaining participants
+        sd_range: allowed distance from the item mean in standard deviations
+    Output:
+        estimates: dict with n (ratings), estimate_mean, estimate_sd, estimateLikert_mean per item
+    """
+    values = np.arange(histogram.shape[1], dtype=float)
+    _, prelim_mean, prelim_sd = histogram_moments(histogram, values)
+    # items with undefined sd lose all ratings (as R's between with NA)
+    with np.errstate(invalid='ignore'):
+        in_sd_range = (values[None, :] >= (prelim_mean-sd_range*prelim_sd)[:, None]) & (values[None, :] <= (prelim_mean+sd_range*prelim_sd)[:, None])
+    kept = np.where(in_sd_range, histogram, 0)
+    n, mean, sd = histogram_moments(kept, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        likert_mean = kept @ rating_to_likert(values).to_numpy(dtype=float) / n
+    return {'n': n, 'estimate_mean': mean, 'estimate_sd': sd, 'estimateLikert_mean': likert_mean}
+
+
+def sweep_thresholds(cache, cutoffs=DEFAULT_CUTOFFS, sd_ranges=DEFAULT_SD_RANGES, keep_estimates=False):
+    """
+    Evaluates all combinations of correlation cutoffs and SD ranges.
+    Input:
+        cache: see `create_sweep_cache` (not changed)
+        cutoffs: exclusion thresholds of the correlations
+        sd_ranges: allowed distances of single ratings from the item mean in standard deviations
+        keep_estimates: if True, the estimates of every item are returned as well
+    Output:
+        summary_df: one row per grid point with cutoff, sd_range, n_excluded, n_ratings,
+                    n_outliers, n_items and the correlations with the norms
+        estimates_df: one row per grid point and item (None if not keep_estimates)
+    """
+    histogram = cache['histogram'].copy()
+    excluded = np.zeros(len(cache['ids']), dtype=bool)
+    rows, estimate_dfs = [], []
+    for cutoff in sorted(cutoffs):
+        # exclusion only grows with the cutoff, so only newly excluded ratings are taken out
+        with np.errstate(invalid='ignore'):
+            newly_excluded = (cache['min_corr'] < cutoff) & ~excluded
+        excluded |= newly_excluded
+        removed = newly_excluded[cache['id_codes']]
+        np.subtract.at(histogram, (cache['item_codes'][removed], cache['values'][removed]), 1)
+        n_ratings = int(histogram.sum())
+        for sd_range in sorted(sd_ranges):
+            estimates = evaluate_sd_range(histogram, sd_range)
+            row = {
+                'cutoff': cutoff,
+                'sd_range': sd_range,
+                'n_excluded': int(excluded.sum()),
+                'n_ratings': int(estimates['n'].sum()),
+                'n_outliers': n_ratings - int(estimates['n'].sum()),
+                'n_items': int((estimates['n'] > 0).sum()),
+            }
+            if 'B: AoA mean' in cache['norms']:
+                row['birchenough_corr'], row['birchenough_n'] = correlate(estimates['estimate_mean'], cache['norms']['B: AoA mean'])
+            if 'S: AoALikert mean' in cache['norms']:
+                row['schroeder_corr_likertlikert'], row['schroeder_n'] = correlate(estimates['estimateLikert_mean'], cache['norms']['S: AoALikert mean'])
+                row['schroeder_corr_estimateslikert'], _ = correlate(estimates['estimate_mean'], cache['norms']['S: AoALikert mean'])
+            rows.append(row)
+            if keep_estimates:
+                rated = estimates['n'] > 0
+                estimate_dfs.append(pd.DataFrame({
+                    'cutoff': cutoff,
+                    'sd_range': sd_range,
+                    'item_number': cache['item_numbers'][rated],
+                    'n_ratings': estimates['n'][rated],
+                    'estimate_mean': estimates['estimate_mean'][rated],
+                    'estimate_sd': estimates['estimate_sd'][rated],
+                    'estimateLikert_mean': estimates['estimateLikert_mean'][rated],
+                }))
+    estimates_df = pd.concat(estimate_dfs, ignore_index=True) if keep_estimates else None
+    return pd.DataFrame(rows), estimates_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluates the group AoA estimates for a grid of cleaning thresholds.')
+    parser.add_argument('--input', default='../data/raw/derivatives/item_based_data_add_info.csv',
+                        help='item-based data (default: ../data/raw/derivatives/item_based_data_add_info.csv)')
+    parser.add_argument('--output', required=True, help='path of the csv file with one row per grid point')
+    parser.add_argument('--estimates-output', help='path of the csv file with the estimates of every item per grid point')
+    parser.add_argument('--cutoffs', type=float, nargs='+', default=DEFAULT_CUTOFFS, help='correlation cutoffs (default: 0 to 0.45 in steps of 0.05)')
+    parser.add_argument('--sd-ranges', type=float, nargs='+', default=DEFAULT_SD_RANGES, help='SD ranges of single ratings (default: 1.5 to 3.75 in steps of 0.25)')
+    args = parser.parse_args()
+
+    print('>> Load item-based data...')
+    data_df = read_item_based_data(args.input)
+    print('Done.')
+    print('>> Calculate correlations and item histograms...')
+    shared_items, repeated_items = exclusion.load_item_sets()
+    cache = create_sweep_cache(data_df, shared_items, repeated_items)
+    print('Done.')
+    print(f'>> Evaluate {len(args.cutoffs)*len(args.sd_ranges)} grid points...')
+    summary_df, estimates_df = sweep_thresholds(cache, args.cutoffs, args.sd_ranges, keep_estimates=bool(args.estimates_output))
+    summary_df.to_csv(args.output, index=False)
+    print(f'Saved summary to {args.output}.')
+    if args.estimates_output:
+        estimates_df.to_csv(args.estimates_output, index=False)
+        print(f'Saved estimates to {args.estimates_output}.')
@@ -7,78 +7,176 @@ as well as the estimate validation:
     - Kuperman (2012)
     - (SUBTLEX-DE; Marc Brysbaert's website currently under construction)
 
-Run with: $ python3 download_corpora.py
+The corpora are downloaded concurrently (one thread per corpus) and streamed to
+disk in chunks, so memory does not grow with the size of the files and the
+whole download takes about as long as the slowest file. Every file is first
+written to `<file>.part`; if a download is interrupted, running the script again
+resumes it where it stopped (if the server supports range requests, otherwise
+it starts over). Zip files are extracted from disk. Corpora that are already
+present are skipped (unless --force).
 
-If you already have those databases saved locally, feel free to change the paths in the 
+Run with: $ python3 download_corpora.py [--workers 5] [--force] [--url <corpus>=<url> ...]
+(corpora: multipic1, multipic5, schroeder, birchenough, kuperman; --url
+downloads a corpus from another location, e.g. a mirror)
+
+If you already have those databases saved locally, feel free to change the paths in the
 specific files to point to your copies instead of downloading them anew.
 """
 
 # import relevant packages
 import os
-import numpy as np
+import shutil
+import argparse
 import pandas as pd
 from sys import exit
-from io import BytesIO
-from urllib.request import urlretrieve
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 from zipfile import ZipFile
 
-def download_corpus(zipurl, filename, save_path):
-    """ Downloads and unpacks a corpus zip-file.
-    Input: 
-        zipurl: zip-file url
-        filename: name of file to be extracted
-        save_path: path/directory in which to save the extracted file
-    Output: 
-        -- 
+# bytes read and written at a time
+CHUNK_SIZE = 1 << 20
+# seconds without data before a download is given up (it can be resumed)
+TIMEOUT = 60
+# corpus -> name, url, target file, file to extract (None: the url is the file itself),
+# and whether the csv file is read and saved again with pandas (as MultiPic version 5 always was)
+CORPORA = {
+    'multipic1': {'name': 'MultiPic version 1', 'url': 'https://www.bcbl.eu/bcbl-corporativa/wp-content/uploads/2016/10/German_MultiPic.zip',
+                  'path': 'multipic/German_MultiPic_version1.csv', 'member': 'German_MultiPic_CSV.csv', 'resave_csv': False},
+    'multipic5': {'name': 'MultiPic version 5', 'url': 'https://figshare.com/ndownloader/files/34462247',
+                  'path': 'multipic/MultiPic_version5.csv', 'member': None, 'resave_csv': True},
+    # 'subtlex': {'name': 'SUBTLEX-DE', 'url': 'https://crr.ugent.be/subtlex-de/SUBTLEX-DE_txt_cleaned_with_Google00.zip',
+    #             'path': 'frequencies/SUBTLEX-DE_cleaned_with_Google00.txt', 'member': 'SUBTLEX-DE_cleaned_with_Google00.txt', 'resave_csv': False},
+    'schroeder': {'name': 'Schröder (2012)', 'url': 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-011-0164-y/MediaObjects/13428_2011_164_MOESM1_ESM.xls',
+                  'path': 'norms/Schröder_2012.xls', 'member': None, 'resave_csv': False},
+    'birchenough': {'name': 'Birchenough (2017)', 'url': 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-016-0718-0/MediaObjects/13428_2016_718_MOESM1_ESM.csv',
+                    'path': 'norms/Birchenough_2017.csv', 'member': None, 'resave_csv': False},
+    'kuperman': {'name': 'Kuperman (2012)', 'url': 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-013-0348-8/MediaObjects/13428_2013_348_MOESM1_ESM.xlsx',
+                 'path': 'norms/Kuperman_2012.xlsx', 'member': None, 'resave_csv': False},
+}
+
+def download_file(url, path, chunk_size=CHUNK_SIZE):
+    """ Downloads a file in chunks, resuming an interrupted download of it.
+    Input:
+        url: file url
+        path: path the file is saved to (via path + '.part')
+        chunk_size: bytes read and written at a time
+    Output:
+        --
     """
-    with urlopen(zipurl) as zipresp:
-            with ZipFile(BytesIO(zipresp.read())) as zfile:
-                zfile.extract(filename, path=save_path)
+    part_path = path + '.part'
+    position = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={position}-'} if position > 0 else dict()
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=TIMEOUT)
+    except HTTPError as error:
+        if error.code != 416 or position == 0:
+            raise
+        # range not satisfiable: the partial file does not fit the file anymore, start over
+        os.remove(part_path)
+        return download_file(url, path, chunk_size)
+    with response:
+        # servers without range requests send the whole file again
+        content_range = response.headers.get('Content-Range', '')
+        if position > 0 and (response.status != 206 or not content_range.startswith(f'bytes {position}-')):
+            position = 0
+        length = response.headers.get('Content-Length')
+        expected_size = position + int(length) if length is not None else None
+        with open(part_path, 'ab' if position > 0 else 'wb') as f:
+            shutil.copyfileobj(response, f, chunk_size)
+            size = f.tell()
+    if expected_size is not None and size != expected_size:
+        raise IOError(f'The download of {url} stopped after {size} of {expected_size} bytes. Please run the script again to resume it.')
+    os.replace(part_path, path)
 
-###########################################################################
-###########################################################################
-print('SCRIPT IS RUNNING')
+def extract_file(zip_path, member, path, chunk_size=CHUNK_SIZE):
+    """ Extracts a single file from a zip file on disk (in chunks).
+    Input:
+        zip_path: path of the zip file
+        member: name of the file within the zip file
+        path: path the extracted file is saved to
+        chunk_size: bytes read and written at a time
+    Output:
+        --
+    """
+    with ZipFile(zip_path) as zfile:
+        with zfile.open(member) as source, open(path + '.part', 'wb') as target:
+            shutil.copyfileobj(source, target, chunk_size)
+    os.replace(path + '.part', path)
 
-# create directories
-print('Creating directories...')
-directories = ['multipic', 'norms', 'frequencies']
-for directory in directories:
-    os.makedirs(directory, exist_ok=True)
-print('Done.')
+def fetch_corpus(corpus, force=False):
+    """ Downloads a corpus (and extracts it from its zip file).
+    Input:
+        corpus: entry of CORPORA
+        force: if True, a corpus that is already present is downloaded anew
+    Output:
+        fetched: False if the corpus was already present, True otherwise
+    """
+    if os.path.exists(corpus['path']) and not force:
+        return False
+    if corpus['member'] is None:
+        download_file(corpus['url'], corpus['path'])
+    else:
+        zip_path = corpus['path'] + '.zip'
+        download_file(corpus['url'], zip_path)
+        extract_file(zip_path, corpus['member'], corpus['path'])
+        os.remove(zip_path)
+    if corpus['resave_csv']:
+        corpus_df = pd.read_csv(corpus['path'], sep=';', decimal=',')
+        corpus_df.to_csv(corpus['path'], sep=';', decimal=',', index=False)
+    return True
 
-# download corpora
-print('\nDownloading corpora...')
-print('> MultiPic version 1...')
-multipic_url = 'https://www.bcbl.eu/bcbl-corporativa/wp-content/uploads/2016/10/German_MultiPic.zip'
-download_corpus(multipic_url, 'German_MultiPic_CSV.csv', 'multipic/')
-os.rename('multipic/German_MultiPic_CSV.csv', 'multipic/German_MultiPic_version1.csv')
-print('> Done.')
+def fetch_corpora(corpora, workers, force=False):
+    """ Downloads several corpora concurrently.
+    Input:
+        corpora: dict {corpus: entry of CORPORA}
+        workers: number of downloads at the same time
+        force: if True, corpora that are already present are downloaded anew
+    Output:
+        failed: dict {corpus: error} of the corpora that could not be downloaded
+    """
+    failed = dict()
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {executor.submit(fetch_corpus, corpus, force): key for key, corpus in corpora.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                fetched = future.result()
+                print(f'> {corpora[key]["name"]}: ' + ('Done.' if fetched else 'already present, skipped.'))
+            except Exception as error:
+                print(f'> {corpora[key]["name"]}: FAILED ({error})')
+                failed[key] = error
+    return failed
 
-print('> MultiPic version 5...')
-multipic_url_5 = 'https://figshare.com/ndownloader/files/34462247'
-multipic_df = pd.read_csv(multipic_url_5, sep=';', decimal=',')
-multipic_df.to_csv('multipic/MultiPic_version5.csv', sep=';', decimal=',',index=False)
-print('> Done.')
+###########################################################################
+###########################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Downloads the corpora needed for the stimuli creation and the estimate validation.')
+    parser.add_argument('--workers', type=int, default=len(CORPORA), help=f'number of downloads at the same time (default: {len(CORPORA)})')
+    parser.add_argument('--force', action='store_true', help='download corpora that are already present anew')
+    parser.add_argument('--url', action='append', default=[], metavar='CORPUS=URL', help='download a corpus from another url (can be repeated)')
+    args = parser.parse_args()
 
-# print('> SUBTLEX-DE...')
-# subtlex_url = 'https://crr.ugent.be/subtlex-de/SUBTLEX-DE_txt_cleaned_with_Google00.zip'
-# download_corpus(subtlex_url, 'SUBTLEX-DE_cleaned_with_Google00.txt', 'frequencies/')
-# print('> Done.')
+    corpora = {key: dict(corpus) for key, corpus in CORPORA.items()}
+    for override in args.url:
+        key, _, url = override.partition('=')
+        if key not in corpora or not url:
+            exit(f'Unknown corpus in --url {override} (expected one of {", ".join(corpora)}).')
+        corpora[key]['url'] = url
 
-print('> Schröder (2012)...')
-schröder_url = 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-011-0164-y/MediaObjects/13428_2011_164_MOESM1_ESM.xls'
-urlretrieve(schröder_url, "norms/Schröder_2012.xls")
-print('> Done.')
+    print('SCRIPT IS RUNNING')
 
-print('> Birchenough (2017)...')
-birchenough_url = 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-016-0718-0/MediaObjects/13428_2016_718_MOESM1_ESM.csv'
-urlretrieve(birchenough_url, 'norms/Birchenough_2017.csv')
-print('> Done.')
+    # create directories
+    print('Creating directories...')
+    directories = ['multipic', 'norms', 'frequencies']
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    print('Done.')
 
-print('> Kuperman (2012)...')
-kuperman_url = 'https://static-content.springer.com/esm/art%3A10.3758%2Fs13428-013-0348-8/MediaObjects/13428_2013_348_MOESM1_ESM.xlsx'
-urlretrieve(kuperman_url, 'norms/Kuperman_2012.xlsx')
-print('> Done.')
+    # download corpora
+    print('\nDownloading corpora...')
+    failed = fetch_corpora(corpora, args.workers, args.force)
+    if failed:
+        exit(f'\n{len(failed)} corpora could not be downloaded. Please run the script again (interrupted downloads are resumed).')
 
-print('\nSCRIPT IS FINISHED')
\ No newline at end of file
+    print('\nSCRIPT IS FINISHED')
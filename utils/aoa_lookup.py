@@ -0,0 +1,257 @@
+"""
+In-memory lookup of the AoA estimates and item information of the MultiPic items.
+
+The lookup is built once from `aoa_estimates_complete.csv` (or its norms
+snapshot, see `norms_snapshot.py`, or a precompiled lookup snapshot, see
+`save_snapshot`) and then answers queries by item number or by
+item name. Names are normalised as in `remove_umlauts` (lowercase, umlauts and
+ß folded, see `normalisation.py`), so 'Mäuse', 'MAEUSE' and 'maeuse' are the same key.
+
+Single queries are dictionary/array lookups; batch queries are vectorised
+(array indexing for item numbers, a hash index for names), so both take
+constant time per key.
+
+Names are not unique in MultiPic: duplicate items (same name and example
+sentence) and homonyms share a name. Name queries return the item with the
+lowest item number; `find_item_numbers` returns all of them.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import aoa_lookup
+    lookup = aoa_lookup.read_lookup('../data/aoa_estimates_complete.csv')
+    aoa_lookup.get_item(lookup, 'Maus')
+    aoa_lookup.lookup_names(lookup, ['maus', 'reifen', 'xyz'], columns=['estimate_mean', 'lgSUBTLEX'])
+
+Compile a snapshot in terminal with: $ python3 aoa_lookup.py --output <path>.npz
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import norms_snapshot
+from normalisation import normalise_word, normalise_words
+
+# columns returned if none are requested
+DEFAULT_COLUMNS = ['estimate_mean', 'H_INDEX', 'VISUAL_COMPLEXITY', 'lgSUBTLEX']
+SNAPSHOT_VERSION = 1
+
+
+def build_lookup(estimates_df):
+    """
+    Builds the lookup from a table with one row per MultiPic item.
+    Input:
+        estimates_df: dataframe with item_number, item and numeric columns (e.g. aoa_estimates_complete.csv)
+    Output:
+        lookup: dict with
+            item_numbers: item number of every row
+            names: normalised name of every row
+            columns: names of the numeric columns
+            values: rows x columns float array
+            number_positions: row of every item number (-1 for unknown numbers)
+            name_index: pandas Index of the unique names, name_positions: row of every unique name
+    """
+    estimates_df = estimates_df.sort_values('item_number', kind='stable').reset_index(drop=True)
+    columns = [x for x in estimates_df.select_dtypes('number').columns if x != 'item_number']
+    return create_lookup(estimates_df['item_number'].to_numpy(dtype=np.int64), normalise_words(estimates_df['item']).to_numpy(),
+                         columns, estimates_df[columns].to_numpy(dtype=float))
+
+
+def create_lookup(item_numbers, names, columns, values):
+    """
+    Creates the indexes of the lookup (see `build_lookup`).
+    Input:
+        item_numbers: item number of every row (ascending)
+        names: normalised name of every row
+        columns: names of the numeric columns
+        values: rows x columns float array
+    Output:
+        lookup: dict (see `build_lookup`)
+    """
+    number_positions = np.full(int(item_numbers.max(initial=0))+1, -1, dtype=np.int64)
+    number_positions[item_numbers] = np.arange(len(item_numbers))
+    # rows are sorted by item number, so the first row of a name has the lowest item number
+    name_positions, name_index = pd.factorize(pd.Series(names, dtype=object))
+    first_positions = np.full(len(name_index), len(names), dtype=np.int64)
+    np.minimum.at(first_positions, name_positions, np.arange(len(names)))
+    return {
+        'item_numbers': item_numbers,
+        'names': np.asarray(names, dtype=object),
+        'columns': list(columns),
+        'values': values,
+        'number_positions': number_positions,
+        'name_index': pd.Index(name_index),
+        'name_positions': first_positions,
+    }
+
+
+def get_positions_by_number(lookup, item_numbers):
+    """
+    Finds the rows of many item numbers at once.
+    Input:
+        lookup: see `build_lookup`
+        item_numbers: array-like of item numbers
+    Output:
+        positions: array of rows (-1 for unknown item numbers)
+    """
+    item_numbers = np.asarray(item_numbers, dtype=np.int64)
+    known = (item_numbers >= 0) & (item_numbers < len(lookup['number_positions']))
+    return np.where(known, lookup['number_positions'][np.where(known, item_numbers, 0)], -1)
+
+
+def get_positions_by_name(lookup, names):
+    """
+    Finds the rows of many item names at once (the item with the lowest item number per name).
+    Input:
+        lookup: see `build_lookup`
+        names: array-like of item names (normalised here)
+    Output:
+        positions: array of rows (-1 for unknown names)
+    """
+    name_codes = lookup['name_index'].get_indexer(normalise_words(names))
+    return np.where(name_codes >= 0, lookup['name_positions'][name_codes], -1)
+
+
+def select_rows(lookup, positions, columns):
+    """
+    Creates the result table of a batch query.
+    Input:
+        lookup: see `build_lookup`
+        positions: row of every query (-1 for queries without match)
+        columns: numeric columns to return (None for DEFAULT_COLUMNS)
+    Output:
+        result_df: dataframe with one row per query: item_number, item and the columns (missing for unknown keys)
+    """
+    columns = columns or DEFAULT_COLUMNS
+    column_positions = [lookup['columns'].index(x) for x in columns]
+    found = positions >= 0
+    rows = np.where(found, positions, 0)
+    result_df = pd.DataFrame({
+        'item_number': pd.array(np.where(found, lookup['item_numbers'][rows], 0), dtype='Int64'),
+        'item': np.where(found, lookup['names'][rows], None),
+    })
+    result_df.loc[~found, 'item_number'] = pd.NA
+    values = lookup['values'][np.ix_(rows, column_positions)]
+    values[~found] = np.nan
+    for i, column in enumerate(columns):
+        result_df[column] = values[:, i]
+    return result_df
+
+
+def lookup_item_numbers(lookup, item_numbers, columns=None):
+    """
+    Looks up many items by their item number.
+    Input:
+        lookup: see `build_lookup`
+        item_numbers: array-like of item numbers
+        columns: numeric columns to return (default: DEFAULT_COLUMNS)
+    Output:
+        result_df: dataframe with one row per item number (in query order)
+    """
+    return select_rows(lookup, get_positions_by_number(lookup, item_numbers), columns)
+
+
+def lookup_names(lookup, names, columns=None):
+    """
+    Looks up many items by their name.
+    Input:
+        lookup: see `build_lookup`
+        names: array-like of item names
+        columns: numeric columns to return (default: DEFAULT_COLUMNS)
+    Output:
+        result_df: dataframe with one row per name (in query order)
+    """
+    return select_rows(lookup, get_positions_by_name(lookup, names), columns)
+
+
+def get_item(lookup, key, columns=None):
+    """
+    Looks up a single item by item number or name.
+    Input:
+        lookup: see `build_lookup`
+        key: item number (int) or item name (str)
+        columns: numeric columns to return (default: all)
+    Output:
+        item: dict with item_number, item and the columns (None for unknown keys)
+    """
+    if isinstance(key, str):
+        name_code = lookup['name_index'].get_indexer([normalise_word(key)])[0]
+        position = lookup['name_positions'][name_code] if name_code >= 0 else -1
+    else:
+        position = get_positions_by_number(lookup, [key])[0]
+    if position < 0:
+        return None
+    item = {'item_number': int(lookup['item_numbers'][position]), 'item': lookup['names'][position]}
+    for column in columns or lookup['columns']:
+        item[column] = lookup['values'][position, lookup['columns'].index(column)]
+    return item
+
+
+def find_item_numbers(lookup, name):
+    """
+    Finds all items with a name (duplicates and homonyms).
+    Input:
+        lookup: see `build_lookup`
+        name: item name
+    Output:
+        item_numbers: array of item numbers (ascending)
+    """
+    return lookup['item_numbers'][lookup['names'] == normalise_word(name)]
+
+
+def save_snapshot(lookup, path):
+    """
+    Saves the lookup as binary snapshot, so it can be loaded without parsing the csv file.
+    Input:
+        lookup: see `build_lookup`
+        path: path of the .npz file
+    Output:
+        --
+    """
+    with open(path, 'wb') as f:
+        np.savez(f, version=SNAPSHOT_VERSION, item_numbers=lookup['item_numbers'], names=lookup['names'].astype(str),
+                 columns=np.array(lookup['columns']), values=lookup['values'])
+
+
+def load_snapshot(path):
+    """
+    Loads a lookup saved with `save_snapshot`.
+    Input:
+        path: path of the .npz file
+    Output:
+        lookup: see `build_lookup`
+    """
+    with np.load(path) as snapshot:
+        if int(snapshot['version']) != SNAPSHOT_VERSION:
+            raise ValueError(f'{path} was saved by an incompatible version, please compile it anew.')
+        return create_lookup(snapshot['item_numbers'], snapshot['names'].astype(object), snapshot['columns'].tolist(), snapshot['values'])
+
+
+def read_lookup(path):
+    """
+    Builds the lookup from a csv file or a norms snapshot (.snap, see
+    `norms_snapshot.py`), or loads it from a lookup snapshot (.npz).
+    Input:
+        path: path of aoa_estimates_complete.csv (or a similar table) or of a snapshot
+    Output:
+        lookup: see `build_lookup`
+    """
+    if path.endswith('.npz'):
+        return load_snapshot(path)
+    if path.endswith('.snap'):
+        return build_lookup(norms_snapshot.read_snapshot(path))
+    return build_lookup(pd.read_csv(path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compiles a snapshot of the AoA lookup.')
+    parser.add_argument('--input', default='../estimates/data/aoa_estimates_complete.csv',
+                        help='table with one row per item (default: ../estimates/data/aoa_estimates_complete.csv)')
+    parser.add_argument('--output', required=True, help='path of the snapshot (.npz)')
+    args = parser.parse_args()
+
+    lookup = read_lookup(args.input)
+    save_snapshot(lookup, args.output)
+    print(f'Saved lookup of {len(lookup["item_numbers"])} items ({len(lookup["name_index"])} names) to {args.output}.')
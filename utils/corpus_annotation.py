@@ -0,0 +1,312 @@
+"""
+Streaming annotation of text corpora (e.g. children's book corpora) with the
+AoA estimates of their tokens.
+
+Files are read lazily in chunks of lines (plain text or gzip), so the memory
+does not grow with the size of the corpus. Text is normalised as in
+`remove_umlauts` (lowercase, umlauts and ß folded, see `normalisation.py`)
+and split into tokens (words of letters, hyphenated words kept together; or on
+whitespace for tokenized files). Tokens are looked up by name in the AoA lookup (see
+`aoa_lookup.py`; names shared by several items get the estimate of the item
+with the lowest item number).
+
+The chunks are annotated on a process pool; at most a few chunks per worker
+are in flight at a time. For every chunk, only the number of tokens and the
+number of occurrences of every known word are sent back per document. As a
+document's words are counted per known word, its mean, maximum and percentiles
+are exact and need memory of the size of the lookup at most, also for
+documents spanning many chunks.
+
+A document is a whole file or (with line documents) a single line.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import aoa_lookup, corpus_annotation
+    lookup = aoa_lookup.read_lookup('../data/aoa_estimates_complete.csv')
+    for documents_df in corpus_annotation.annotate_corpus(['corpus.txt.gz'], lookup, per_line=True, workers=4):
+        ...
+
+Run in terminal with: $ python3 corpus_annotation.py <files> --output <path> [--line-documents] [--workers 4]
+"""
+
+import argparse
+import collections
+import gzip
+import multiprocessing
+import re
+
+import numpy as np
+import pandas as pd
+
+import aoa_lookup
+from normalisation import normalise_text
+
+# lines read per chunk (task of the process pool)
+CHUNK_LINES = 20000
+# chunks in flight per worker process (bounds the memory)
+PENDING_PER_WORKER = 2
+DEFAULT_PERCENTILES = [10, 50, 90]
+# words of letters (hyphenated words are one token) and the document separator
+TOKEN_PATTERN = re.compile(r'[^\W\d_]+(?:-[^\W\d_]+)*|\ue000')
+# separates the documents of a chunk (a token of its own; private use character, neither letter nor whitespace)
+SEPARATOR_TOKEN = '\ue000'
+
+
+def create_annotation_state(lookup, column='estimate_mean', tokenized=False):
+    """
+    Prepares the lookup of the tokens.
+    Input:
+        lookup: see `aoa_lookup.build_lookup`
+        column: numeric lookup column the tokens are annotated with
+        tokenized: if True, tokens are split on whitespace only
+    Output:
+        state: dict with
+            name_index: normalised names (see `aoa_lookup.build_lookup`)
+            name_entries: entry of every name (-1 for names without value)
+            values: value of every entry (ascending)
+            tokenized: see above
+    """
+    values = lookup['values'][lookup['name_positions'], lookup['columns'].index(column)]
+    # entries are sorted by their value, so the words of a document are counted in ascending order
+    order = np.argsort(values, kind='stable')
+    order = order[~np.isnan(values[order])]
+    name_entries = np.full(len(values), -1, dtype=np.int64)
+    name_entries[order] = np.arange(len(order))
+    return {'name_index': lookup['name_index'], 'name_entries': name_entries, 'values': values[order], 'tokenized': tokenized}
+
+
+def open_text(path, encoding='utf-8'):
+    """
+    Opens a (gzip compressed) text file for reading.
+    Input:
+        path: path of the file (.gz files are decompressed)
+        encoding: encoding of the file (undecodable bytes are replaced)
+    Output:
+        f: text file object
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding=encoding, errors='replace')
+    return open(path, 'r', encoding=encoding, errors='replace')
+
+
+def read_chunks(paths, per_line=False, chunk_lines=CHUNK_LINES, encoding='utf-8'):
+    """
+    Reads the files lazily in chunks of lines.
+    Input:
+        paths: list of file paths
+        per_line: if True, every line is a document (else every file)
+        chunk_lines: lines per chunk
+        encoding: encoding of the files
+    Output:
+        chunks: generator of lists [(document, text)] (documents in reading order;
+                a file document is split across consecutive chunks)
+    """
+    for path in paths:
+        with open_text(path, encoding) as f:
+            lines, n_chunks = [], 0
+            for line_number, line in enumerate(f, start=1):
+                lines.append((f'{path}:{line_number}', line) if per_line else line)
+                if len(lines) == chunk_lines:
+                    yield lines if per_line else [(path, ''.join(lines))]
+                    lines, n_chunks = [], n_chunks+1
+            # empty files are still documents
+            if lines or (not per_line and n_chunks == 0):
+                yield lines if per_line else [(path, ''.join(lines))]
+
+
+def count_tokens(state, chunk):
+    """
+    Tokenises a chunk and counts the known words of every document.
+    Input:
+        state: see `create_annotation_state`
+        chunk: list [(document, text)]
+    Output:
+        counts: tuple (documents, n_tokens per document, and document position,
+                entry and number of occurrences of the known words)
+    """
+    documents = [x for x, _ in chunk]
+    # the whole chunk is normalised and tokenised at once, with a separator token between the documents
+    text = normalise_text(f' {SEPARATOR_TOKEN} '.join(x for _, x in chunk))
+    tokens = np.array(text.split() if state['tokenized'] else TOKEN_PATTERN.findall(text), dtype=object)
+    separators = tokens == SEPARATOR_TOKEN
+    n_tokens = np.bincount(np.cumsum(separators)[~separators], minlength=len(chunk))
+    tokens = tokens[~separators]
+    name_codes = state['name_index'].get_indexer(tokens) if len(tokens) else np.zeros(0, dtype=np.int64)
+    entries = np.where(name_codes >= 0, state['name_entries'][name_codes], -1)
+    known = entries >= 0
+    document_positions = np.repeat(np.arange(len(chunk)), n_tokens)[known]
+    # count the occurrences of every (document, entry) pair
+    keys, counts = np.unique(document_positions * len(state['values']) + entries[known], return_counts=True)
+    return documents, n_tokens, keys // len(state['values']), keys % len(state['values']), counts
+
+
+def summarise_documents(documents, n_tokens, document_positions, entries, counts, values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Calculates coverage and AoA statistics of many documents at once.
+    Input:
+        documents: document names
+        n_tokens: number of tokens of every document
+        document_positions, entries, counts: occurrences of the known words,
+            sorted by document position and entry
+        values: value of every entry (ascending)
+        percentiles: percentiles of the values of the known tokens (0-100, interpolated as numpy.percentile)
+    Output:
+        documents_df: dataframe with one row per document: document, n_tokens, n_covered,
+                      coverage, aoa_mean, aoa_max and aoa_p<percentile> (NaN without known tokens)
+    """
+    n_covered = np.bincount(document_positions, weights=counts, minlength=len(documents)).astype(np.int64)
+    cumulative = np.cumsum(counts)
+    # tokens of all previous documents (start of every document in cumulative)
+    offsets = np.cumsum(n_covered) - n_covered
+    with np.errstate(invalid='ignore', divide='ignore'):
+        documents_df = pd.DataFrame({
+            'document': documents,
+            'n_tokens': n_tokens,
+            'n_covered': n_covered,
+            'coverage': n_covered / n_tokens,
+            'aoa_mean': np.bincount(document_positions, weights=counts*values[entries], minlength=len(documents)) / n_covered,
+        })
+    covered = n_covered > 0
+
+    def value_at(ranks):
+        # value of the token with the given rank (0-based) within its document
+        positions = np.searchsorted(cumulative, offsets[covered] + ranks, side='right')
+        values_at = np.full(len(documents), np.nan)
+        values_at[covered] = values[entries[positions]]
+        return values_at
+
+    documents_df['aoa_max'] = value_at(n_covered[covered] - 1)
+    for percentile in percentiles:
+        ranks = percentile / 100 * (n_covered[covered] - 1)
+        lower, upper = value_at(np.floor(ranks).astype(np.int64)), value_at(np.ceil(ranks).astype(np.int64))
+        fraction = np.zeros(len(documents))
+        fraction[covered] = ranks - np.floor(ranks)
+        documents_df[f'aoa_p{percentile:g}'] = lower + (upper - lower) * fraction
+    return documents_df
+
+
+# PARALLEL EXECUTION
+# token lookup that every worker process holds once (see `init_worker`)
+worker_state = dict()
+
+
+def init_worker(state):
+    """
+    Stores the token lookup in the worker process.
+    Input:
+        state: see `create_annotation_state`
+    Output:
+        --
+    """
+    worker_state.update(state)
+
+
+def count_chunk(chunk):
+    """
+    Counts the tokens of one chunk in a worker process (see `count_tokens`).
+    Input:
+        chunk: list [(document, text)]
+    Output:
+        counts: see `count_tokens`
+    """
+    return count_tokens(worker_state, chunk)
+
+
+def count_chunks(state, chunks, workers):
+    """
+    Counts the tokens of all chunks on a process pool with a bounded number of
+    chunks in flight (or in this process with workers=1 or where worker
+    processes cannot be forked).
+    Input:
+        state: see `create_annotation_state`
+        chunks: iterable of chunks (see `read_chunks`)
+        workers: number of worker processes
+    Output:
+        counts: generator of the counts of every chunk, in the order of the chunks
+    """
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for chunk in chunks:
+            yield count_tokens(state, chunk)
+        return
+    # Pool.imap would read ahead the whole corpus, so chunks are submitted one by one
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes=workers, initializer=init_worker, initargs=(state,)) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(count_chunk, (chunk,)))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def annotate_corpus(paths, lookup, column='estimate_mean', per_line=False, tokenized=False, percentiles=DEFAULT_PERCENTILES,
+                    workers=1, chunk_lines=CHUNK_LINES, encoding='utf-8'):
+    """
+    Annotates the documents of a corpus with the AoA estimates of their tokens, in one pass.
+    Input:
+        paths: list of file paths (plain text or .gz)
+        lookup: see `aoa_lookup.build_lookup`
+        column: numeric lookup column the tokens are annotated with
+        per_line: if True, every line is a document (else every file)
+        tokenized: if True, tokens are split on whitespace only
+        percentiles: percentiles of the AoA of the known tokens of a document
+        workers: number of worker processes
+        chunk_lines: lines per chunk
+        encoding: encoding of the files
+    Output:
+        documents_dfs: generator of dataframes of consecutive documents (see `summarise_documents`)
+    """
+    state = create_annotation_state(lookup, column, tokenized)
+    # the last document of a chunk may continue in the next chunk
+    pending = None
+    for documents, n_tokens, document_positions, entries, counts in count_chunks(state, read_chunks(paths, per_line, chunk_lines, encoding), workers):
+        if pending is not None and documents[0] == pending[0][0]:
+            n_tokens[0] += pending[1][0]
+            document_positions = np.concatenate([pending[2], document_positions])
+            entries, counts = np.concatenate([pending[3], entries]), np.concatenate([pending[4], counts])
+            # occurrences stay sorted by document and entry, words found in both chunks are merged
+            # (so a document spanning many chunks does not grow by every chunk)
+            keys, inverse = np.unique(document_positions * len(state['values']) + entries, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(counts.dtype)
+            document_positions, entries = keys // len(state['values']), keys % len(state['values'])
+        elif pending is not None:
+            yield summarise_documents(*pending, state['values'], percentiles)
+        last = len(documents) - 1
+        in_last = document_positions == last
+        pending = ([documents[last]], n_tokens[last:], document_positions[in_last] - last, entries[in_last], counts[in_last])
+        if last > 0:
+            yield summarise_documents(documents[:last], n_tokens[:last], document_positions[~in_last], entries[~in_last], counts[~in_last],
+                                      state['values'], percentiles)
+    if pending is not None:
+        yield summarise_documents(*pending, state['values'], percentiles)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotates the documents of a text corpus with the AoA estimates of their tokens.')
+    parser.add_argument('paths', nargs='+', help='text files of the corpus (plain text or .gz)')
+    parser.add_argument('--output', required=True, help='path of the csv file with one row per document')
+    parser.add_argument('--estimates', default='../estimates/data/aoa_estimates_complete.csv',
+                        help='AoA estimates, csv file or snapshot (default: ../estimates/data/aoa_estimates_complete.csv)')
+    parser.add_argument('--column', default='estimate_mean', help='column the tokens are annotated with (default: estimate_mean)')
+    parser.add_argument('--line-documents', action='store_true', help='every line is a document (default: every file)')
+    parser.add_argument('--tokenized', action='store_true', help='the files are tokenized (tokens are separated by whitespace)')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=DEFAULT_PERCENTILES, help='AoA percentiles per document (default: 10 50 90)')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--chunk-lines', type=int, default=CHUNK_LINES, help=f'lines per chunk (default: {CHUNK_LINES})')
+    parser.add_argument('--encoding', default='utf-8', help='encoding of the files (default: utf-8)')
+    args = parser.parse_args()
+
+    print('>> Load AoA estimates...')
+    lookup = aoa_lookup.read_lookup(args.estimates)
+    print('Done.')
+    print('>> Annotate documents...')
+    n_documents = 0
+    # documents are written as soon as they are complete
+    with open(args.output, 'w', newline='') as f:
+        for documents_df in annotate_corpus(args.paths, lookup, args.column, args.line_documents, args.tokenized, args.percentiles,
+                                            args.workers, args.chunk_lines, args.encoding):
+            documents_df.to_csv(f, index=False, header=n_documents == 0)
+            n_documents += len(documents_df)
+    print(f'Saved {n_documents} documents to {args.output}.')
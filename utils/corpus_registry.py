@@ -0,0 +1,289 @@
+"""
+Registry of the external corpora (see `download_corpora.py`) with loaders that
+parse every corpus only once.
+
+The scripts used to read the raw files themselves, each with its own options
+(latin-1 for Birchenough, ';' with ',' decimals for MultiPic, two header rows
+for the Schröder xls file, ...). `load('birchenough')` instead:
+- downloads the corpus from its url in `download_corpora.CORPORA` if it is missing,
+- checks the SHA-256 checksum of the file against the one pinned in the
+  manifest (`external_resources/corpora_manifest.json`, part of the repository);
+  a file that no longer matches is downloaded anew, a matching one is never
+  downloaded again. If the downloaded file does not match either (e.g. it was
+  changed at the source), a ValueError is raised; after checking the file, its
+  checksum is pinned with --update-manifest. Corpora without a pinned checksum
+  are used with a warning until their checksum is pinned,
+- parses the file with the options in READERS once and saves the table as norms
+  snapshot (see `norms_snapshot.py`) in `external_resources/.corpus_cache`,
+  named by the checksum of the file and the read options,
+- maps the snapshot (numeric columns keep their dtype, strings are decoded on demand).
+As long as the checksum matches, later loads only map the cached snapshot. The
+checksum is only computed again once size or modification time of the file change
+(recorded locally in `external_resources/.corpus_cache/stamps.json`).
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import corpus_registry
+    aoa_df = corpus_registry.load('birchenough')
+    schröder_df = corpus_registry.load('schroeder', columns=['german', 'S: AoALikert mean'])
+
+Fetch and cache corpora in terminal with: $ python3 corpus_registry.py [<corpus> ...] [--force] [--update-manifest]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import pandas as pd
+
+import norms_snapshot
+
+RESOURCES_DIRECTORY = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'external_resources'))
+sys.path.append(RESOURCES_DIRECTORY)
+from download_corpora import CORPORA, fetch_corpus
+
+MANIFEST_PATH = os.path.join(RESOURCES_DIRECTORY, 'corpora_manifest.json')
+CACHE_DIRECTORY = os.path.join(RESOURCES_DIRECTORY, '.corpus_cache')
+# size, modification time and checksum of the local files (not part of the repository)
+STAMPS_PATH = os.path.join(CACHE_DIRECTORY, 'stamps.json')
+# changes whenever the cached tables would be built differently
+CACHE_VERSION = 1
+# bytes hashed at a time
+CHUNK_SIZE = 1 << 20
+# column names of Schröder et al. (2012), see `read_schröder` in helper_functions.R
+SCHROEDER_COLUMNS = ['german', 'translation', 'semantic category', 'generation nb total', 'generation % total', 'typicality mean',
+                     'typicality SD', 'S: AoALikert mean', 'S: AoALikert SD', 'familiarity mean', 'familiarity SD',
+                     'DLEXDB normalized lemma freq per million', 'DLEXDB normalized log10 lemma freq', 'nb phonemes', 'nb syllables']
+# corpus -> (function reading the raw file, its options)
+READERS = {
+    'multipic1': (pd.read_csv, {'sep': ';', 'decimal': ','}),
+    'multipic5': (pd.read_csv, {'sep': ';', 'decimal': ','}),
+    'schroeder': (pd.read_excel, {'header': None, 'skiprows': 2, 'names': SCHROEDER_COLUMNS}),
+    'birchenough': (pd.read_csv, {'encoding': 'latin1'}),
+    'kuperman': (pd.read_excel, dict()),
+}
+
+# corpus -> mapped snapshot, opened once per process
+opened = dict()
+
+
+def get_corpus_path(corpus):
+    """
+    Returns the path of the raw file of a corpus.
+    Input:
+        corpus: key of CORPORA (e.g. 'birchenough')
+    Output:
+        path: path of the file in external_resources
+    """
+    if corpus not in CORPORA:
+        raise KeyError(f'Unknown corpus {corpus} (expected one of {", ".join(CORPORA)}).')
+    return os.path.join(RESOURCES_DIRECTORY, CORPORA[corpus]['path'])
+
+
+def read_manifest(path=MANIFEST_PATH):
+    """
+    Reads the manifest of the pinned checksums (or the stamps of the local files).
+    Input:
+        path: path of the manifest (or STAMPS_PATH)
+    Output:
+        manifest: dict {corpus: dict with url, path, sha256 (None: not pinned yet)}
+                  (stamps: dict {corpus: dict with sha256, size, mtime_ns})
+    """
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    """
+    Saves the manifest or the stamps (via a temporary file, so readers never see half a file).
+    Input:
+        manifest: see `read_manifest`
+        path: path of the manifest (or STAMPS_PATH)
+    Output:
+        --
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def get_checksum(path, entry=None):
+    """
+    Returns the SHA-256 checksum of a file, reusing the recorded one as long as
+    size and modification time of the file are unchanged.
+    Input:
+        path: path of the file
+        entry: optional stamp of the file (see `record_stamp`)
+    Output:
+        checksum: hex string
+    """
+    stat = os.stat(path)
+    if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return entry['sha256']
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def record_stamp(corpus, checksum):
+    """
+    Records size, modification time and checksum of a local corpus file (see `get_checksum`).
+    Input:
+        corpus: key of CORPORA
+        checksum: SHA-256 checksum of the file
+    Output:
+        entry: stamp of the file
+    """
+    stat = os.stat(get_corpus_path(corpus))
+    entry = {'sha256': checksum, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    stamps = read_manifest(STAMPS_PATH)
+    if stamps.get(corpus) != entry:
+        stamps[corpus] = entry
+        write_manifest(stamps, STAMPS_PATH)
+    return entry
+
+
+def pin_checksum(corpus, checksum, manifest):
+    """
+    Pins the checksum of a corpus file in the manifest (and saves it).
+    Input:
+        corpus: key of CORPORA
+        checksum: SHA-256 checksum of the file
+        manifest: see `read_manifest`
+    Output:
+        --
+    """
+    entry = {'url': CORPORA[corpus]['url'], 'path': CORPORA[corpus]['path'], 'sha256': checksum}
+    if manifest.get(corpus) != entry:
+        print(f'... {CORPORA[corpus]["name"]}: pinned checksum {checksum} in {MANIFEST_PATH}')
+        manifest[corpus] = entry
+        write_manifest(manifest)
+
+
+def fetch(corpus, force=False, update_manifest=False):
+    """
+    Makes sure the file of a corpus is present and matches the manifest: it is
+    downloaded if it is missing or its checksum differs from the pinned one.
+    Input:
+        corpus: key of CORPORA
+        force: if True, the file is downloaded anew in any case
+        update_manifest: if True, the checksum of the file is pinned in the manifest
+                         (else a downloaded file that does not match raises a ValueError)
+    Output:
+        checksum: SHA-256 checksum of the file
+    """
+    path = get_corpus_path(corpus)
+    manifest = read_manifest()
+    pinned = manifest.get(corpus, dict()).get('sha256')
+    checksum = None
+    if os.path.exists(path) and not force:
+        checksum = get_checksum(path, read_manifest(STAMPS_PATH).get(corpus))
+        record_stamp(corpus, checksum)
+        if pinned is not None and checksum != pinned and not update_manifest:
+            print(f'... {CORPORA[corpus]["name"]}: checksum does not match the manifest, downloading it anew')
+            checksum = None
+    if checksum is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fetch_corpus(dict(CORPORA[corpus], path=path), force=True)
+        checksum = get_checksum(path)
+        record_stamp(corpus, checksum)
+    if update_manifest:
+        pin_checksum(corpus, checksum, manifest)
+    elif pinned is None:
+        print(f'WARNING: no checksum of {CORPORA[corpus]["name"]} is pinned in {MANIFEST_PATH}; after checking {path}, '
+              f'pin its checksum with `python3 corpus_registry.py {corpus} --update-manifest`.')
+    elif checksum != pinned:
+        raise ValueError(f'The downloaded file of {CORPORA[corpus]["name"]} ({path}) does not match the checksum pinned in the manifest '
+                         f'({checksum} instead of {pinned}), it may have been changed at the source. After checking the file, pin '
+                         f'its checksum with `python3 corpus_registry.py {corpus} --update-manifest`.')
+    return checksum
+
+
+def get_cache_path(corpus, checksum):
+    """
+    Determines where the parsed table of a corpus is cached.
+    Input:
+        corpus: key of READERS
+        checksum: SHA-256 checksum of the raw file
+    Output:
+        cache_path: path of the snapshot
+    """
+    read, options = READERS[corpus]
+    key = hashlib.sha256(repr((CACHE_VERSION, checksum, read.__name__, sorted(options.items()))).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIRECTORY, f'{corpus}_{key}.snap')
+
+
+def build_cache(corpus, cache_path):
+    """
+    Parses the raw file of a corpus and saves it as snapshot (removing older
+    snapshots of the corpus).
+    Input:
+        corpus: key of READERS
+        cache_path: see `get_cache_path`
+    Output:
+        --
+    """
+    read, options = READERS[corpus]
+    df = read(get_corpus_path(corpus), **options)
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    norms_snapshot.write_snapshot(df, tmp_path, metadata={'corpus': corpus, 'cache_version': CACHE_VERSION})
+    os.replace(tmp_path, cache_path)
+    for old_path in glob.glob(os.path.join(CACHE_DIRECTORY, f'{corpus}_*.snap')):
+        if old_path != cache_path:
+            os.remove(old_path)
+
+
+def open_corpus(corpus, force=False, update_manifest=False):
+    """
+    Maps the parsed table of a corpus, fetching and parsing it first if needed.
+    Input:
+        corpus: key of READERS (e.g. 'birchenough')
+        force: if True, the corpus is downloaded and parsed anew
+        update_manifest: if True, the checksum of the file is pinned in the manifest (see `fetch`)
+    Output:
+        snapshot: mapped snapshot (see `norms_snapshot.open_snapshot`)
+    """
+    if corpus not in READERS:
+        raise KeyError(f'No loader for corpus {corpus} (expected one of {", ".join(READERS)}).')
+    if corpus in opened and not force:
+        return opened[corpus]
+    cache_path = get_cache_path(corpus, fetch(corpus, force, update_manifest))
+    if force or not os.path.exists(cache_path):
+        build_cache(corpus, cache_path)
+    opened[corpus] = norms_snapshot.open_snapshot(cache_path)
+    return opened[corpus]
+
+
+def load(corpus, columns=None):
+    """
+    Loads the table of a corpus (see `open_corpus`).
+    Input:
+        corpus: key of READERS (e.g. 'birchenough')
+        columns: columns to include (default: all)
+    Output:
+        df: dataframe
+    """
+    return norms_snapshot.to_dataframe(open_corpus(corpus), columns)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fetches the corpora, checks their checksums and caches their parsed tables.')
+    parser.add_argument('corpora', nargs='*', default=list(READERS), help=f'corpora (default: all of {", ".join(READERS)})')
+    parser.add_argument('--force', action='store_true', help='download and parse the corpora anew')
+    parser.add_argument('--update-manifest', action='store_true', help='pin the checksums of the (checked) files in the manifest')
+    args = parser.parse_args()
+
+    for corpus in args.corpora:
+        snapshot = open_corpus(corpus, args.force, args.update_manifest)
+        print(f'> {CORPORA[corpus]["name"]}: {snapshot["n_rows"]} rows -> {snapshot["path"]}')
@@ -0,0 +1,248 @@
+"""
+Stage-level instrumentation for the pipeline scripts.
+
+A script is divided into named stages (e.g. 'load data', 'create item-based
+dataset'). For every stage, the wall time, CPU time (including worker
+processes), peak memory and the number of rows going in and out are recorded.
+With --report, the measurements are saved as json run report; with
+--profile-stage, one stage is run under cProfile and the statistics are dumped
+for inspection (e.g. with `python3 -m pstats <file>` or snakeviz).
+
+Peak memory is the resident set size (RSS) of the script and its worker
+processes, sampled in the background if psutil is installed (otherwise the
+highest RSS of the script so far). With --trace-memory, the peak of memory
+allocated by Python (tracemalloc) is recorded as well; this slows the script
+down considerably.
+
+Usage:
+    import argparse, sys
+    sys.path.append('../../utils')
+    import instrumentation
+    parser = argparse.ArgumentParser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    run = instrumentation.start_run('data_wrangling', args)
+    instrumentation.start_stage(run, 'load data')
+    ...
+    instrumentation.end_stage(run, rows_out=len(df))
+    instrumentation.save_report(run)
+"""
+
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# seconds between two memory samples
+SAMPLE_INTERVAL = 0.01
+
+
+def add_arguments(parser):
+    """
+    Adds the instrumentation options to the command line arguments of a script.
+    Input:
+        parser: argparse.ArgumentParser of the script
+    Output:
+        --
+    """
+    parser.add_argument('--report', metavar='PATH', help='save a json run report with time and memory per stage')
+    parser.add_argument('--profile-stage', metavar='STAGE', help='run this stage under cProfile')
+    parser.add_argument('--profile-output', metavar='PATH', help='where to dump the profile (default: <script>_<stage>.prof)')
+    parser.add_argument('--trace-memory', action='store_true', help='also record the peak of memory allocated by Python (slow)')
+
+
+def get_rss_mb(process):
+    """
+    Returns the current RSS of a process and all its child processes.
+    Input:
+        process: psutil.Process
+    Output:
+        rss: RSS in MB
+    """
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # worker process ended in the meantime
+            pass
+    return rss / 1024**2
+
+
+def get_max_rss_mb():
+    """
+    Returns the highest RSS the script (or one of its finished worker processes) had so far.
+    Input:
+        --
+    Output:
+        max_rss: RSS in MB
+    """
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return max_rss / 1024**2
+    return max_rss / 1024
+
+
+def sample_memory(sampler):
+    """
+    Samples the RSS of the script until the stage ends (runs in a thread).
+    Input:
+        sampler: dict with psutil process, stop event and peak so far
+    Output:
+        --
+    """
+    while not sampler['stop'].is_set():
+        sampler['peak'] = max(sampler['peak'], get_rss_mb(sampler['process']))
+        sampler['stop'].wait(SAMPLE_INTERVAL)
+
+
+def get_cpu_time():
+    """
+    Returns the CPU time used by the script and its finished worker processes.
+    Input:
+        --
+    Output:
+        cpu_time: user + system time in seconds
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def start_run(script, args=None):
+    """
+    Starts the instrumentation of a script run.
+    Input:
+        script: name of the script (used in the report and profile names)
+        args: parsed command line arguments (see `add_arguments`), None to only measure
+    Output:
+        run: dict holding the state of the run
+    """
+    run = {
+        'script': script,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'argv': sys.argv[1:],
+        'python': platform.python_version(),
+        'start_wall': time.perf_counter(),
+        'start_cpu': get_cpu_time(),
+        'report_path': getattr(args, 'report', None),
+        'profile_stage': getattr(args, 'profile_stage', None),
+        'profile_output': getattr(args, 'profile_output', None),
+        'trace_memory': getattr(args, 'trace_memory', False),
+        'stages': [],
+        'current': None,
+    }
+    return run
+
+
+def start_stage(run, name, rows_in=None):
+    """
+    Starts measuring a stage (a still running stage is ended first).
+    Input:
+        run: run dict (see `start_run`)
+        name: name of the stage
+        rows_in: number of rows going into the stage (optional)
+    Output:
+        --
+    """
+    if run['current'] is not None:
+        end_stage(run)
+    current = {
+        'record': {'stage': name, 'rows_in': rows_in, 'rows_out': None},
+        'start_wall': time.perf_counter(),
+        'start_cpu': get_cpu_time(),
+        'sampler': None,
+        'profiler': None,
+    }
+    if psutil is not None:
+        process = psutil.Process()
+        sampler = {'process': process, 'stop': threading.Event(), 'peak': get_rss_mb(process)}
+        current['record']['rss_start_mb'] = sampler['peak']
+        sampler['thread'] = threading.Thread(target=sample_memory, args=(sampler,), daemon=True)
+        sampler['thread'].start()
+        current['sampler'] = sampler
+    if run['trace_memory']:
+        # restart to reset the peak of the previous stage
+        tracemalloc.stop()
+        tracemalloc.start()
+    if name == run['profile_stage']:
+        current['profiler'] = cProfile.Profile()
+        current['profiler'].enable()
+    run['current'] = current
+
+
+def end_stage(run, rows_out=None):
+    """
+    Ends measuring the running stage and records its measurements.
+    Input:
+        run: run dict (see `start_run`)
+        rows_out: number of rows coming out of the stage (optional)
+    Output:
+        record: dict with the measurements of the stage
+    """
+    current = run['current']
+    if current is None:
+        return None
+    record = current['record']
+    if current['profiler'] is not None:
+        current['profiler'].disable()
+        profile_path = run['profile_output'] or f"{run['script']}_{record['stage'].replace(' ', '_')}.prof"
+        current['profiler'].dump_stats(profile_path)
+        record['profile'] = profile_path
+    record['wall_time'] = time.perf_counter() - current['start_wall']
+    record['cpu_time'] = get_cpu_time() - current['start_cpu']
+    record['rows_out'] = rows_out
+    sampler = current['sampler']
+    if sampler is not None:
+        sampler['stop'].set()
+        sampler['thread'].join()
+        record['rss_end_mb'] = get_rss_mb(sampler['process'])
+        record['peak_rss_mb'] = max(sampler['peak'], record['rss_end_mb'])
+    else:
+        record['peak_rss_mb'] = get_max_rss_mb()
+    if run['trace_memory']:
+        record['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024**2
+    run['stages'].append(record)
+    run['current'] = None
+    return record
+
+
+def save_report(run, report_path=None):
+    """
+    Ends the running stage and saves the run report (if a path was given).
+    Input:
+        run: run dict (see `start_run`)
+        report_path: path of the json report (default: the --report argument)
+    Output:
+        report: dict with the measurements of the run
+    """
+    end_stage(run)
+    report = {
+        'script': run['script'],
+        'started': run['started'],
+        'argv': run['argv'],
+        'python': run['python'],
+        'wall_time': time.perf_counter() - run['start_wall'],
+        'cpu_time': get_cpu_time() - run['start_cpu'],
+        'peak_rss_mb': max([x['peak_rss_mb'] for x in run['stages']] + [get_max_rss_mb()]),
+        'stages': run['stages'],
+    }
+    report_path = report_path or run['report_path']
+    if report_path:
+        report_directory = os.path.dirname(os.path.abspath(report_path))
+        os.makedirs(report_directory, exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Run report saved to {report_path}.')
+    return report
@@ -0,0 +1,93 @@
+"""
+Normalisation of German words, so names from MultiPic, the external norms,
+SUBTLEX-DE and text corpora can be compared (the Python counterpart of
+`remove_umlauts` in helper_functions.R):
+- Unicode NFC (decomposed umlauts, e.g. 'a' + combining diaeresis, become 'ä'),
+- lowercase,
+- umlauts and ß folded (ä -> ae, ö -> oe, ü -> ue, ß -> ss),
+- optionally, hyphens removed (e.g. 'u-boot' -> 'uboot'),
+- optionally, exceptions replaced after all other steps (e.g. MULTIPIC_SPELLINGS).
+For composed input, the result is the same as that of `remove_umlauts`.
+
+Whole columns are normalised at once: the words are joined into a single
+string, which is normalised with a few C-level string operations and split
+again, instead of calling Python functions for every word.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    from normalisation import normalise_words, MULTIPIC_SPELLINGS
+    norms_df['NAME1'] = normalise_words(norms_df['german'], exceptions=MULTIPIC_SPELLINGS)
+"""
+
+import unicodedata
+
+import pandas as pd
+
+# umlauts and ß as folded by `remove_umlauts` (in this order)
+UMLAUT_REPLACEMENTS = {'ß': 'ss', 'ä': 'ae', 'ö': 'oe', 'ü': 'ue'}
+# normalised names of the external norms that are spelled differently in MultiPic (see `read_schröder`)
+MULTIPIC_SPELLINGS = {'chamaeleon': 'chameleon'}
+# joins the words of a column (words containing it are normalised one by one)
+SEPARATOR = '\n'
+
+
+def normalise_text(text, strip_hyphens=False):
+    """
+    Normalises a string (NFC, lowercase, umlauts and ß folded).
+    Input:
+        text: string (a word or a whole text)
+        strip_hyphens: if True, hyphens are removed
+    Output:
+        normalised_text: string
+    """
+    text = unicodedata.normalize('NFC', text).lower()
+    for umlaut, replacement in UMLAUT_REPLACEMENTS.items():
+        text = text.replace(umlaut, replacement)
+    if strip_hyphens:
+        text = text.replace('-', '')
+    return text
+
+
+def normalise_word(word, strip_hyphens=False, exceptions=None):
+    """
+    Normalises a single word (see `normalise_text`).
+    Input:
+        word: string
+        strip_hyphens: if True, hyphens are removed
+        exceptions: optional dict {normalised word: replacement}
+    Output:
+        normalised_word: string
+    """
+    word = normalise_text(word, strip_hyphens)
+    return exceptions.get(word, word) if exceptions else word
+
+
+def normalise_words(words, strip_hyphens=False, exceptions=None):
+    """
+    Normalises many words at once (see `normalise_text`).
+    Input:
+        words: array-like of strings (missing values stay missing)
+        strip_hyphens: if True, hyphens are removed
+        exceptions: optional dict {normalised word: replacement}
+    Output:
+        normalised_words: pandas Series of strings (with the index of words if it is a Series)
+    """
+    words = pd.Series(words, dtype=object) if not isinstance(words, pd.Series) else words.astype(object)
+    present = words.notna().to_numpy()
+    values = words.to_numpy()[present]
+    try:
+        joined = SEPARATOR.join(values)
+    except TypeError:
+        # not only strings (e.g. numbers)
+        values = [str(x) for x in values]
+        joined = SEPARATOR.join(values)
+    if joined.count(SEPARATOR) == max(len(values)-1, 0):
+        normalised = normalise_text(joined, strip_hyphens).split(SEPARATOR) if len(values) else []
+    else:
+        normalised = [normalise_text(x, strip_hyphens) for x in values]
+    if exceptions:
+        normalised = [exceptions.get(x, x) for x in normalised]
+    normalised_words = pd.Series(None, index=words.index, dtype=object)
+    normalised_words[present] = normalised
+    return normalised_words
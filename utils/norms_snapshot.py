@@ -0,0 +1,211 @@
+"""
+Compact binary snapshots of the norms tables (aoa_estimates_complete.csv,
+MultiPic_with_frequencies.csv, external norms) that are memory-mapped instead
+of being parsed.
+
+Layout of a snapshot file:
+    magic | column blocks ... | header (json) | header length (uint64) | magic
+Every block starts at a multiple of 64 bytes. Numeric columns are stored as one
+fixed-width array each (their own dtype, little endian). String columns are
+stored as a string table: offsets (int64, rows+1), a missing-value mask (uint8)
+and a blob of all UTF-8 encoded strings; string i is blob[offsets[i]:offsets[i+1]].
+
+`open_snapshot` maps the file read-only and returns NumPy views into it, so
+nothing is parsed or copied when a snapshot is opened, and all processes that
+open the same file on one host share one copy in the page cache. Strings are
+only decoded when asked for (`get_column`, `to_dataframe`).
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import norms_snapshot
+    snapshot = norms_snapshot.open_snapshot('../data/snapshots/aoa_estimates_complete.snap')
+    estimates = snapshot['arrays']['estimate_mean']      # numpy view, no copy
+    names = norms_snapshot.get_column(snapshot, 'item')  # decoded strings
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'AOASNAP1'
+ALIGNMENT = 64
+
+
+def padding(position):
+    """
+    Returns the number of bytes up to the next block start.
+    Input:
+        position: current position in the file
+    Output:
+        n_bytes: number of padding bytes
+    """
+    return -position % ALIGNMENT
+
+
+def encode_column(column):
+    """
+    Turns a column into the arrays that are written to the snapshot.
+    Input:
+        column: pandas Series
+    Output:
+        kind: 'numeric' or 'string'
+        arrays: dict of numpy arrays (values; or offsets, missing, blob)
+    """
+    if pd.api.types.is_bool_dtype(column) and not column.isna().any():
+        return 'numeric', {'values': column.to_numpy(dtype=bool)}
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        if pd.api.types.is_extension_array_dtype(column):
+            # nullable integers are stored as float with NaN
+            return 'numeric', {'values': column.to_numpy(dtype=float, na_value=np.nan)}
+        return 'numeric', {'values': column.to_numpy().astype(column.dtype.newbyteorder('<'))}
+    missing = column.isna().to_numpy()
+    encoded = [b'' if x else str(y).encode('utf-8') for x, y in zip(missing, column.to_numpy())]
+    offsets = np.zeros(len(encoded)+1, dtype='<i8')
+    np.cumsum(np.fromiter((len(x) for x in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return 'string', {'offsets': offsets, 'missing': missing.astype(np.uint8), 'blob': blob}
+
+
+def write_snapshot(df, path, metadata=None):
+    """
+    Writes a dataframe as snapshot.
+    Input:
+        df: dataframe (numeric columns stay fixed-width, all others are stored as strings)
+        path: path of the snapshot file
+        metadata: optional json-serialisable dict stored in the header (e.g. versions of the source)
+    Output:
+        --
+    """
+    header = {'version': 1, 'n_rows': len(df), 'columns': [], 'metadata': metadata or dict()}
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for name in df.columns:
+            kind, arrays = encode_column(df[name])
+            column_info = {'name': str(name), 'kind': kind}
+            for part, array in arrays.items():
+                f.write(b'\0' * padding(f.tell()))
+                column_info[part] = {'offset': f.tell(), 'dtype': array.dtype.str, 'length': len(array)}
+                f.write(array.tobytes())
+            header['columns'].append(column_info)
+        header_bytes = json.dumps(header).encode('utf-8')
+        f.write(header_bytes)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(MAGIC)
+
+
+def open_snapshot(path):
+    """
+    Maps a snapshot into memory (read-only).
+    Input:
+        path: path of the snapshot file
+    Output:
+        snapshot: dict with
+            n_rows: number of rows
+            columns: column names (in order)
+            metadata: dict given to `write_snapshot`
+            arrays: {column: numpy view} of the numeric columns
+            strings: {column: dict of offsets, missing and blob views} of the string columns
+    """
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    if len(mapped) < 2*len(MAGIC)+8 or mapped[:len(MAGIC)].tobytes() != MAGIC or mapped[-len(MAGIC):].tobytes() != MAGIC:
+        raise ValueError(f'{path} is not a norms snapshot.')
+    header_end = len(mapped) - len(MAGIC) - 8
+    header_length = int(mapped[header_end:header_end+8].view('<u8')[0])
+    header = json.loads(mapped[header_end-header_length:header_end].tobytes())
+    if header['version'] != 1:
+        raise ValueError(f'{path} was written by an incompatible version, please export it anew.')
+
+    def view(part):
+        dtype = np.dtype(part['dtype'])
+        return mapped[part['offset']:part['offset']+part['length']*dtype.itemsize].view(dtype)
+
+    snapshot = {'path': path, 'n_rows': header['n_rows'], 'columns': [], 'metadata': header.get('metadata', dict()),
+                'arrays': dict(), 'strings': dict()}
+    for column_info in header['columns']:
+        snapshot['columns'].append(column_info['name'])
+        if column_info['kind'] == 'numeric':
+            snapshot['arrays'][column_info['name']] = view(column_info['values'])
+        else:
+            snapshot['strings'][column_info['name']] = {x: view(column_info[x]) for x in ['offsets', 'missing', 'blob']}
+    return snapshot
+
+
+def get_column(snapshot, name, positions=None):
+    """
+    Returns a column of a snapshot; strings are decoded.
+    Input:
+        snapshot: see `open_snapshot`
+        name: column name
+        positions: rows to return (default: all)
+    Output:
+        column: numpy view (numeric columns without positions), numpy array or
+                object array of strings (None for missing values)
+    """
+    if name in snapshot['arrays']:
+        values = snapshot['arrays'][name]
+        return values if positions is None else values[positions]
+    table = snapshot['strings'][name]
+    positions = np.arange(snapshot['n_rows']) if positions is None else np.asarray(positions, dtype=np.int64)
+    starts, ends = table['offsets'][positions], table['offsets'][positions+1]
+    missing = table['missing'][positions].astype(bool)
+    # only the requested strings are copied out of the mapped blob
+    # (memoryviews are sliced without creating numpy objects)
+    blob = memoryview(table['blob'])
+    return np.array([None if x else str(blob[y:z], 'utf-8') for x, y, z in zip(missing, starts.tolist(), ends.tolist())], dtype=object)
+
+
+def search_sorted(snapshot, name, values):
+    """
+    Finds values in a string column that is sorted (by code point, as Python and
+    pandas sort strings), with a binary search in the mapped file; nothing else
+    of the column is decoded.
+    Input:
+        snapshot: see `open_snapshot`
+        name: name of a sorted string column without missing values
+        values: strings to find
+    Output:
+        positions: array of rows (-1 for values that are not in the column)
+    """
+    table = snapshot['strings'][name]
+    # memoryviews of the mapped arrays are indexed without creating numpy objects
+    offsets, blob = memoryview(table['offsets']), memoryview(table['blob'])
+    positions = np.full(len(values), -1, dtype=np.int64)
+    for i, value in enumerate(values):
+        # UTF-8 preserves the order of code points, so the bytes can be compared
+        encoded = str(value).encode('utf-8')
+        low, high = 0, snapshot['n_rows']
+        while low < high:
+            middle = (low + high) // 2
+            if blob[offsets[middle]:offsets[middle+1]].tobytes() < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < snapshot['n_rows'] and blob[offsets[low]:offsets[low+1]].tobytes() == encoded:
+            positions[i] = low
+    return positions
+
+
+def to_dataframe(snapshot, columns=None):
+    """
+    Creates a dataframe from a snapshot (numeric columns are copied out of the mapped file).
+    Input:
+        snapshot: see `open_snapshot`
+        columns: columns to include (default: all)
+    Output:
+        df: dataframe
+    """
+    return pd.DataFrame({x: np.array(get_column(snapshot, x)) for x in columns or snapshot['columns']})
+
+
+def read_snapshot(path, columns=None):
+    """
+    Reads a snapshot as dataframe (see `to_dataframe`).
+    Input:
+        path: path of the snapshot file
+        columns: columns to include (default: all)
+    Output:
+        df: dataframe
+    """
+    return to_dataframe(open_snapshot(path), columns)
@@ -0,0 +1,147 @@
+"""
+Shared loader for spreadsheet files (ODS/XLS/XLSX).
+
+Parsing spreadsheets (especially ODS files with the odf engine) is slow, and
+several scripts read the same files, e.g. `study_setup/data/example_sentences.ods`.
+`read_spreadsheet` parses every sheet only once and stores it in a columnar
+cache next to the source file (Feather if pyarrow is installed, pickle otherwise).
+Later reads are served from the cache.
+
+A cache entry is keyed by the path and SHA-256 hash of the source file, the sheet
+and the read options. The modification time and size of the source file are
+recorded so the file only has to be hashed again once it was touched. Once the
+source file changed, the entries of its previous version are removed.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    from spreadsheet_cache import read_spreadsheet
+    df = read_spreadsheet('../data/example_sentences.ods', sheet_name='MultiPic')
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+CACHE_DIRECTORY = '.spreadsheet_cache'
+
+
+def get_source_prefix(path):
+    """
+    Returns the prefix of the cache files of a source file (files of the same
+    name in different directories do not share their cache files).
+    Input:
+        path: path to the source file
+    Output:
+        prefix: file name stem and hash of the absolute path
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f'{stem}_{hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]}'
+
+
+def get_file_hash(path, cache_dir):
+    """
+    Returns the SHA-256 hash of a file, reusing the recorded hash as long as
+    modification time and size of the file are unchanged.
+    Input:
+        path: path to the source file
+        cache_dir: cache directory holding the recorded file stamps
+    Output:
+        file_hash: hex string
+    """
+    stat = os.stat(path)
+    stamp = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    stamp_path = os.path.join(cache_dir, get_source_prefix(path)+'.json')
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            recorded = json.load(f)
+        if recorded['mtime_ns'] == stamp['mtime_ns'] and recorded['size'] == stamp['size']:
+            return recorded['sha256']
+    with open(path, 'rb') as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    stamp['sha256'] = file_hash
+    tmp_path = f'{stamp_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(stamp, f)
+    os.replace(tmp_path, stamp_path)
+    return file_hash
+
+
+def get_cache_path(path, sheet_name, read_kwargs, cache_dir):
+    """
+    Determines where a sheet is cached.
+    Input:
+        path: path to the source file
+        sheet_name: name or position of the sheet
+        read_kwargs: further options passed on to pd.read_excel
+        cache_dir: cache directory
+    Output:
+        cache_path: path of the cache file
+    """
+    file_hash = get_file_hash(path, cache_dir)
+    key = hashlib.sha256(repr((file_hash, sheet_name, sorted(read_kwargs.items()))).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{get_source_prefix(path)}_{file_hash[:16]}_{sheet_name}_{key}.{CACHE_FORMAT}')
+
+
+def remove_outdated(path, cache_path, cache_dir):
+    """
+    Removes the cache files of previous versions of a source file.
+    Input:
+        path: path to the source file
+        cache_path: cache file of the current version (see `get_cache_path`)
+        cache_dir: cache directory
+    Output:
+        --
+    """
+    prefix = get_source_prefix(path)
+    # cache files of the current version start with the same prefix and file hash
+    current = os.path.basename(cache_path)[:len(prefix)+18]
+    for old_path in glob.glob(os.path.join(glob.escape(cache_dir), f'{glob.escape(prefix)}_*.{CACHE_FORMAT}')):
+        if not os.path.basename(old_path).startswith(current):
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                # removed by a parallel reader
+                pass
+
+
+def read_spreadsheet(path, sheet_name=0, cache_dir=None, **read_kwargs):
+    """
+    Reads one sheet of a spreadsheet file, from the cache if possible.
+    Input:
+        path: path to the ODS/XLS/XLSX file
+        sheet_name: name or position of the sheet (as in pd.read_excel)
+        cache_dir: cache directory (default: .spreadsheet_cache next to the source file)
+        read_kwargs: further options passed on to pd.read_excel (e.g. usecols, skiprows)
+    Output:
+        df: dataframe of the sheet
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRECTORY)
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = get_cache_path(path, sheet_name, read_kwargs, cache_dir)
+
+    if os.path.exists(cache_path):
+        if CACHE_FORMAT == 'feather':
+            return pd.read_feather(cache_path)
+        return pd.read_pickle(cache_path)
+
+    df = pd.read_excel(path, sheet_name=sheet_name, **read_kwargs)
+    # write to a temporary file first so that parallel readers never see half a file
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    if CACHE_FORMAT == 'feather':
+        df.reset_index(drop=True).to_feather(tmp_path)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    remove_outdated(path, cache_path, cache_dir)
+    return df
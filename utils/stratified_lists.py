@@ -0,0 +1,99 @@
+"""
+Stratified assignment of items to lists (e.g. the MultiPic items to the
+control items and lists A, B and C of the questionnaire).
+
+Within every stratum (combination of the values of the stratification columns,
+e.g. the frequency bin), the items are shuffled; the first n_controls become
+control items (shared across lists), the remaining ones are divided equally
+among the lists. Items that cannot be divided equally within a stratum
+(leftovers) are dealt to the lists in turn, continuing across strata, so the
+lists end up with the same length (give or take one item). Strata are visited
+in sorted order, with missing values (e.g. items without frequency) last.
+
+All items are assigned at once: one random number per item (numpy.random.Generator)
+and one lexsort order the items within their strata, and the list of every
+item follows from its rank within the stratum, so tens of thousands of items
+take milliseconds.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    from stratified_lists import assign_lists
+    df['list'] = assign_lists(df, ['A', 'B', 'C'], strata=['freq bins'], n_controls=3, n_controls_missing=1, seed=43)
+"""
+
+import numpy as np
+import pandas as pd
+
+# label of the control items
+CONTROL = 'control'
+
+
+def get_strata(df, strata):
+    """
+    Numbers the strata of the items.
+    Input:
+        df: dataframe of items
+        strata: list of stratification columns (empty: all items form one stratum)
+    Output:
+        codes: stratum of every item (0, 1, ... in sorted order, strata with missing values last)
+        missing: bool array, True for the strata with a missing value
+    """
+    if not strata:
+        return np.zeros(len(df), dtype=np.int64), np.zeros(1 if len(df) else 0, dtype=bool)
+    codes = df.groupby(strata, dropna=False, sort=True).ngroup().to_numpy(dtype=np.int64)
+    n_strata = codes.max()+1 if len(codes) else 0
+    missing = np.zeros(n_strata, dtype=bool)
+    missing[codes[df[strata].isna().any(axis=1).to_numpy()]] = True
+    # strata with missing values last (with several columns, groupby only sorts them last within a column)
+    order = np.lexsort((np.arange(n_strata), missing))
+    new_codes = np.empty(n_strata, dtype=np.int64)
+    new_codes[order] = np.arange(n_strata)
+    return new_codes[codes], missing[order]
+
+
+def assign_lists(df, lists, strata=None, n_controls=0, n_controls_missing=None, seed=None):
+    """
+    Assigns every item to one of the lists or to the control items, stratified.
+    Input:
+        df: dataframe of items
+        lists: list of list names (e.g. ['A', 'B', 'C'])
+        strata: list of stratification columns (default: none)
+        n_controls: number of control items drawn from every stratum
+        n_controls_missing: number of control items drawn from strata with a missing
+                            value (default: n_controls)
+        seed: seed of the random generator (or a numpy.random.Generator)
+    Output:
+        assignment: pandas Series (index of df) with the list name of every item (CONTROL for control items)
+    """
+    if n_controls_missing is None:
+        n_controls_missing = n_controls
+    rng = np.random.default_rng(seed)
+    codes, missing = get_strata(df, strata or [])
+    n_lists = len(lists)
+
+    # shuffle the items within their strata
+    order = np.lexsort((rng.random(len(df)), codes))
+    sorted_codes = codes[order]
+    sizes = np.bincount(codes, minlength=len(missing))
+    starts = np.cumsum(sizes) - sizes
+    ranks = np.arange(len(df)) - starts[sorted_codes]
+
+    # the first items of every stratum are control items, the others are divided equally
+    controls = np.minimum(np.where(missing, n_controls_missing, n_controls), sizes)
+    remaining = sizes - controls
+    per_list = remaining // n_lists
+    leftovers = remaining - per_list*n_lists
+    # leftovers are dealt in turn, the next stratum continues where the previous one stopped
+    first_leftover_list = (np.cumsum(leftovers) - leftovers) % n_lists
+
+    positions = ranks - controls[sorted_codes]
+    leftover_positions = positions - (per_list*n_lists)[sorted_codes]
+    sorted_lists = np.where(leftover_positions >= 0, (first_leftover_list[sorted_codes] + leftover_positions) % n_lists,
+                            positions // np.maximum(per_list, 1)[sorted_codes])
+    sorted_lists = np.where(positions < 0, n_lists, sorted_lists)
+    labels = np.append(np.asarray(lists, dtype=object), CONTROL)
+
+    assignment = np.empty(len(df), dtype=object)
+    assignment[order] = labels[sorted_lists]
+    return pd.Series(assignment, index=df.index)
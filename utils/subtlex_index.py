@@ -0,0 +1,221 @@
+"""
+Prebuilt index of SUBTLEX-DE (`SUBTLEX-DE_cleaned_with_Google00.txt`) for
+attaching word frequencies to MultiPic names and other word lists.
+
+Parsing the large latin-1 text file and grouping its words into orthographic
+variants takes seconds and used to be done anew by every script. The index
+holds one row per normalised token (lowercase, umlauts and ß folded as in
+`remove_umlauts`, '-' removed, see `normalisation.py`):
+- key: normalised token
+- Word: chosen variant (see `choose_variants`)
+- variants: all variants of the token, separated by '|' (in the order of the choice)
+- SUBTLEX, lgSUBTLEX, Google00pm, lgGoogle00: frequencies of the chosen variant
+It is saved as norms snapshot (see `norms_snapshot.py`, by default next to the
+text file as `<name>_index.snap`) with the index version and the size and
+modification time of the text file in its metadata. `get_index` maps the saved
+index and only rebuilds it if it is missing, was built by another version, or
+the text file changed since. As the rows are sorted by key, the tokens of a word
+list are found with a binary search in the mapped file (see
+`norms_snapshot.search_sorted`), so nothing has to be parsed or decoded.
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import subtlex_index
+    index = subtlex_index.get_index('../../external_resources/frequencies/SUBTLEX-DE_cleaned_with_Google00.txt')
+    df = subtlex_index.attach_frequencies(df, 'NAME1', index)
+
+Prebuild the index in terminal with: $ python3 subtlex_index.py [--source <path>] [--output <path>]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import norms_snapshot
+from normalisation import normalise_words
+
+INDEX_VERSION = 1
+# frequency columns taken from SUBTLEX-DE
+FREQUENCY_COLUMNS = ['SUBTLEX', 'lgSUBTLEX', 'Google00pm', 'lgGoogle00']
+# columns of SUBTLEX-DE needed for the index
+SOURCE_COLUMNS = ['Word', 'WFfreqcount', 'spell-check OK (1/0)'] + FREQUENCY_COLUMNS
+VARIANT_SEPARATOR = '|'
+
+
+def normalise_tokens(tokens):
+    """
+    Makes tokens of SUBTLEX-DE and other word lists comparable: lowercases them,
+    removes umlauts and ß (as `remove_umlauts`) and removes '-' (concerns e.g. u-boot and t-shirt).
+    Input:
+        tokens: array-like of strings
+    Output:
+        keys: pandas Series of normalised strings
+    """
+    return normalise_words(tokens, strip_hyphens=True)
+
+
+def read_subtlex(path):
+    """
+    Reads the columns of SUBTLEX-DE needed for the index.
+    Input:
+        path: path of SUBTLEX-DE_cleaned_with_Google00.txt
+    Output:
+        subtlex_df: dataframe with SOURCE_COLUMNS
+    """
+    return pd.read_csv(path, sep='\t', decimal=',', encoding='latin_1', usecols=SOURCE_COLUMNS)
+
+
+def choose_variants(subtlex_df):
+    """
+    Orders the orthographic variants of every normalised token (e.g. 'Maus' and
+    'maus'), so the first one is picked: the variant with correct spelling
+    (spell-check OK (1/0) = 1); among several (in)correctly spelled ones the most
+    frequent (WFfreqcount), and then the alphabetically first.
+    Input:
+        subtlex_df: SUBTLEX-DE dataframe
+    Output:
+        variants_df: subtlex_df with key column, sorted by key and choice of the variant
+
+    >>> subtlex_df = pd.DataFrame({'Word': ['maus', 'Maus', 'Haus', 'Mäuse', 'mäuse'],
+    ...                            'WFfreqcount': [3, 250, 900, 7, 2], 'spell-check OK (1/0)': [0, 1, 1, 0, 0]})
+    >>> choose_variants(subtlex_df)['Word'].tolist()
+    ['Haus', 'Mäuse', 'mäuse', 'Maus', 'maus']
+    """
+    variants_df = subtlex_df.assign(key=normalise_tokens(subtlex_df['Word']).to_numpy()).dropna(subset=['key'])
+    return variants_df.sort_values(['key', 'spell-check OK (1/0)', 'WFfreqcount', 'Word'], ascending=[True, False, False, True])
+
+
+def build_index(subtlex_df):
+    """
+    Builds the index with one row per normalised token.
+    Input:
+        subtlex_df: SUBTLEX-DE dataframe (see `read_subtlex`)
+    Output:
+        index_df: dataframe with key, Word, variants and FREQUENCY_COLUMNS (sorted by key)
+    """
+    variants_df = choose_variants(subtlex_df)
+    # the variants of a key are consecutive rows, the first one is chosen
+    first = (variants_df['key'] != variants_df['key'].shift()).to_numpy()
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(variants_df))
+    words = variants_df['Word'].astype(str).tolist()
+    index_df = variants_df[first][['key', 'Word'] + FREQUENCY_COLUMNS].reset_index(drop=True)
+    index_df.insert(2, 'variants', [VARIANT_SEPARATOR.join(words[x:y]) for x, y in zip(starts, ends)])
+    return index_df
+
+
+def get_source_stamp(source_path):
+    """
+    Returns the version of the index and the size and modification time of the text file.
+    Input:
+        source_path: path of the SUBTLEX-DE text file
+    Output:
+        stamp: dict with index_version, source_size, source_mtime_ns
+    """
+    stat = os.stat(source_path)
+    return {'index_version': INDEX_VERSION, 'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def get_index_path(source_path):
+    """
+    Returns the default path of the index (next to the text file).
+    Input:
+        source_path: path of the SUBTLEX-DE text file
+    Output:
+        index_path: path of the index (<name>_index.snap)
+    """
+    return os.path.splitext(source_path)[0] + '_index.snap'
+
+
+def save_index(index_df, index_path, source_path):
+    """
+    Saves the index as norms snapshot (via a temporary file, so readers never see half an index).
+    Input:
+        index_df: see `build_index`
+        index_path: path of the index
+        source_path: path of the SUBTLEX-DE text file the index was built from
+    Output:
+        --
+    """
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    norms_snapshot.write_snapshot(index_df, tmp_path, metadata=get_source_stamp(source_path))
+    os.replace(tmp_path, index_path)
+
+
+def get_index(source_path, index_path=None):
+    """
+    Maps the index, (re)building and saving it first if it is missing or outdated.
+    If the text file is missing, a saved index of the current version is used as it is.
+    Input:
+        source_path: path of the SUBTLEX-DE text file
+        index_path: path of the index (default: next to the text file, see `get_index_path`)
+    Output:
+        index: mapped snapshot of the index (see `norms_snapshot.open_snapshot`;
+               `norms_snapshot.to_dataframe` gives the dataframe of `build_index`)
+    """
+    index_path = index_path or get_index_path(source_path)
+    if os.path.exists(index_path):
+        index = norms_snapshot.open_snapshot(index_path)
+        metadata = index['metadata']
+        if metadata.get('index_version') == INDEX_VERSION and (not os.path.exists(source_path) or metadata == get_source_stamp(source_path)):
+            return index
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f'Neither {source_path} nor a current index of it ({index_path}) could be found.')
+    save_index(build_index(read_subtlex(source_path)), index_path, source_path)
+    return norms_snapshot.open_snapshot(index_path)
+
+
+def find_tokens(index, tokens):
+    """
+    Finds the rows of many tokens in the index.
+    Input:
+        index: see `get_index`
+        tokens: array-like of strings (normalised here)
+    Output:
+        positions: array of rows (-1 for tokens that are not in SUBTLEX-DE)
+    """
+    keys = normalise_tokens(tokens)
+    positions = np.full(len(keys), -1, dtype=np.int64)
+    present = keys.notna().to_numpy()
+    # every key is only searched once
+    unique_keys, key_codes = np.unique(keys[present].to_numpy(dtype=str), return_inverse=True)
+    positions[present] = norms_snapshot.search_sorted(index, 'key', unique_keys)[key_codes]
+    return positions
+
+
+def attach_frequencies(df, column, index):
+    """
+    Adds the SUBTLEX-DE frequencies of the chosen variant to every row, matched
+    on the normalised token. Rows whose token is not in SUBTLEX-DE get missing
+    frequencies.
+    Input:
+        df: dataframe
+        column: column with the tokens (e.g. NAME1)
+        index: see `get_index`
+    Output:
+        frequencies_df: copy of df with FREQUENCY_COLUMNS
+    """
+    positions = find_tokens(index, df[column])
+    found = positions >= 0
+    frequencies_df = df.copy()
+    for frequency_column in FREQUENCY_COLUMNS:
+        frequencies = np.full(len(df), np.nan)
+        frequencies[found] = index['arrays'][frequency_column][positions[found]]
+        frequencies_df[frequency_column] = frequencies
+    return frequencies_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the index of SUBTLEX-DE.')
+    parser.add_argument('--source', default='../external_resources/frequencies/SUBTLEX-DE_cleaned_with_Google00.txt',
+                        help='SUBTLEX-DE text file (default: ../external_resources/frequencies/SUBTLEX-DE_cleaned_with_Google00.txt)')
+    parser.add_argument('--output', help='path of the index (default: <source>_index.snap)')
+    args = parser.parse_args()
+
+    index_path = args.output or get_index_path(args.source)
+    index_df = build_index(read_subtlex(args.source))
+    save_index(index_df, index_path, args.source)
+    print(f'Saved index of {len(index_df)} tokens to {index_path}.')
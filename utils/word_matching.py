@@ -0,0 +1,262 @@
+"""
+Approximate matching of words against a vocabulary (e.g. MultiPic names
+against the SUBTLEX-DE types or the Birchenough/Schröder norms).
+
+The index uses symmetric deletion (as SymSpell): every vocabulary word is
+stored under all strings that arise from deleting up to max_distance of the
+first PREFIX_LENGTH characters, combined with the length of the word. Two
+words within edit distance d share such a deletion string, so a query only has
+to generate its own deletions and look them up (for all word lengths within d
+of its own), instead of being compared with the whole vocabulary. The deletion
+strings are kept as sorted 64-bit hashes in a numpy array and the lookups of a
+whole batch of queries are one np.searchsorted call. The candidates are then
+verified with the exact Levenshtein distance, calculated for all candidate
+pairs at once (one banded DP row per character, see `edit_distances`).
+
+Words are normalised as in `remove_umlauts` before matching (see `normalisation.py`).
+
+Usage:
+    import sys
+    sys.path.append('../../utils')
+    import word_matching
+    index = word_matching.build_index(subtlex_df['Word'], weights=subtlex_df['WFfreqcount'])
+    matches_df = word_matching.match_words(index, multipic_df['NAME1'], max_distance=1)
+"""
+
+import numpy as np
+import pandas as pd
+
+from normalisation import normalise_words
+
+MAX_DISTANCE = 2
+# only deletions within the first characters are indexed (keeps the index small)
+PREFIX_LENGTH = 7
+# candidate pairs whose edit distance is calculated at once
+CHUNK_PAIRS = 200000
+# queries whose candidates are collected at once (bounds the memory)
+CHUNK_QUERIES = 5000
+
+
+def get_deletes(word, max_distance, prefix_length=PREFIX_LENGTH):
+    """
+    Returns all strings that arise from deleting up to max_distance characters of the word's prefix.
+    Input:
+        word: string
+        max_distance: highest number of deletions
+        prefix_length: number of characters the deletions are applied to
+    Output:
+        deletes: set of strings (including the prefix itself)
+    """
+    deletes = {word[:prefix_length]}
+    current = deletes
+    for _ in range(max_distance):
+        current = {x[:i]+x[i+1:] for x in current for i in range(len(x))}
+        deletes |= current
+    return deletes
+
+
+def hash_deletes(words, max_distance, prefix_length=PREFIX_LENGTH):
+    """
+    Hashes the deletion strings of many words.
+    Input:
+        words: list of strings
+        max_distance: highest number of deletions
+        prefix_length: number of characters the deletions are applied to
+    Output:
+        hashes: int64 array of hashes
+        positions: position in words of every hash
+    """
+    hashes, positions = [], []
+    for position, word in enumerate(words):
+        deletes = get_deletes(word, max_distance, prefix_length)
+        hashes.extend(hash(x) for x in deletes)
+        positions.extend([position] * len(deletes))
+    return np.array(hashes, dtype=np.int64), np.array(positions, dtype=np.int64)
+
+
+def combine_keys(hashes, lengths):
+    """
+    Combines the hashes of deletion strings with the length of the full word,
+    so short deletion strings do not match words of very different lengths.
+    Input:
+        hashes: int64 array of hashes
+        lengths: int64 array of word lengths
+    Output:
+        keys: int64 array
+    """
+    # integer overflow wraps around, which is fine for hashing
+    with np.errstate(over='ignore'):
+        return hashes * np.int64(1000003) ^ lengths
+
+
+def to_codes(words):
+    """
+    Turns words into a padded array of unicode code points.
+    Input:
+        words: array of strings
+    Output:
+        codes: words x longest word int32 array (0 after the end of a word)
+    """
+    words = np.asarray(words, dtype=str)
+    width = max(words.dtype.itemsize // 4, 1)
+    return words.astype(f'U{width}').view(np.int32).reshape(len(words), width)
+
+
+def edit_distances(words_a, words_b, max_distance):
+    """
+    Calculates the Levenshtein distance of many pairs of words at once, up to max_distance.
+    The DP matrix is filled one row (character of a) at a time for all pairs;
+    only the band of cells within max_distance of the diagonal is kept, as all
+    other cells exceed max_distance anyway.
+    Input:
+        words_a, words_b: arrays of strings of the same length (lengths may differ by up to max_distance)
+        max_distance: highest distance of interest
+    Output:
+        distances: int array with one distance per pair (max_distance+1 for all larger distances)
+    """
+    codes_a, codes_b = to_codes(words_a), to_codes(words_b)
+    lengths_a, lengths_b = (codes_a != 0).sum(axis=1), (codes_b != 0).sum(axis=1)
+    too_far = max_distance + 1
+    # band[:, k] holds the cell of the current row with column = row + k - max_distance
+    band = np.full((len(codes_a), 2*max_distance+1), too_far, dtype=np.int32)
+    band[:, max_distance:] = np.arange(max_distance+1)
+    for i in range(1, codes_a.shape[1]+1):
+        new_band = np.full_like(band, too_far)
+        for k in range(band.shape[1]):
+            j = i + k - max_distance
+            if j < 0:
+                continue
+            if j == 0:
+                new_band[:, k] = min(i, too_far)
+                continue
+            if j <= codes_b.shape[1]:
+                cost = codes_a[:, i-1] != codes_b[:, j-1]
+            else:
+                cost = 1
+            # substitution/match, deletion (cell above), insertion (cell to the left)
+            cell = band[:, k] + cost
+            if k+1 < band.shape[1]:
+                cell = np.minimum(cell, band[:, k+1]+1)
+            if k > 0:
+                cell = np.minimum(cell, new_band[:, k-1]+1)
+            new_band[:, k] = np.minimum(cell, too_far)
+        # pairs whose first word ended keep their last row
+        band = np.where((i <= lengths_a)[:, None], new_band, band)
+    return band[np.arange(len(codes_a)), lengths_b-lengths_a+max_distance]
+
+
+def build_index(words, max_distance=MAX_DISTANCE, weights=None, prefix_length=PREFIX_LENGTH):
+    """
+    Builds the approximate-match index of a vocabulary.
+    Input:
+        words: array-like of vocabulary words (normalised here; duplicates are merged)
+        max_distance: highest edit distance that can be queried
+        weights: optional array-like of the same length (e.g. frequencies) to rank
+                 candidates with the same distance; the highest weight of duplicates is kept
+        prefix_length: number of characters the deletions are applied to
+    Output:
+        index: dict with words, lengths, weights, keys (sorted hashes), word_ids, max_distance, prefix_length
+    """
+    vocabulary_df = pd.DataFrame({'word': normalise_words(words).to_numpy(),
+                                  'weight': np.zeros(len(words)) if weights is None else np.asarray(weights, dtype=float)})
+    vocabulary_df = vocabulary_df.dropna(subset=['word']).groupby('word', sort=True)['weight'].max().reset_index()
+    hashes, word_ids = hash_deletes(vocabulary_df['word'].tolist(), max_distance, prefix_length)
+    word_lengths = vocabulary_df['word'].str.len().to_numpy(dtype=np.int64)
+    keys = combine_keys(hashes, word_lengths[word_ids])
+    order = np.argsort(keys, kind='stable')
+    return {
+        'words': vocabulary_df['word'].to_numpy(dtype=object),
+        'lengths': word_lengths,
+        'weights': vocabulary_df['weight'].to_numpy(),
+        'keys': keys[order],
+        'word_ids': word_ids[order],
+        'max_distance': max_distance,
+        'prefix_length': prefix_length,
+    }
+
+
+def find_candidates(index, queries, max_distance):
+    """
+    Finds all vocabulary words that share a deletion string with a query.
+    Input:
+        index: see `build_index`
+        queries: list of normalised query words (unique)
+        max_distance: highest edit distance
+    Output:
+        query_ids, word_ids: arrays of candidate pairs (unique)
+    """
+    hashes, query_ids = hash_deletes(queries, max_distance, index['prefix_length'])
+    # words can only match if their lengths differ by at most max_distance
+    query_lengths = np.array([len(x) for x in queries], dtype=np.int64)[query_ids]
+    length_offsets = np.arange(-max_distance, max_distance+1)
+    keys = combine_keys(np.repeat(hashes, len(length_offsets)), np.repeat(query_lengths, len(length_offsets)) + np.tile(length_offsets, len(hashes)))
+    query_ids = np.repeat(query_ids, len(length_offsets))
+    starts = np.searchsorted(index['keys'], keys, side='left')
+    ends = np.searchsorted(index['keys'], keys, side='right')
+    n_found = ends - starts
+    # expand every matched key range into single pairs
+    pair_query_ids = np.repeat(query_ids, n_found)
+    offsets = np.arange(n_found.sum()) - np.repeat(np.cumsum(n_found)-n_found, n_found)
+    pair_word_ids = index['word_ids'][np.repeat(starts, n_found) + offsets]
+    pairs = np.unique(pair_query_ids*len(index['words']) + pair_word_ids)
+    return pairs // len(index['words']), pairs % len(index['words'])
+
+
+def rank_candidates(index, query_words, max_distance, max_candidates):
+    """
+    Verifies and ranks the candidates of a chunk of queries.
+    Input:
+        index: see `build_index`
+        query_words: array of normalised query words (unique)
+        max_distance: highest edit distance
+        max_candidates: number of candidates kept per query (None for all)
+    Output:
+        candidates_df: dataframe with columns query_id (position in query_words), match, distance, rank
+    """
+    query_ids, word_ids = find_candidates(index, list(query_words), max_distance)
+    query_lengths = np.fromiter((len(x) for x in query_words), dtype=np.int64, count=len(query_words))
+    # distances of similar lengths are calculated together, so padding stays short
+    order = np.argsort(query_lengths[query_ids] + index['lengths'][word_ids], kind='stable')
+    query_ids, word_ids = query_ids[order], word_ids[order]
+    distances = np.concatenate([edit_distances(query_words[query_ids[x:x+CHUNK_PAIRS]], index['words'][word_ids[x:x+CHUNK_PAIRS]], max_distance)
+                                for x in range(0, len(query_ids), CHUNK_PAIRS)] + [np.zeros(0, dtype=np.int64)])
+    close = distances <= max_distance
+    candidates_df = pd.DataFrame({'query_id': query_ids[close], 'match': index['words'][word_ids[close]], 'distance': distances[close],
+                                  'weight': index['weights'][word_ids[close]]})
+    candidates_df = candidates_df.sort_values(['query_id', 'distance', 'weight', 'match'], ascending=[True, True, False, True])
+    candidates_df['rank'] = candidates_df.groupby('query_id').cumcount() + 1
+    if max_candidates is not None:
+        candidates_df = candidates_df[candidates_df['rank'] <= max_candidates]
+    return candidates_df.drop(columns='weight')
+
+
+def match_words(index, queries, max_distance=None, max_candidates=5):
+    """
+    Finds the vocabulary words within an edit distance of many query words.
+    Input:
+        index: see `build_index`
+        queries: array-like of query words (normalised here)
+        max_distance: highest edit distance (default and maximum: the one of the index)
+        max_candidates: number of candidates returned per query (None for all)
+    Output:
+        matches_df: dataframe with columns query (as given), match, distance and rank
+                    (1 = best: lowest distance, then highest weight, then alphabetical);
+                    queries without candidate do not appear
+    """
+    if max_distance is None:
+        max_distance = index['max_distance']
+    if max_distance > index['max_distance']:
+        raise ValueError(f'The index was built for edit distances up to {index["max_distance"]}.')
+    queries = pd.Series(queries, dtype=object)
+    query_codes, unique_queries = pd.factorize(normalise_words(queries))
+    unique_queries = np.asarray(unique_queries, dtype=object)
+    candidate_dfs = []
+    for start in range(0, len(unique_queries), CHUNK_QUERIES):
+        candidates_df = rank_candidates(index, unique_queries[start:start+CHUNK_QUERIES], max_distance, max_candidates)
+        candidates_df['query_id'] += start
+        candidate_dfs.append(candidates_df)
+    candidates_df = pd.concat(candidate_dfs) if candidate_dfs else pd.DataFrame(columns=['query_id', 'match', 'distance', 'rank'])
+    # back to the queries as given (also repeated ones)
+    queries_df = pd.DataFrame({'query': queries.to_numpy(), 'query_id': query_codes})
+    matches_df = queries_df.reset_index().merge(candidates_df, on='query_id').sort_values(['index', 'rank'])
+    return matches_df[['query', 'match', 'distance', 'rank']].reset_index(drop=True)